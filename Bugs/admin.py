@@ -1,3 +1,30 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.forms import UserChangeForm
+from django.contrib.auth.models import User
+
+from Bugs.serializers import EMAIL_TAKEN, users_with_email
+
 
 # Register your models here.
+class UniqueEmailUserChangeForm(UserChangeForm):
+    """
+        The unique_user_email constraint is unknown to the fields of auth.User, so the
+        form checks it rather than failing on the IntegrityError
+    """
+
+    def clean_email(self):
+        email = self.cleaned_data.get('email')
+        if email and users_with_email(email).exclude(pk=self.instance.pk).exists():
+            raise forms.ValidationError(EMAIL_TAKEN, code='unique')
+        return email
+
+
+class BugsUserAdmin(UserAdmin):
+    form = UniqueEmailUserChangeForm
+
+
+# importing django.contrib.auth.admin registered its UserAdmin
+admin.site.unregister(User)
+admin.site.register(User, BugsUserAdmin)
@@ -1,6 +1,34 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
 
 
 class BugsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Bugs'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from rest_framework.authtoken.models import Token
+
+        from Bugs import changes, counters, list_cache, search
+        from Bugs.models import Bug, Comment
+        from Utilities import authentication
+
+        post_migrate.connect(search.ensure_triggers, sender=self)
+        post_delete.connect(authentication.invalidate_token, sender=Token)
+        post_save.connect(authentication.invalidate_user_tokens, sender=get_user_model())
+        for model in (Bug, Comment):
+            post_save.connect(list_cache.bump_generation, sender=model)
+            post_delete.connect(list_cache.bump_generation, sender=model)
+        post_save.connect(list_cache.bump_user_generation, sender=get_user_model())
+        post_delete.connect(list_cache.bump_user_generation, sender=get_user_model())
+        pre_save.connect(counters.record_previous_state, sender=Bug)
+        post_save.connect(counters.update_counters, sender=Bug)
+        pre_delete.connect(counters.record_deleted_state, sender=Bug)
+        post_delete.connect(counters.remove_from_counters, sender=Bug)
+        pre_delete.connect(counters.release_user_counters, sender=get_user_model())
+        post_save.connect(changes.bug_saved, sender=Bug)
+        post_delete.connect(changes.bug_deleted, sender=Bug)
+        post_save.connect(changes.comment_saved, sender=Comment)
+        post_delete.connect(changes.comment_deleted, sender=Comment)
+        pre_delete.connect(changes.user_deleted, sender=get_user_model())
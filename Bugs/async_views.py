@@ -0,0 +1,50 @@
+"""
+    Async handlers of the bug read endpoints, routed by bug/asgi_urls.py when the project
+    is served over ASGI (bug/asgi.py).
+
+    Django 4.0 has no async ORM (QuerySet.aget() and friends arrive in Django 4.1), so a
+    read that needs the database still runs the BugAPI view in a thread, in a single
+    sync_to_async call that also renders the response. What these handlers keep off that
+    thread is the work that needs no database: a bug list page found in the list cache is
+    answered to a token found in the token cache without running the view at all. Writes
+    to the same URLs are handed to BugAPI unchanged.
+"""
+from asgiref.sync import sync_to_async
+
+from Bugs import list_cache, views
+from Utilities.authentication import CachedTokenAuthentication
+
+bug_list_view = views.BugAPI.as_view({'get': 'list', 'post': 'create'})
+bug_detail_view = views.BugAPI.as_view(
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'})
+bug_comments_view = views.BugAPI.as_view({'get': 'comments'})
+
+
+def run_view(view, request, **kwargs):
+    response = view(request, **kwargs)
+    # rendering here saves the handler another thread hop to render it
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+    return response
+
+
+async def bug_list(request):
+    if request.method == 'GET' and await CachedTokenAuthentication().authenticate_cached(request):
+        key, cached = await sync_to_async(list_cache.lookup, thread_sensitive=False)(request, count_miss=False)
+        if cached is not None:
+            return cached
+    return await sync_to_async(run_view)(bug_list_view, request)
+
+
+async def bug_detail(request, pk):
+    return await sync_to_async(run_view)(bug_detail_view, request, pk=pk)
+
+
+async def bug_comments(request, pk):
+    return await sync_to_async(run_view)(bug_comments_view, request, pk=pk)
+
+
+# the token is checked by BugAPI, django's csrf_exempt cannot wrap async views before 5.0
+for handler in (bug_list, bug_detail, bug_comments):
+    handler.csrf_exempt = True
+    handler.replica_reads = True
@@ -0,0 +1,212 @@
+"""
+    Bulk create/update of bugs.
+
+    Every item goes through the same serializers as the single-bug endpoints, but the
+    bugs, users and titles the items refer to are loaded up front with one query each and
+    handed to the serializers through their context, so validating a batch costs a fixed
+    number of queries. The valid items are then written with a single bulk_create or
+    bulk_update in one transaction, and every item gets its own result.
+
+    A title taken by a concurrent request after it was preloaded fails the write on the
+    unique_bug_title constraint: the items using a title taken by then are failed, and the
+    others written again. Should that happen twice in a row, the request answers 409.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from Bugs import counters, list_cache, serializers
+from Bugs.changes import record_bugs
+from Bugs.models import Bug, Change
+
+DUPLICATE_TITLE_ERROR = {"title": ["A bug with this title already exists"]}
+TITLE_MARKERS = serializers.BugSerializer.unique_errors[0][0]
+
+
+class BulkConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Other requests keep taking the titles of these bugs, try again"
+    default_code = 'bulk_conflict'
+
+
+def check_items(items):
+    if not isinstance(items, list) or not items or len(items) > settings.BULK_MAX_ITEMS:
+        raise ValidationError(detail={"non_field_errors": [f"Send a list of 1 to {settings.BULK_MAX_ITEMS} bugs"]})
+
+
+def to_pk(value):
+    try:
+        return int(value) if not isinstance(value, bool) else None
+    except (TypeError, ValueError):
+        return None
+
+
+def preload_context(items, **context):
+    """
+        This loads the assignees and the bugs currently owning the titles used by the items
+    """
+    items = [item for item in items if isinstance(item, dict)]
+    assignee_ids = {to_pk(item.get('assignee')) for item in items} - {None}
+    # blank titles are left out of the unique_bug_title constraint, any number of bugs can have one
+    titles = {str(item['title']).strip() for item in items if item.get('title') is not None} - {''}
+    context['users'] = User.objects.in_bulk(assignee_ids)
+    context['titles'] = dict(Bug.objects.filter(title__in=titles).values_list('title', 'id'))
+    return context
+
+
+def is_duplicate_title(validated_data, seen_titles):
+    """
+        This checks the title against the ones used by earlier items of the same request
+    """
+    title = validated_data.get('title')
+    if not title:
+        return False
+    if title in seen_titles:
+        return True
+    seen_titles.add(title)
+    return False
+
+
+def item_result(index, status_code, data=None, errors=None):
+    result = {"index": index, "status": status_code}
+    if errors is None:
+        result["data"] = data
+    else:
+        result["errors"] = errors
+    return result
+
+
+def results_status(results, success_status):
+    failures = sum(result["status"] >= 400 for result in results)
+    if not failures:
+        return success_status
+    return status.HTTP_400_BAD_REQUEST if failures == len(results) else status.HTTP_207_MULTI_STATUS
+
+
+def create_bugs(items, user):
+    """
+        This creates a bug for every valid item, assigned by the user
+    :return: the per-item results and the response status
+    """
+    check_items(items)
+    context = preload_context(items, assigner=user)
+    results, bugs, seen_titles = [], [], set()
+    for index, item in enumerate(items):
+        serializer = serializers.BugSerializer(data=item, context=context)
+        if not serializer.is_valid():
+            results.append(item_result(index, status.HTTP_400_BAD_REQUEST, errors=serializer.errors))
+        elif is_duplicate_title(serializer.validated_data, seen_titles):
+            results.append(item_result(index, status.HTTP_400_BAD_REQUEST, errors=DUPLICATE_TITLE_ERROR))
+        else:
+            bug = Bug(**serializer.validated_data)
+            bugs.append(bug)
+            results.append(item_result(index, status.HTTP_201_CREATED, data=bug))
+
+    write_bugs(insert_bugs, bugs, results)
+    return serialize_results(results), results_status(results, status.HTTP_201_CREATED)
+
+
+def insert_bugs(bugs):
+    Bug.objects.bulk_create(bugs)
+    # bulk writes do not send the signals that maintain the counters, record the
+    # changes and invalidate cached bug lists
+    deltas = counters.new_deltas()
+    for bug in bugs:
+        counters.track(deltas, None, counters.bug_state(bug))
+    counters.apply_deltas(deltas)
+    record_bugs(bugs, Change.CREATED)
+    list_cache.bump_generation()
+
+
+def update_bugs(items, user, changes=None):
+    """
+        This applies every valid item to the bug with the item's id, as the user
+    :param changes: the fields applied to every bug instead of the item's own fields
+    :return: the per-item results and the response status
+    """
+    check_items(items)
+    ids = [to_pk(item.get('id')) if isinstance(item, dict) else None for item in items]
+    instances = Bug.objects.select_related('assigner', 'assignee').in_bulk(set(ids) - {None})
+    data = [changes if changes is not None else item for item in items]
+    context = preload_context(data, user=user)
+    results, bugs, fields, seen_ids, seen_titles = [], [], set(), set(), set()
+    for index, (pk, item) in enumerate(zip(ids, data)):
+        if pk not in instances:
+            results.append(item_result(index, status.HTTP_404_NOT_FOUND, errors={"id": ["Bug not found"]}))
+            continue
+        if pk in seen_ids:
+            results.append(item_result(index, status.HTTP_400_BAD_REQUEST,
+                                       errors={"id": ["This bug appears more than once"]}))
+            continue
+        item = {key: value for key, value in item.items() if key != 'id'}
+        serializer = serializers.UpdateBugSerializer(instance=instances[pk], data=item, partial=True, context=context)
+        if not serializer.is_valid():
+            results.append(item_result(index, status.HTTP_400_BAD_REQUEST, errors=serializer.errors))
+        elif is_duplicate_title(serializer.validated_data, seen_titles):
+            results.append(item_result(index, status.HTTP_400_BAD_REQUEST, errors=DUPLICATE_TITLE_ERROR))
+        else:
+            seen_ids.add(pk)
+            bug = instances[pk]
+            for field, value in serializer.validated_data.items():
+                setattr(bug, field, value)
+                fields.add(field)
+            bugs.append(bug)
+            results.append(item_result(index, status.HTTP_200_OK, data=bug))
+
+    write_bugs(lambda bugs: save_bugs(bugs, fields), bugs, results)
+    return serialize_results(results), results_status(results, status.HTTP_200_OK)
+
+
+def save_bugs(bugs, fields):
+    # bulk_update does not run auto_now, so updated_at is set here
+    now = timezone.now()
+    previous = counters.locked_states([bug.pk for bug in bugs])
+    deltas = counters.new_deltas()
+    for bug in bugs:
+        bug.updated_at = now
+        counters.set_resolved_at(bug, previous.get(bug.pk), now)
+        # a bug deleted since it was read is not written, nor counted
+        if bug.pk in previous:
+            counters.track(deltas, previous[bug.pk], counters.bug_state(bug))
+    Bug.objects.bulk_update(bugs, fields=sorted(fields | {'updated_at', 'resolved_at'}))
+    counters.apply_deltas(deltas)
+    record_bugs(bugs, previous=previous)
+    list_cache.bump_generation()
+
+
+def write_bugs(write, bugs, results):
+    """
+        This runs write(bugs) in a transaction. When a concurrent request took one of their
+        titles since they were validated, the bugs using a title taken by then are failed
+        in the results and the others written again, once.
+    """
+    for _ in range(2):
+        if not bugs:
+            return
+        try:
+            with transaction.atomic():
+                write(bugs)
+            return
+        except IntegrityError as error:
+            if not any(marker in str(error) for marker in TITLE_MARKERS):
+                raise
+        owners = dict(Bug.objects.filter(title__in={bug.title for bug in bugs} - {''}).values_list('title', 'id'))
+        taken = {id(bug) for bug in bugs if owners.get(bug.title) not in (None, bug.pk)}
+        if not taken:
+            break
+        for result in results:
+            if id(result.get("data")) in taken:
+                del result["data"]
+                result.update(status=status.HTTP_400_BAD_REQUEST, errors=DUPLICATE_TITLE_ERROR)
+        bugs = [bug for bug in bugs if id(bug) not in taken]
+    raise BulkConflict()
+
+
+def serialize_results(results):
+    for result in results:
+        if "data" in result:
+            result["data"] = serializers.BugListSerializer(result["data"]).data
+    return results
@@ -0,0 +1,185 @@
+"""
+    Delta sync of bugs and comments.
+
+    Every write to a bug or comment adds a row to the Change log in the same transaction:
+    the save and delete signals record single writes, Bugs.bulk records bulk writes. The
+    id of a change is a monotonic change token. A client keeps the token of the last
+    response and asks /bugs/changes/?since=<token> for what changed after it, which costs
+    one query on the log plus one per kind of object, whatever the size of the tables.
+
+    Deleted objects are returned as tombstones, their ids. Only the latest change of each
+    object matters, so a bug written ten times since the token is sent once, as it is now.
+    A bug is also sent when one of its comments changed, since its comment count did.
+
+    The log is pruned after CHANGE_RETENTION_DAYS by the prune_changes command. A token
+    older than the log is answered 410 Gone, the client then lists the bugs again and
+    starts over from the `next` token of an empty request.
+
+    SQLite serializes writers, so ids are handed out in commit order and no change can
+    appear behind a token. Other databases let a transaction commit a lower id after a
+    client synced past a higher one, and that change would be skipped for good, so
+    /bugs/changes/ and the event stream answer 501 Not Implemented on them.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from Bugs.models import Bug, Change, Comment
+
+
+class ChangesUnavailable(APIException):
+    status_code = status.HTTP_501_NOT_IMPLEMENTED
+    default_detail = "Changes can only be followed when the database is SQLite"
+    default_code = 'changes_unavailable'
+
+
+class ChangeTokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = "This change token is older than the change log, list the bugs again"
+    default_code = 'change_token_expired'
+
+
+def bug_change(bug, action):
+    return Change(kind=Change.BUG, object_id=bug.pk, bug_id=bug.pk, action=action,
+                  assignee_id=bug.assignee_id, assigner_id=bug.assigner_id)
+
+
+def comment_change(comment, action):
+    # the bug is at hand when the comment was just created, it is not read only for its users
+    bug = comment.bug if Comment.bug.is_cached(comment) else None
+    return Change(kind=Change.COMMENT, object_id=comment.pk, bug_id=comment.bug_id, action=action,
+                  assignee_id=bug and bug.assignee_id, assigner_id=bug and bug.assigner_id)
+
+
+def update_action(previous, bug):
+    """
+    :param previous: the counter state of the bug before the update (see Bugs.counters)
+    :return: RESOLVED when the update resolved the bug, UPDATED otherwise
+    """
+    return Change.RESOLVED if bug.resolved and previous and not previous['resolved'] else Change.UPDATED
+
+
+def check_database():
+    """
+        This refuses to hand out change tokens on a database that does not commit the
+        changes in id order, see the module docstring
+    """
+    if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+        raise ChangesUnavailable()
+
+
+def bug_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        action = Change.CREATED if created else update_action(getattr(instance, '_counter_previous', None), instance)
+        bug_change(instance, action).save()
+
+
+def bug_deleted(sender, instance, **kwargs):
+    bug_change(instance, Change.DELETED).save()
+
+
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        comment_change(instance, Change.CREATED if created else Change.UPDATED).save()
+
+
+def comment_deleted(sender, instance, **kwargs):
+    comment_change(instance, Change.DELETED).save()
+
+
+def user_deleted(sender, instance, **kwargs):
+    """
+        Deleting a user unsets the assignee or assigner of their bugs and the author of
+        their comments without any signal, so these are recorded as updated
+    """
+    def without_user(user_id):
+        return None if user_id == instance.pk else user_id
+
+    bugs = Bug.objects.filter(Q(assignee=instance) | Q(assigner=instance)).values_list(
+        'id', 'assignee_id', 'assigner_id')
+    comments = Comment.objects.filter(author=instance).values_list('id', 'bug_id')
+    Change.objects.bulk_create(
+        [Change(kind=Change.BUG, object_id=pk, bug_id=pk, action=Change.UPDATED,
+                assignee_id=without_user(assignee_id), assigner_id=without_user(assigner_id))
+         for pk, assignee_id, assigner_id in bugs] +
+        [Change(kind=Change.COMMENT, object_id=pk, bug_id=bug_id, action=Change.UPDATED) for pk, bug_id in comments])
+
+
+def record_bugs(bugs, action=None, previous=None):
+    """
+        This records the bugs written by a bulk request, which sends no signals
+    :param action: the action of every bug, by default each bug is an update
+    :param previous: the counter states of the updated bugs by id, to tell which were resolved
+    """
+    Change.objects.bulk_create([bug_change(bug, action or update_action(previous.get(bug.pk), bug)) for bug in bugs])
+
+
+def parse_token(value):
+    try:
+        token = int(value)
+    except (TypeError, ValueError):
+        token = -1
+    if token < 0:
+        raise ValidationError(detail={"since": "Send the `next` token of a previous response"})
+    return token
+
+
+def current_token():
+    return Change.objects.aggregate(token=Max('id'))['token'] or 0
+
+
+def check_token(since):
+    """
+        A token is still covered by the log when every change after it is kept: pruning only
+        removes the oldest changes, so the first change kept must directly follow the token
+    """
+    first = Change.objects.aggregate(first=Min('id'))['first']
+    if first is not None and since < first - 1:
+        raise ChangeTokenExpired()
+
+
+def changes_since(since, limit=None):
+    """
+        This collects the bugs and comments changed after the token, at most `limit` changes at a time
+    :return: the bugs and comments as they are now, the ids of the deleted ones, the token
+        of the last change read and whether more changes follow it
+    """
+    limit = limit or settings.CHANGES_PAGE_SIZE
+    check_token(since)
+    rows = list(Change.objects.filter(id__gt=since).order_by('id')[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    # the latest change of every object wins
+    latest = {(row.kind, row.object_id): row for row in rows}
+    bug_ids = {row.bug_id for row in latest.values() if not (row.kind == Change.BUG and row.action == Change.DELETED)}
+    comment_ids = {row.object_id for row in latest.values()
+                   if row.kind == Change.COMMENT and row.action != Change.DELETED}
+    bugs = Bug.objects.select_related('assigner', 'assignee').filter(id__in=bug_ids).order_by('id') if bug_ids else []
+    comments = (Comment.objects.select_related('author').filter(id__in=comment_ids).order_by('id')
+                if comment_ids else [])
+    return {
+        'bugs': bugs,
+        'comments': comments,
+        'deleted': {kind: sorted(object_id for (row_kind, object_id), row in latest.items()
+                                 if row_kind == kind and row.action == Change.DELETED)
+                    for kind in (Change.BUG, Change.COMMENT)},
+        'next': rows[-1].id if rows else since,
+        'more': more,
+    }
+
+
+def prune(days=None):
+    """
+        This deletes the changes older than the retention, always keeping the newest one so
+        that the tokens handed out since remain valid
+    :return: the number of changes deleted
+    """
+    days = settings.CHANGE_RETENTION_DAYS if days is None else days
+    newest = current_token()
+    cutoff = timezone.now() - timedelta(days=days)
+    return Change.objects.filter(at__lt=cutoff, id__lt=newest).delete()[0]
@@ -0,0 +1,90 @@
+"""
+    Validators for conditional GETs of bugs.
+
+    They are computed with a single aggregate query that the (resolved|assignee|assigner,
+    updated_at) and (bug, updated_at) indexes answer without reading the rows, so a request
+    whose validators still match gets a 304 before anything is serialized or rendered.
+    The users embedded in a list (e.g. a renamed assignee) are versioned in the cache
+    instead, see list_cache.users_version.
+"""
+import hashlib
+from calendar import timegm
+
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from Bugs import list_cache
+from Bugs.models import Bug, Comment
+from Bugs.serializers import UserSerializer
+
+# the columns of the assigner and assignee rendered in a bug's details
+DETAIL_USER_FIELDS = tuple(f'{relation}__{field}' for relation in ('assigner', 'assignee')
+                           for field in UserSerializer.Meta.fields)
+
+
+def make_validators(request, last_modified, *versions, weak=False):
+    """
+    :return: an ETag for this URL at these versions and the Last-Modified timestamp
+    """
+    version = '|'.join(str(value) for value in (request.get_full_path(), last_modified) + versions)
+    etag = quote_etag(hashlib.sha1(version.encode()).hexdigest())
+    return ('W/' + etag if weak else etag), timegm(last_modified.utctimetuple()) if last_modified else None
+
+
+def bug_list_state(queryset):
+    """
+        A page changes when a bug matching the filters is updated, added or removed, which
+        moves the newest updated_at or the number of matching bugs, and when a comment is
+        added to or removed from one of them, which moves comment_count and last_comment_at
+        without touching updated_at. Deleting a bug or a comment moves no timestamp, so
+        lists have no Last-Modified and only the ETag validates them
+    :return: the number of bugs in the queryset, the newest updated_at and their comment state
+    """
+    state = queryset.order_by().aggregate(count=Count('id'), last_modified=Max('updated_at'),
+                                          last_comment_at=Max('last_comment_at'), comments=Sum('comment_count'))
+    return state['count'], state['last_modified'], state['last_comment_at'], state['comments']
+
+
+def bug_list_validators(request, state):
+    return make_validators(request, None, *state, list_cache.users_version())
+
+
+def bug_detail_validators(request, pk):
+    """
+        A bug changes when it is updated, one of its comments is added, updated or deleted
+        or its assigner or assignee is edited. Deleting an older comment leaves every
+        timestamp as it was, so the details have no Last-Modified and only the ETag
+        validates them. It is weak: the usernames of the comment authors are not part of it.
+    :return: the validators, or None when the bug does not exist
+    """
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    comments = Comment.objects.filter(bug=OuterRef('pk')).order_by().values('bug')
+    state = Bug.objects.filter(pk=pk).annotate(
+        newest_comment_at=Subquery(comments.annotate(last=Max('updated_at')).values('last')),
+        comments_counted=Subquery(comments.annotate(count=Count('id')).values('count')),
+    ).values_list('updated_at', 'newest_comment_at', 'comments_counted', *DETAIL_USER_FIELDS).first()
+    if state is None:
+        return None
+    return make_validators(request, None, *state, weak=True)
+
+
+def conditional_response(request, validators, get_response):
+    """
+        This answers with 304 Not Modified when the client's copy is still current, and
+        otherwise with the response built by get_response, both carrying the validators
+    """
+    if validators is None:
+        return get_response()
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = get_response()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
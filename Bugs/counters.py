@@ -0,0 +1,250 @@
+"""
+    Incrementally maintained bug counters.
+
+    BugCounter holds one row per (assignee, resolved) pair with the number of bugs in it
+    and, for resolved bugs, the total time they took to resolve. Saving or deleting a bug
+    moves it between rows with F() updates inside the same transaction as the write, and
+    the bulk endpoints apply the same deltas explicitly since bulk writes send no signals.
+    The state a bug moves from is read from its row, locked until the transaction ends,
+    so concurrent writes to the same bug apply their deltas one after the other.
+
+    Writes that send no signals, like queryset.update() or raw SQL, leave the counters
+    behind. rebuild_counters recomputes every row from the bug table: run the
+    rebuild_bug_counters management command periodically, from cron or as a process of
+    its own with --every SECONDS.
+
+    Each bug also carries the number of its comments and when the newest one was last
+    updated, which CommentAPI maintains with F() updates in the same transaction as the
+    comment (comment_added/comment_removed) and rebuild_comment_counts repairs.
+
+    The /bugs/stats/ endpoint reads these rows unless it is filtered by assigner, in which
+    case grouped_totals aggregates the matching bugs; summarize folds either into the
+    response.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import (Case, Count, DurationField, ExpressionWrapper, F, Max, OuterRef, Q, Subquery, Sum,
+                              Value, When)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from Bugs.models import Bug, BugCounter, Comment
+
+STATE_FIELDS = ('assignee_id', 'resolved', 'created_at', 'resolved_at')
+
+
+def resolve_microseconds(created_at, resolved_at):
+    if created_at is None or resolved_at is None:
+        return 0
+    return to_microseconds(resolved_at - created_at)
+
+
+def bug_state(bug):
+    return {field: getattr(bug, field) for field in STATE_FIELDS}
+
+
+def locked_states(pks):
+    """
+        This reads the bugs' rows and locks them until the transaction ends, it must run
+        in the transaction that writes them
+    :return: the states the bugs have in the database, by id
+    """
+    rows = Bug.objects.select_for_update().filter(pk__in=pks).values('id', *STATE_FIELDS)
+    return {row.pop('id'): row for row in rows}
+
+
+def saved_state(bug):
+    """
+    :return: the state the bug has in the database, None when it is not saved yet
+    """
+    if bug._state.adding or bug.pk is None:
+        return None
+    return locked_states([bug.pk]).get(bug.pk)
+
+
+def set_resolved_at(bug, previous, now=None):
+    """
+        This stamps resolved_at when the bug becomes resolved and clears it when it is reopened
+    """
+    if not bug.resolved:
+        bug.resolved_at = None
+    elif previous is None or not previous['resolved'] or previous['resolved_at'] is None:
+        bug.resolved_at = now or timezone.now()
+    else:
+        bug.resolved_at = previous['resolved_at']
+
+
+def add_delta(deltas, state, sign):
+    if state is None:
+        return
+    delta = deltas[(state['assignee_id'], state['resolved'])]
+    delta[0] += sign
+    if state['resolved']:
+        delta[1] += sign * resolve_microseconds(state['created_at'], state['resolved_at'])
+
+
+def track(deltas, previous, current):
+    add_delta(deltas, previous, -1)
+    add_delta(deltas, current, 1)
+
+
+def new_deltas():
+    return defaultdict(lambda: [0, 0])
+
+
+def apply_deltas(deltas):
+    """
+        This adds the deltas to the counters with one UPDATE per changed counter, the
+        counters that do not exist yet are created first
+    """
+    def update(assignee_id, resolved, count, microseconds):
+        return BugCounter.objects.filter(assignee_id=assignee_id, resolved=resolved).update(
+            count=F('count') + count, resolve_microseconds=F('resolve_microseconds') + microseconds)
+
+    changes = [(*key, *delta) for key, delta in deltas.items() if any(delta)]
+    missing = [change for change in changes if not update(*change)]
+    if missing:
+        # a concurrent request may create the same counters, the conflicting rows are skipped
+        BugCounter.objects.bulk_create([BugCounter(assignee_id=assignee_id, resolved=resolved)
+                                        for assignee_id, resolved, *_ in missing], ignore_conflicts=True)
+        for change in missing:
+            update(*change)
+
+
+def record_previous_state(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._counter_previous = saved_state(instance)
+    set_resolved_at(instance, instance._counter_previous)
+
+
+def update_counters(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = new_deltas()
+    track(deltas, getattr(instance, '_counter_previous', None), bug_state(instance))
+    apply_deltas(deltas)
+
+
+def record_deleted_state(sender, instance, **kwargs):
+    # the row is gone by post_delete, the delete runs both signals in its transaction
+    instance._counter_previous = saved_state(instance)
+
+
+def remove_from_counters(sender, instance, **kwargs):
+    deltas = new_deltas()
+    add_delta(deltas, getattr(instance, '_counter_previous', None), -1)
+    apply_deltas(deltas)
+
+
+def release_user_counters(sender, instance, **kwargs):
+    """
+        Deleting a user unassigns their bugs without any signal, so their counters are
+        merged into the unassigned ones before they are deleted with the user
+    """
+    deltas = new_deltas()
+    for counter in BugCounter.objects.filter(assignee=instance):
+        deltas[(None, counter.resolved)] = [counter.count, counter.resolve_microseconds]
+    apply_deltas(deltas)
+
+
+def grouped_totals(queryset):
+    """
+        This groups the bugs by assignee and resolved status in a single query
+    :return: rows with the assignee's id and username, resolved, the number of bugs and the
+        total time it took to resolve them
+    """
+    resolve_time = ExpressionWrapper(F('resolved_at') - F('created_at'), output_field=DurationField())
+    return queryset.order_by().values('assignee_id', 'assignee__username', 'resolved').annotate(
+        count=Count('id'), resolve_time=Sum(resolve_time, filter=Q(resolved=True)))
+
+
+def to_microseconds(duration):
+    return (duration.days * 86400 + duration.seconds) * 1000000 + duration.microseconds if duration else 0
+
+
+def rebuild_counters():
+    """
+        This recomputes every counter from the bug table
+    :return: the number of counter rows
+    """
+    with transaction.atomic():
+        counters = [
+            BugCounter(assignee_id=row['assignee_id'], resolved=row['resolved'], count=row['count'],
+                       resolve_microseconds=to_microseconds(row['resolve_time']))
+            for row in grouped_totals(Bug.objects.all())
+        ]
+        BugCounter.objects.all().delete()
+        BugCounter.objects.bulk_create(counters)
+    return len(counters)
+
+
+def counter_totals(counters):
+    """
+    :return: the counters as rows shaped like the ones of grouped_totals
+    """
+    return [{'assignee_id': counter.assignee_id, 'assignee__username': counter.assignee and counter.assignee.username,
+             'resolved': counter.resolved, 'count': counter.count,
+             'resolve_time': timedelta(microseconds=counter.resolve_microseconds)} for counter in counters]
+
+
+def summarize(rows):
+    """
+        This folds the per (assignee, resolved) rows into the overall and per-assignee statistics
+    """
+    def new_totals(**fields):
+        return {**fields, 'total': 0, 'open': 0, 'resolved': 0, 'resolve_microseconds': 0}
+
+    overall, assignees = new_totals(), {}
+    for row in rows:
+        if not row['count']:
+            continue
+        assignee = assignees.setdefault(row['assignee_id'], new_totals(
+            id=row['assignee_id'], username=row['assignee__username']))
+        for totals in (overall, assignee):
+            totals['total'] += row['count']
+            totals['resolved' if row['resolved'] else 'open'] += row['count']
+            if row['resolved']:
+                totals['resolve_microseconds'] += to_microseconds(row['resolve_time'])
+    for totals in (overall, *assignees.values()):
+        microseconds = totals.pop('resolve_microseconds')
+        totals['mean_time_to_resolve'] = (timedelta(microseconds=microseconds // totals['resolved'])
+                                          if totals['resolved'] else None)
+    # the busiest assignees come first, unassigned bugs (no id) last among equals
+    overall['assignees'] = sorted(assignees.values(), key=lambda totals: (-totals['open'], totals['id'] is None,
+                                                                          totals['id'] or 0))
+    return overall
+
+
+def comment_added(comment):
+    """
+        This counts the comment on its bug
+    """
+    Bug.objects.filter(pk=comment.bug_id).update(
+        comment_count=F('comment_count') + 1,
+        # a comment committed late must not move last_comment_at back
+        last_comment_at=Case(When(last_comment_at__gt=comment.updated_at, then=F('last_comment_at')),
+                             default=Value(comment.updated_at)))
+
+
+def comment_removed(comment):
+    """
+        This uncounts the deleted comment, last_comment_at falls back to the newest remaining comment
+    """
+    remaining = Comment.objects.filter(bug=OuterRef('pk')).order_by('-updated_at').values('updated_at')[:1]
+    Bug.objects.filter(pk=comment.bug_id).update(comment_count=F('comment_count') - 1,
+                                                 last_comment_at=Subquery(remaining))
+
+
+def rebuild_comment_counts():
+    """
+        This recomputes comment_count and last_comment_at of every bug from the comment table
+    :return: the number of bugs
+    """
+    comments = Comment.objects.filter(bug=OuterRef('pk')).order_by().values('bug')
+    return Bug.objects.update(
+        comment_count=Coalesce(Subquery(comments.annotate(count=Count('id')).values('count')), 0),
+        last_comment_at=Subquery(comments.annotate(last=Max('updated_at')).values('last')),
+    )
@@ -0,0 +1,293 @@
+"""
+    Server-Sent Events stream of bug changes at /bugs/events/, served by bug/asgi.py.
+
+    The events are the rows of the change log (see Bugs.changes): bug.created,
+    bug.updated, bug.resolved, bug.deleted and comment.created, with the change id as the
+    event id. Each carries the ids of the bug (and comment) and of its users, clients read
+    the details they need from the API. ?assignee= and ?assigner= only keep the events of
+    bugs with that assignee/assigner.
+
+    Every worker process runs one broker, which reads the new changes from the log once per
+    SSE_POLL_INTERVAL while clients are connected, and hands them to every client. Each
+    client has a buffer of SSE_CLIENT_BUFFER events: a client too slow to keep up is sent
+    what its buffer holds and disconnected instead of buffering without bound. EventSource
+    reconnects with the Last-Event-ID header, and since the log is shared by every worker
+    the stream resumes from the log right after that event, on whichever worker answers.
+    When that event was pruned already a `reset` event tells the client to reload.
+
+    The stream is authenticated with a token in the Authorization header, like the API.
+    Browsers' EventSource cannot send that header, so a short-lived stream token can be
+    passed as ?token= instead: POST /bugs/events/token/ hands one out, valid for
+    SSE_TOKEN_SECONDS. It only authenticates opening the stream; once it expired, an
+    EventSource that reconnects is answered 401 and closes, ask for a new token and open a
+    new one. It carries the user id and a digest of the API token, not the token, and is
+    refused once that token is signed out.
+
+    The stream is not served through the middleware, so its responses carry the CORS
+    headers themselves for the origins of CORS_ALLOWED_ORIGINS.
+"""
+import asyncio
+import json
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated
+
+from Bugs import changes
+from Bugs.models import Change
+from Utilities.api_response import build_envelope
+from Utilities.authentication import CachedTokenAuthentication, token_cache_key
+
+EVENTS_PATH = '/bugs/events/'
+STREAM_TOKEN_SALT = 'Bugs.events.stream_token'
+EVENTS = {
+    (Change.BUG, Change.CREATED): 'bug.created',
+    (Change.BUG, Change.UPDATED): 'bug.updated',
+    (Change.BUG, Change.RESOLVED): 'bug.resolved',
+    (Change.BUG, Change.DELETED): 'bug.deleted',
+    (Change.COMMENT, Change.CREATED): 'comment.created',
+}
+
+
+def read_events(after, limit):
+    """
+    :return: the events of the changes after the given change id, and the id of the last change read
+    """
+    rows = list(Change.objects.filter(id__gt=after).order_by('id')[:limit])
+    events = [{'id': row.id, 'event': EVENTS[(row.kind, row.action)], 'bug': row.bug_id,
+               'comment': row.object_id if row.kind == Change.COMMENT else None,
+               'assignee': row.assignee_id, 'assigner': row.assigner_id, 'at': row.at.isoformat()}
+              for row in rows if (row.kind, row.action) in EVENTS]
+    return events, rows[-1].id if rows else after
+
+
+def format_event(event):
+    data = {key: value for key, value in event.items() if key not in ('id', 'event')}
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+def in_thread(function):
+    """
+        This runs a database read in a thread like sync_to_async. The stream is not a Django
+        request, whose end would hand the connection back to the pool, so it is done here.
+    """
+    def run(*args):
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run)
+
+
+class Client:
+    """
+        A connected stream: its filters and its buffer of events
+    """
+
+    def __init__(self, assignee=None, assigner=None):
+        self.assignee = assignee
+        self.assigner = assigner
+        self.events = asyncio.Queue(maxsize=settings.SSE_CLIENT_BUFFER)
+        self.overflowed = False
+
+    def wants(self, event):
+        return ((self.assignee is None or event['assignee'] == self.assignee) and
+                (self.assigner is None or event['assigner'] == self.assigner))
+
+    def offer(self, event):
+        """
+        :return: False when the buffer is full, the client is then dropped by the broker
+        """
+        if not self.wants(event):
+            return True
+        try:
+            self.events.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            return False
+        return True
+
+
+class Broker:
+    """
+        The reader of the change log shared by the streams of a worker process
+    """
+
+    def __init__(self):
+        self.clients = set()
+        self.position = None
+        self.task = None
+        self.ready = None
+
+    async def subscribe(self, client):
+        """
+            This adds the client, which gets every event after the returned position
+        :return: the id of the last change read from the log
+        """
+        self.clients.add(client)
+        if self.task is None:
+            self.ready = asyncio.Event()
+            self.task = asyncio.ensure_future(self.run())
+        await self.ready.wait()
+        if self.position is None:
+            self.clients.discard(client)
+            raise RuntimeError("The change log could not be read")
+        return self.position
+
+    def unsubscribe(self, client):
+        self.clients.discard(client)
+
+    async def run(self):
+        try:
+            self.position = await in_thread(changes.current_token)()
+            self.ready.set()
+            while self.clients:
+                await asyncio.sleep(settings.SSE_POLL_INTERVAL)
+                events, self.position = await in_thread(read_events)(self.position, settings.CHANGES_PAGE_SIZE)
+                for event in events:
+                    for client in list(self.clients):
+                        if not client.offer(event):
+                            self.clients.discard(client)
+        finally:
+            # no client is left, the next one starts the broker again
+            self.task = None
+            self.ready.set()
+
+
+broker = Broker()
+
+
+def filter_param(request, name):
+    try:
+        value = request.GET.get(name)
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def stream_token(token):
+    """
+    :return: a signed stream token for the user of the given API token, see the module docstring
+    """
+    return signing.dumps({'user': token.user_id, 'token': token_cache_key(token.key)}, salt=STREAM_TOKEN_SALT)
+
+
+def check_stream_token(value):
+    """
+        This checks the signature and age of a stream token, and that the API token it was
+        made from still belongs to an active user
+    """
+    try:
+        data = signing.loads(value, salt=STREAM_TOKEN_SALT, max_age=settings.SSE_TOKEN_SECONDS)
+    except signing.BadSignature:
+        raise AuthenticationFailed("Invalid or expired stream token.")
+    token = Token.objects.select_related('user').filter(user_id=data['user']).first()
+    if token is None or token_cache_key(token.key) != data['token'] or not token.user.is_active:
+        raise AuthenticationFailed("Invalid or expired stream token.")
+
+
+async def authenticate(request):
+    if 'token' in request.GET:
+        await in_thread(check_stream_token)(request.GET['token'])
+        return
+    authentication = CachedTokenAuthentication()
+    if await authentication.authenticate_cached(request):
+        return
+    if await in_thread(authentication.authenticate)(request) is None:
+        raise NotAuthenticated()
+
+
+def cors_headers(request):
+    """
+        This is what corsheaders adds to the responses of the API, which the stream bypasses
+    :return: the CORS headers of a response to the request
+    """
+    origin = request.META.get('HTTP_ORIGIN')
+    if origin not in settings.CORS_ALLOWED_ORIGINS:
+        return []
+    return [(b'access-control-allow-origin', origin.encode()), (b'vary', b'origin')]
+
+
+async def send_error(send, error, headers=()):
+    body = json.dumps(build_envelope({'detail': str(error.detail)}, False)).encode()
+    await send({'type': 'http.response.start', 'status': error.status_code,
+                'headers': [(b'content-type', b'application/json'), *headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def replay(send, client, last_event_id, position):
+    """
+        This sends the events the client missed, from the log, up to where the broker took over
+    :return: False when the log no longer goes back to the last event the client saw
+    """
+    try:
+        await in_thread(changes.check_token)(last_event_id)
+    except APIException:
+        return False
+    while last_event_id < position:
+        events, read_up_to = await in_thread(read_events)(last_event_id, settings.CHANGES_PAGE_SIZE)
+        for event in events:
+            if event['id'] <= position and client.wants(event):
+                await send({'type': 'http.response.body', 'body': format_event(event), 'more_body': True})
+        last_event_id = min(read_up_to, position) if read_up_to > last_event_id else position
+    return True
+
+
+async def stream(scope, receive, send):
+    """
+        The ASGI application of /bugs/events/
+    """
+    request = ASGIRequest(scope, BytesIO())
+    try:
+        changes.check_database()
+        await authenticate(request)
+    except (changes.ChangesUnavailable, AuthenticationFailed, NotAuthenticated) as error:
+        await send_error(send, error, cors_headers(request))
+        return
+
+    client = Client(assignee=filter_param(request, 'assignee'), assigner=filter_param(request, 'assigner'))
+    position = await broker.subscribe(client)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'), *cors_headers(request)]})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        last_event_id = request.META.get('HTTP_LAST_EVENT_ID', '')
+        if last_event_id.isdigit() and not await replay(send, client, int(last_event_id), position):
+            await send({'type': 'http.response.body', 'body': b'event: reset\ndata: {}\n\n', 'more_body': True})
+        await relay(send, client, disconnected)
+    finally:
+        broker.unsubscribe(client)
+        disconnected.cancel()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def relay(send, client, disconnected):
+    """
+        This sends the events of the broker until the client leaves or falls behind, with a
+        comment line every SSE_HEARTBEAT seconds so that proxies keep the connection open
+    """
+    while not disconnected.done():
+        if client.overflowed and client.events.empty():
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        next_event = asyncio.ensure_future(client.events.get())
+        done, _ = await asyncio.wait({next_event, disconnected}, timeout=settings.SSE_HEARTBEAT,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if next_event in done:
+            body = format_event(next_event.result())
+        else:
+            next_event.cancel()
+            body = b': keep-alive\n\n'
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
@@ -0,0 +1,89 @@
+"""
+    Streaming export of bugs with their comments.
+
+    Bugs are read in batches of EXPORT_BATCH_SIZE by ascending id, each batch with a single
+    query for its comments, and every batch is encoded and handed to the response before
+    the next one is read. Memory use is bounded by the batch size, not the table size.
+"""
+import csv
+from collections import defaultdict
+
+from rest_framework.renderers import JSONRenderer
+
+from Bugs.models import Comment
+from Bugs.serializers import BugExportSerializer
+
+EXPORT_BATCH_SIZE = 500
+
+CSV_HEADER = (
+    'bug_id', 'bug_title', 'bug_body', 'resolved', 'assigner', 'assignee', 'bug_created_at', 'bug_updated_at',
+    'comment_id', 'comment_title', 'comment_body', 'comment_author', 'comment_created_at', 'comment_updated_at',
+)
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def bug_batches(queryset, batch_size=None):
+    """
+        This yields lists of serialized bugs, each with its comments oldest first
+    :param queryset: the (filtered) bugs to export
+    :param batch_size: the number of bugs read per query, EXPORT_BATCH_SIZE by default
+    """
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    queryset = queryset.select_related('assigner', 'assignee').order_by('id')
+    last_id = 0
+    while True:
+        bugs = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not bugs:
+            return
+        comments = defaultdict(list)
+        for comment in Comment.objects.filter(bug__in=[bug.id for bug in bugs]).select_related('author').order_by(
+                'created_at', 'id'):
+            comments[comment.bug_id].append(comment)
+        for bug in bugs:
+            bug.export_comments = comments[bug.id]
+        yield BugExportSerializer(bugs, many=True).data
+        last_id = bugs[-1].id
+
+
+def ndjson_stream(queryset):
+    renderer = JSONRenderer()
+    for batch in bug_batches(queryset):
+        yield b''.join(renderer.render(bug) + b'\n' for bug in batch)
+
+
+class Echo:
+    """
+        A file-like object for csv.writer that hands back each row instead of storing it
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(queryset):
+    """
+        One row per comment with the bug columns repeated, bugs without comments get
+        a single row with empty comment columns.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for batch in bug_batches(queryset):
+        rows = []
+        for bug in batch:
+            bug_columns = [bug['id'], bug['title'], bug['body'], bug['resolved'], bug['assigner'], bug['assignee'],
+                           bug['created_at'], bug['updated_at']]
+            for comment in bug['comments'] or [None]:
+                comment_columns = [comment['id'], comment['title'], comment['body'], comment['author'],
+                                   comment['created_at'], comment['updated_at']] if comment else [''] * 6
+                rows.append(writer.writerow(bug_columns + comment_columns))
+        yield ''.join(rows)
+
+
+def export_stream(queryset, export_format):
+    if export_format == 'csv':
+        return csv_stream(queryset)
+    return ndjson_stream(queryset)
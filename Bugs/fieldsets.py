@@ -0,0 +1,113 @@
+"""
+    Sparse fieldsets of the bug endpoints.
+
+    ?fields=id,title keeps only the named fields of a bug, ?exclude=body drops the named
+    ones and ?expand=assignee,comments renders the named relations in full: the assigner
+    and assignee as users instead of usernames, and the newest comments with a link to
+    the rest. Bug details have every relation expanded already.
+
+    The fields left decide what is read from the database: only their columns are
+    selected, users are only joined when one of them is rendered and comments are only
+    loaded when they are. A list page loads the comments of all its bugs in one query,
+    at most as many per bug as the details embed.
+"""
+from django.conf import settings
+from django.db.models import OuterRef, Prefetch, Subquery
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from Bugs.models import Bug, Comment
+
+FIELDSET_PARAMS = ('fields', 'exclude', 'expand')
+USER_RELATIONS = ('assigner', 'assignee')
+# fields only rendered along with another one
+COMPANION_FIELDS = {'more_comments': 'comments'}
+
+
+def names(request, param):
+    return [name.strip() for name in request.query_params.get(param, '').split(',') if name.strip()]
+
+
+class Fieldset:
+    """
+        The fields, excluded fields and expanded relations asked for by a request
+    """
+
+    def __init__(self, fields=None, exclude=(), expand=()):
+        self.fields = fields
+        self.exclude = exclude
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(names(request, 'fields') or None, names(request, 'exclude'), names(request, 'expand'))
+
+    def apply(self, fields, expandable):
+        """
+            This expands the relations, then removes the fields that are not asked for
+        :param fields: the fields of a serializer by name
+        :param expandable: the fields rendering each relation in full, by relation name
+        :return: the fields asked for
+        """
+        unknown = [name for name in self.expand if name not in expandable]
+        if unknown:
+            raise ValidationError(detail={"expand": f"Choose from {', '.join(expandable)}"})
+        for name in self.expand:
+            fields.update(expandable[name]())
+
+        available = [name for name in fields if name not in COMPANION_FIELDS]
+        unknown = [name for name in [*(self.fields or []), *self.exclude] if name not in available]
+        if unknown:
+            raise ValidationError(detail={"fields": f"Unknown fields {', '.join(unknown)}, "
+                                                   f"choose from {', '.join(available)}"})
+        for name in list(fields):
+            kept = COMPANION_FIELDS.get(name, name)
+            if (self.fields is not None and kept not in self.fields) or kept in self.exclude:
+                del fields[name]
+        return fields
+
+
+class FieldsetSerializerMixin:
+    """
+        This applies the fieldset found in the serializer context, see Bugs.fieldsets
+    """
+    # relation name -> a function returning the fields rendering it in full
+    expandable_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.context.get('fieldset')
+        return fieldset.apply(fields, self.expandable_fields) if fieldset else fields
+
+
+def newest_comments():
+    """
+        The comments embedded in a list: the newest BUG_DETAIL_COMMENTS_LIMIT + 1 of each bug
+        (see Bug.comments), picked per bug on the (bug, updated_at) index by a subquery, so
+        that a bug with thousands of comments does not load them all. Django 4.0 cannot
+        filter on a window function, which would rank them in one pass.
+    """
+    limit = settings.BUG_DETAIL_COMMENTS_LIMIT
+    newest = Comment.objects.filter(bug=OuterRef('bug')).order_by('-updated_at', '-id').values('id')[:limit + 1]
+    return Comment.objects.filter(id__in=Subquery(newest)).select_related('author').order_by('-updated_at', '-id')
+
+
+def optimize(queryset, fields, many):
+    """
+        This makes the queryset load what the serializer fields render and nothing more
+    :param fields: the fields of the bug serializer, once the fieldset is applied
+    :param many: whether a list of bugs is rendered
+    """
+    concrete = {field.name for field in Bug._meta.concrete_fields}
+    # the keyset pagination positions a page on updated_at
+    columns, related = {'id', 'updated_at'}, []
+    for name, field in fields.items():
+        if name in USER_RELATIONS:
+            related.append(name)
+            user_fields = field.fields if isinstance(field, serializers.Serializer) else ['username']
+            columns |= {name} | {f'{name}__{user_field}' for user_field in user_fields}
+        elif name == 'comments' and many:
+            queryset = queryset.prefetch_related(Prefetch('comment_set', queryset=newest_comments()))
+        elif name in concrete:
+            columns.add(name)
+    return queryset.select_related(None).select_related(*related).only(*columns)
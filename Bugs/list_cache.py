@@ -0,0 +1,158 @@
+"""
+    Server-side cache of rendered bug list pages.
+
+    Pages are stored in the `bug_lists` cache under a key made of the current generation
+    and the filter/page query parameters. Every write to a bug, comment or user bumps the
+    generation once it is committed, so pages rendered before the write are never read
+    again and simply expire. Requests with any other query parameter are not cached. The
+    pages are read from the primary database, never from a replica (see Utilities.replicas).
+
+    The generation must be shared by every worker for a write to reach the pages the others
+    cached: the default file backend is shared by the workers of a host, workers on several
+    hosts need memcached or redis (BUG_LIST_CACHE_BACKEND/LOCATION).
+"""
+import hashlib
+import time
+from functools import partial
+
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+LIST_CACHE = 'bug_lists'
+GENERATION_KEY = 'bug-list:generation'
+# the version of the users rendered in the lists, see users_version
+USERS_VERSION_CACHE = 'default'
+USERS_VERSION_KEY = 'bug-list:users-version'
+HITS_KEY = 'bug-list:hits'
+MISSES_KEY = 'bug-list:misses'
+
+CACHED_PARAMS = ('resolved', 'assignee', 'assigner', 'ordering', 'page', 'cursor', 'fields', 'exclude', 'expand')
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+def new_generation():
+    """
+        An evicted generation starts again from the current time rather than from 1, so
+        that the pages of the generations it went through are never read again
+    """
+    return time.time_ns()
+
+
+def get_generation(cache, key=GENERATION_KEY):
+    generation = cache.get(key)
+    if generation is None:
+        generation = new_generation()
+        cache.add(key, generation, timeout=None)
+        generation = cache.get(key, generation)
+    return generation
+
+
+def users_version():
+    """
+        Renaming or deleting a user changes the pages listing their bugs without moving
+        any timestamp of those bugs, so the list validators fold in this version, moved by
+        every user write. It is kept in the default cache, since `bug_lists` may be a dummy
+    """
+    return get_generation(caches[USERS_VERSION_CACHE], USERS_VERSION_KEY)
+
+
+def bump_generation(**kwargs):
+    """
+        This is connected to the save and delete signals, and called after bulk writes.
+        The bump waits for the transaction to commit, otherwise a page could be rendered
+        from the old rows under the new generation.
+    """
+    transaction.on_commit(increment_generation)
+
+
+def bump_user_generation(sender, update_fields=None, **kwargs):
+    # signing in only updates last_login, which is not part of any page
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_generation()
+    transaction.on_commit(partial(increment_generation, USERS_VERSION_CACHE, USERS_VERSION_KEY))
+
+
+def increment_generation(alias=LIST_CACHE, key=GENERATION_KEY):
+    cache = caches[alias]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, new_generation(), timeout=None)
+
+
+def count(key):
+    cache = caches[LIST_CACHE]
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def stats():
+    cache = caches[LIST_CACHE]
+    hits, misses = cache.get(HITS_KEY, 0), cache.get(MISSES_KEY, 0)
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else 0.0}
+
+
+def page_key(request):
+    """
+    :return: the cache key of the page requested, None when it cannot be cached
+    """
+    params = request.GET
+    if any(param not in CACHED_PARAMS for param in params):
+        return None
+    # pages contain absolute next/previous links, so the host is part of the key
+    values = [request.build_absolute_uri(request.path)] + [f'{param}={params.get(param)}' for param in CACHED_PARAMS
+                                                            if param in params]
+    digest = hashlib.sha1('&'.join(values).encode()).hexdigest()
+    return f'bug-list:{get_generation(caches[LIST_CACHE])}:{digest}'
+
+
+def lookup(request, count_miss=True):
+    """
+    :param count_miss: False when the request goes on to the view, which looks it up again
+    :return: the page key and the cached response (or 304 Not Modified), the key is None
+        when the request cannot be cached and the response is None when it is not cached yet
+    """
+    if request.method != 'GET':
+        return None, None
+    key = page_key(request)
+    if key is None:
+        return None, None
+    cached = caches[LIST_CACHE].get(key)
+    if cached is None:
+        if count_miss:
+            count(MISSES_KEY)
+        return key, None
+    count(HITS_KEY)
+    content, headers = cached
+    response = get_conditional_response(
+        request, etag=headers.get('ETag'), last_modified=parse_http_date_safe(headers.get('Last-Modified') or ''))
+    if response is None:
+        response = HttpResponse(content)
+    for header, value in headers.items():
+        if response.status_code == 200 or header != 'Content-Type':
+            response[header] = value
+    response['X-Cache'] = 'HIT'
+    return key, response
+
+
+def store(key, response):
+    """
+        This caches the page once it is rendered
+    """
+    if key is None or response.status_code != 200 or not hasattr(response, 'add_post_render_callback'):
+        return response
+
+    def save(rendered):
+        headers = {header: rendered[header] for header in CACHED_HEADERS if rendered.has_header(header)}
+        caches[LIST_CACHE].set(key, (rendered.content, headers))
+
+    response.add_post_render_callback(save)
+    response['X-Cache'] = 'MISS'
+    return response
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = "Copies the default SQLite database over the SQLite replicas of DATABASE_REPLICAS, for local use"
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError("Only SQLite databases can be copied, replicate other databases with their own tools")
+        primary.ensure_connection()
+        for alias in settings.REPLICA_DATABASES:
+            replica = connections[alias]
+            replica.ensure_connection()
+            # the backup API copies a consistent snapshot, even while the primary is written to
+            primary.connection.backup(replica.connection)
+            self.stdout.write(self.style.SUCCESS(f"{primary.settings_dict['NAME']} has been copied to "
+                                                 f"{replica.settings_dict['NAME']}"))
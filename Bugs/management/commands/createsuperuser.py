@@ -0,0 +1,30 @@
+import os
+
+from django.contrib.auth.management.commands import createsuperuser
+from django.core.management.base import CommandError
+
+from Bugs.serializers import EMAIL_TAKEN, users_with_email
+
+
+class Command(createsuperuser.Command):
+    """
+        Django's createsuperuser, refusing an email address already used whatever its case:
+        the unique_user_email constraint is unknown to the fields of auth.User. Bugs comes
+        before django.contrib.auth in INSTALLED_APPS for this command to replace Django's.
+    """
+
+    def handle(self, *args, **options):
+        self.database = options['database']
+        email = options.get('email')
+        if email is None and not options['interactive']:
+            email = os.environ.get('DJANGO_SUPERUSER_EMAIL')
+        if email and users_with_email(email).using(self.database).exists():
+            raise CommandError(EMAIL_TAKEN)
+        return super().handle(*args, **options)
+
+    def get_input_data(self, field, message, default=None):
+        value = super().get_input_data(field, message, default)
+        if field.name == 'email' and value and users_with_email(value).using(self.database).exists():
+            self.stderr.write(f"Error: {EMAIL_TAKEN}")
+            return None
+        return value
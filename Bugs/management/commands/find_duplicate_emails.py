@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+
+def duplicate_emails():
+    """
+    :return: the users sharing an email address with another user whatever its case, by
+        email address in upper case
+    """
+    emails = User.objects.exclude(email='').annotate(email_upper=Upper('email')).values('email_upper')
+    duplicated = emails.annotate(count=Count('id')).filter(count__gt=1).values('email_upper')
+    users = {}
+    for user in User.objects.annotate(email_upper=Upper('email')).filter(email_upper__in=duplicated).order_by('id'):
+        users.setdefault(user.email_upper, []).append(user)
+    return users
+
+
+class Command(BaseCommand):
+    help = ("Lists the accounts whose email addresses differ only in case, which must be told apart before "
+            "migration 0008 makes emails unique whatever their case")
+
+    def handle(self, *args, **options):
+        duplicates = duplicate_emails()
+        for users in duplicates.values():
+            self.stdout.write(', '.join(f"{user.email} (id {user.pk}, {user.username})" for user in users))
+        if duplicates:
+            self.stdout.write(self.style.WARNING(f"{len(duplicates)} email addresses are used by more than one "
+                                                 f"account"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Every email address is used by a single account"))
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bug import schema
+
+
+class Command(BaseCommand):
+    help = "Writes the OpenAPI schema served at /docs/openapi.json to OPENAPI_SCHEMA_PATH for the current code version"
+
+    def handle(self, *args, **options):
+        version = schema.code_version()
+        schema.write(settings.OPENAPI_SCHEMA_PATH, schema.generate(version))
+        self.stdout.write(self.style.SUCCESS(f"The schema of version {version} has been written to "
+                                             f"{settings.OPENAPI_SCHEMA_PATH}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from Bugs import changes
+
+
+class Command(BaseCommand):
+    help = "Deletes the changes older than CHANGE_RETENTION_DAYS from the change log behind /bugs/changes/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="keep the changes of the last DAYS days instead")
+
+    def handle(self, *args, **options):
+        deleted = changes.prune(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} changes have been pruned"))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Bugs import counters
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the bug counters behind the bug statistics and the comment counts of bugs, "
+            "run it periodically to repair writes that sent no signals")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, metavar='SECONDS',
+                            help="keep running and rebuild the counters every SECONDS")
+
+    def handle(self, *args, **options):
+        while True:
+            rows = counters.rebuild_counters()
+            bugs = counters.rebuild_comment_counts()
+            self.stdout.write(self.style.SUCCESS(f"The bug counters have been rebuilt ({rows} rows) and the comments "
+                                                 f"of {bugs} bugs have been recounted"))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
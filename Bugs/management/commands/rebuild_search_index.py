@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Bugs import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index of bugs and comments from their tables"
+
+    def handle(self, *args, **options):
+        try:
+            search.check_database()
+        except search.SearchUnavailable as error:
+            raise CommandError(error.detail)
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS("The search index has been rebuilt"))
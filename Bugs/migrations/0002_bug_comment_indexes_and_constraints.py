@@ -0,0 +1,41 @@
+# Generated by Django 4.0.1 on 2026-10-17 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Bugs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bug',
+            index=models.Index(fields=['-updated_at', '-id'], name='bug_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bug',
+            index=models.Index(fields=['resolved', '-updated_at'], name='bug_resolved_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bug',
+            index=models.Index(fields=['assignee', '-updated_at'], name='bug_assignee_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bug',
+            index=models.Index(fields=['assigner', '-updated_at'], name='bug_assigner_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['bug', '-updated_at'], name='comment_bug_updated_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bug',
+            constraint=models.UniqueConstraint(fields=('title',), name='unique_bug_title'),
+        ),
+        migrations.AddConstraint(
+            model_name='comment',
+            constraint=models.UniqueConstraint(fields=('bug', 'author', 'title'), name='unique_comment_title_per_author'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# the schema as this migration created it, Bugs.search re-creates the triggers after
+# every migrate but must not change what replaying this migration builds
+CREATE_INDEX = [
+    "CREATE VIRTUAL TABLE Bugs_bug_fts USING fts5("
+    "title, body, content='Bugs_bug', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE VIRTUAL TABLE Bugs_comment_fts USING fts5("
+    "title, body, content='Bugs_comment', content_rowid='id', tokenize='porter unicode61')",
+]
+for table, source in (('Bugs_bug_fts', 'Bugs_bug'), ('Bugs_comment_fts', 'Bugs_comment')):
+    CREATE_INDEX += [
+        f"CREATE TRIGGER {table}_insert AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {table}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+        f"CREATE TRIGGER {table}_delete AFTER DELETE ON {source} BEGIN "
+        f"INSERT INTO {table}({table}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+        # only title/body edits touch the index, resolving or reassigning a bug does not
+        f"CREATE TRIGGER {table}_update AFTER UPDATE OF title, body ON {source} BEGIN "
+        f"INSERT INTO {table}({table}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+        f"INSERT INTO {table}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+        # title matches weigh more than body matches
+        f"INSERT INTO {table}({table}, rank) VALUES ('rank', 'bm25(2.0, 1.0)')",
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+        f"INSERT INTO {table}({table}) VALUES ('optimize')",
+    ]
+
+DROP_INDEX = [
+    f"DROP TRIGGER IF EXISTS {table}_{trigger}"
+    for table in ('Bugs_bug_fts', 'Bugs_comment_fts') for trigger in ('insert', 'delete', 'update')
+] + ["DROP TABLE IF EXISTS Bugs_bug_fts", "DROP TABLE IF EXISTS Bugs_comment_fts"]
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    """
+        FTS5 is SQLite specific, other backends go without full-text search
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Bugs', '0002_bug_comment_indexes_and_constraints'),
+    ]
+
+    operations = [
+        SQLiteRunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.1 on 2026-10-17 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Bugs', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='bug',
+            name='unique_bug_title',
+        ),
+        migrations.AddIndex(
+            model_name='bug',
+            index=models.Index(fields=['title'], name='bug_title_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bug',
+            constraint=models.UniqueConstraint(condition=models.Q(('title', ''), _negated=True), fields=('title',), name='unique_bug_title'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.0.1 on 2026-10-17 02:00
+
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    """
+        Bugs resolved before resolved_at existed are taken as resolved at their last update
+    """
+    Bug = apps.get_model('Bugs', 'Bug')
+    BugCounter = apps.get_model('Bugs', 'BugCounter')
+    Bug.objects.filter(resolved=True).update(resolved_at=F('updated_at'))
+    resolve_time = ExpressionWrapper(F('resolved_at') - F('created_at'), output_field=DurationField())
+    rows = Bug.objects.order_by().values('assignee_id', 'resolved').annotate(
+        count=Count('id'), resolve_time=Sum(resolve_time, filter=Q(resolved=True)))
+    BugCounter.objects.bulk_create([
+        BugCounter(assignee_id=row['assignee_id'], resolved=row['resolved'], count=row['count'],
+                   resolve_microseconds=row['resolve_time'] // datetime.timedelta(microseconds=1)
+                   if row['resolve_time'] else 0)
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('Bugs', '0004_allow_untitled_bugs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bug',
+            name='resolved_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='BugCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolved', models.BooleanField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('resolve_microseconds', models.BigIntegerField(default=0)),
+                ('assignee', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bug_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bugcounter',
+            constraint=models.UniqueConstraint(fields=('assignee', 'resolved'), name='unique_bug_counter'),
+        ),
+        migrations.AddConstraint(
+            model_name='bugcounter',
+            constraint=models.UniqueConstraint(condition=models.Q(('assignee', None)), fields=('resolved',), name='unique_unassigned_bug_counter'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
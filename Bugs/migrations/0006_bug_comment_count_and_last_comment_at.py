@@ -0,0 +1,44 @@
+# Generated by Django 4.0.1 on 2026-10-17 02:04
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_comments(apps, schema_editor):
+    Bug = apps.get_model('Bugs', 'Bug')
+    Comment = apps.get_model('Bugs', 'Comment')
+    comments = Comment.objects.filter(bug=OuterRef('pk')).order_by().values('bug')
+    Bug.objects.update(
+        comment_count=Coalesce(Subquery(comments.annotate(count=Count('id')).values('count')), 0),
+        last_comment_at=Subquery(comments.annotate(last=Max('updated_at')).values('last')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Bugs', '0005_bug_resolved_at_and_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bug',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bug',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='bug',
+            index=models.Index(fields=['-comment_count', '-id'], name='bug_comment_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bug',
+            index=models.Index(fields=['-last_comment_at', '-id'], name='bug_last_comment_idx'),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+from django.db.models.functions import Upper
+
+# auth.User cannot declare indexes of its own, this one backs the case-insensitive
+# email lookup of sign in and sign up (see Bugs.serializers.users_with_email)
+EMAIL_INDEX = models.Index(Upper('email'), name='user_email_upper_idx')
+
+
+def add_email_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model('auth', 'User'), EMAIL_INDEX)
+
+
+def remove_email_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('auth', 'User'), EMAIL_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('Bugs', '0006_bug_comment_count_and_last_comment_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_email_index, remove_email_index),
+    ]
@@ -0,0 +1,38 @@
+from django.core.management.base import CommandError
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+# auth.User cannot declare constraints of its own. Emails are unique whatever their case,
+# users without one are left out; the index also backs the sign in lookup
+# (see Bugs.serializers.users_with_email)
+EMAIL_CONSTRAINT = models.UniqueConstraint(Upper('email'), condition=~models.Q(email=''), name='unique_user_email')
+EMAIL_INDEX = models.Index(Upper('email'), name='user_email_upper_idx')
+
+
+def add_email_constraint(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    emails = User.objects.using(schema_editor.connection.alias).exclude(email='').annotate(email_upper=Upper('email'))
+    duplicated = emails.values('email_upper').annotate(count=Count('id')).filter(count__gt=1).count()
+    if duplicated:
+        raise CommandError(f"{duplicated} email addresses are used by more than one account whatever their case, "
+                           f"run `python manage.py find_duplicate_emails` to list them and tell them apart first")
+    schema_editor.remove_index(User, EMAIL_INDEX)
+    schema_editor.add_constraint(User, EMAIL_CONSTRAINT)
+
+
+def remove_email_constraint(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    schema_editor.remove_constraint(User, EMAIL_CONSTRAINT)
+    schema_editor.add_index(User, EMAIL_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Bugs', '0007_user_email_upper_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_email_constraint, remove_email_constraint),
+    ]
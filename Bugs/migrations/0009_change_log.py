@@ -0,0 +1,29 @@
+# Generated by Django 4.0.1 on 2026-10-17 02:26
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Bugs', '0008_unique_user_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('bug', 'bug'), ('comment', 'comment')], max_length=7)),
+                ('object_id', models.BigIntegerField()),
+                ('bug_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('created', 'created'), ('updated', 'updated'), ('deleted', 'deleted')], max_length=7)),
+                ('at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['at'], name='change_at_idx'),
+        ),
+    ]
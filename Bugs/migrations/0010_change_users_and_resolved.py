@@ -0,0 +1,28 @@
+# Generated by Django 4.0.1 on 2026-10-17 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Bugs', '0009_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='assignee_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='change',
+            name='assigner_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='change',
+            name='action',
+            field=models.CharField(choices=[('created', 'created'), ('updated', 'updated'), ('resolved', 'resolved'), ('deleted', 'deleted')], max_length=8),
+        ),
+    ]
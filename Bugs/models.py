@@ -1,10 +1,14 @@
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.functional import cached_property
 
 
 # Create your models here.
 
+COMMENT_FIELDS = ('comment_count', 'last_comment_at')
+
 
 class Bug(models.Model):
     """
@@ -26,10 +30,60 @@ class Bug(models.Model):
     assigner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name="assigner")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # set when the bug is resolved, see Bugs.counters
+    resolved_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # kept up to date by CommentAPI, see Bugs.counters
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_comment_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        """
+            Each index matches one BugAPI access path: the default newest-first listing
+            (with id as the keyset tie-breaker) and each filter combined with that ordering.
+            The comment_count and last_comment_at indexes back the other list orderings.
+            The title index backs the title lookup of bulk requests (Bugs.bulk). Titles are
+            unique, except that any number of bugs can be created without one; the constraint
+            is what BugSerializer relies on to refuse a taken title.
+        """
+        indexes = [
+            models.Index(fields=['-updated_at', '-id'], name='bug_updated_idx'),
+            models.Index(fields=['resolved', '-updated_at'], name='bug_resolved_updated_idx'),
+            models.Index(fields=['assignee', '-updated_at'], name='bug_assignee_updated_idx'),
+            models.Index(fields=['assigner', '-updated_at'], name='bug_assigner_updated_idx'),
+            models.Index(fields=['-comment_count', '-id'], name='bug_comment_count_idx'),
+            models.Index(fields=['-last_comment_at', '-id'], name='bug_last_comment_idx'),
+            models.Index(fields=['title'], name='bug_title_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['title'], condition=~models.Q(title=''), name='unique_bug_title'),
+        ]
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        if update_fields is None and not self._state.adding and not force_insert:
+            # the comment fields are only written with F() updates, saving a bug must not
+            # overwrite them with the values it was loaded with
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.name not in COMMENT_FIELDS]
+        # the counters are updated by the save signals, in the same transaction as the bug
+        # and from its locked row. An error always propagates out of save, so a savepoint
+        # would only cost queries
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(force_insert=force_insert, force_update=force_update, using=using,
+                         update_fields=update_fields)
 
     @cached_property
     def comments(self):
-        return Comment.objects.filter(bug=self).order_by('-updated_at')
+        """
+            The newest comments on this bug with their authors, loaded in a single query.
+            Going through the reverse manager makes every comment.bug point back at this
+            instance instead of re-querying it. One comment past BUG_DETAIL_COMMENTS_LIMIT
+            is loaded so callers can tell whether there are more to fetch. A list of bugs
+            prefetches as many comments of each of them instead (see Bugs.fieldsets).
+        """
+        limit = settings.BUG_DETAIL_COMMENTS_LIMIT
+        if 'comment_set' in getattr(self, '_prefetched_objects_cache', {}):
+            return list(self.comment_set.all())[:limit + 1]
+        return list(self.comment_set.select_related('author').order_by('-updated_at')[:limit + 1])
 
 
 class Comment(models.Model):
@@ -48,3 +102,62 @@ class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """
+            Comments are read per bug newest first for the bug detail view, and a title
+            can only be used once per author on a bug (CommentSerializer.unique_errors).
+        """
+        indexes = [
+            models.Index(fields=['bug', '-updated_at'], name='comment_bug_updated_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['bug', 'author', 'title'], name='unique_comment_title_per_author'),
+        ]
+
+
+class BugCounter(models.Model):
+    """
+        Running totals of bugs per assignee (null for unassigned bugs) and resolved status,
+        with the total time it took to resolve them. They are kept up to date on every bug
+        create/resolve/reassign/delete (see Bugs.counters), so the overall statistics are
+        read from a handful of rows instead of the bug table.
+    """
+    assignee = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name="bug_counters")
+    resolved = models.BooleanField()
+    count = models.BigIntegerField(default=0)
+    resolve_microseconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['assignee', 'resolved'], name='unique_bug_counter'),
+            models.UniqueConstraint(fields=['resolved'], condition=models.Q(assignee=None),
+                                    name='unique_unassigned_bug_counter'),
+        ]
+
+
+class Change(models.Model):
+    """
+        The change log behind /bugs/changes/: one row per write to a bug or a comment, the
+        row id being the change token. Rows only point at what changed, the current state is
+        read from the bug and comment tables, so deleted objects leave a compact tombstone.
+        Old rows are pruned after CHANGE_RETENTION_DAYS (see Bugs.changes).
+    """
+    BUG, COMMENT = 'bug', 'comment'
+    CREATED, UPDATED, RESOLVED, DELETED = 'created', 'updated', 'resolved', 'deleted'
+
+    kind = models.CharField(max_length=7, choices=((BUG, 'bug'), (COMMENT, 'comment')))
+    object_id = models.BigIntegerField()
+    # the bug itself, or the bug of the comment
+    bug_id = models.BigIntegerField()
+    action = models.CharField(max_length=8, choices=((CREATED, 'created'), (UPDATED, 'updated'),
+                                                     (RESOLVED, 'resolved'), (DELETED, 'deleted')))
+    at = models.DateTimeField(default=timezone.now)
+    # the users of the bug when it changed, the event stream is filtered on them (see Bugs.events)
+    assignee_id = models.IntegerField(null=True)
+    assigner_id = models.IntegerField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['at'], name='change_at_idx'),
+        ]
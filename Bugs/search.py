@@ -0,0 +1,152 @@
+"""
+    Full-text search over bug and comment titles/bodies.
+
+    Bugs_bug_fts and Bugs_comment_fts are SQLite FTS5 tables using the bug and comment
+    tables as external content, so the text is not stored twice. Triggers keep them in
+    sync on insert, update and delete (including bulk and cascade operations), and the
+    rebuild_search_index command rebuilds them from scratch. Migration 0003 creates them,
+    with bm25 weights ranking title matches above body matches.
+
+    SQLite migrations that alter the bug or comment table copy it into a new table, which
+    drops its triggers, so they are re-created after every migrate (see BugsConfig.ready).
+
+    FTS5 is SQLite specific: on other databases migration 0003 creates nothing and
+    /bugs/search/ answers 501 Not Implemented.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils.html import escape
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+FTS_TABLES = ('Bugs_bug_fts', 'Bugs_comment_fts')
+
+# the matches are delimited with control characters, which the text is escaped around
+# before they are turned into <mark> tags, so the user's markup is never returned as HTML
+MATCH_START, MATCH_END = '\x02', '\x03'
+SNIPPET = "snippet({table}, -1, char(2), char(3), '…', 16)"
+
+SEARCH_SQL = """
+    SELECT kind, id, bug_id, title, snippet, rank FROM (
+        SELECT * FROM (
+            SELECT 'bug' AS kind, rowid AS id, rowid AS bug_id, title, {bug_snippet} AS snippet, rank
+            FROM Bugs_bug_fts WHERE Bugs_bug_fts MATCH %s ORDER BY rank LIMIT %s
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'comment' AS kind, Bugs_comment_fts.rowid AS id, Bugs_comment.bug_id, Bugs_comment_fts.title,
+                   {comment_snippet} AS snippet, rank
+            FROM Bugs_comment_fts JOIN Bugs_comment ON Bugs_comment.id = Bugs_comment_fts.rowid
+            WHERE Bugs_comment_fts MATCH %s ORDER BY rank LIMIT %s
+        )
+    ) ORDER BY rank LIMIT %s OFFSET %s
+""".format(bug_snippet=SNIPPET.format(table='Bugs_bug_fts'), comment_snippet=SNIPPET.format(table='Bugs_comment_fts'))
+
+COUNT_SQL = """
+    SELECT (SELECT count(*) FROM Bugs_bug_fts WHERE Bugs_bug_fts MATCH %s)
+         + (SELECT count(*) FROM Bugs_comment_fts WHERE Bugs_comment_fts MATCH %s)
+"""
+
+
+class SearchUnavailable(APIException):
+    status_code = status.HTTP_501_NOT_IMPLEMENTED
+    default_detail = "Search is only available when the database is SQLite"
+    default_code = 'search_unavailable'
+
+
+def check_database():
+    """
+        This refuses to search when the database has no FTS5 index, see the module docstring
+    """
+    if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+        raise SearchUnavailable()
+
+
+def match_expression(query):
+    """
+        This turns free text into an FTS5 expression matching every word, so that
+        FTS5 operators and punctuation typed by the user cannot break the query.
+        The last word is matched as a prefix to support search-as-you-type.
+    :param query: the raw search text
+    :return: the FTS5 MATCH expression, empty when there is nothing to search for
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return ''
+    terms = ['"{}"'.format(word) for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class SearchResults:
+    """
+        A lazy sequence of ranked hits that Django's paginator can count and slice.
+        Each arm only ranks as many rows as the requested page reaches, which lets FTS5
+        use its top-N path instead of ranking every match.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+
+    def count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(COUNT_SQL, [self.expression, self.expression])
+            return cursor.fetchone()[0]
+
+    def __getitem__(self, item):
+        offset, stop = item.start or 0, item.stop
+        with connection.cursor() as cursor:
+            cursor.execute(SEARCH_SQL, [self.expression, stop, self.expression, stop, stop - offset, offset])
+            columns = [column[0] for column in cursor.description]
+            hits = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        for hit in hits:
+            hit['snippet'] = highlight(hit['snippet'])
+        return hits
+
+
+def highlight(snippet):
+    """
+    :return: the snippet as HTML, its text escaped and its matches in <mark> tags
+    """
+    return str(escape(snippet or '')).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def trigger_statements():
+    for table, source in (('Bugs_bug_fts', 'Bugs_bug'), ('Bugs_comment_fts', 'Bugs_comment')):
+        yield (
+            f"CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON {source} BEGIN "
+            f"INSERT INTO {table}(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+        )
+        yield (
+            f"CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON {source} BEGIN "
+            f"INSERT INTO {table}({table}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END"
+        )
+        # only title/body edits touch the index, resolving or reassigning a bug does not
+        yield (
+            f"CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF title, body ON {source} BEGIN "
+            f"INSERT INTO {table}({table}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+            f"INSERT INTO {table}(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+        )
+
+
+def ensure_triggers(using='default', **kwargs):
+    """
+        This re-creates any missing trigger, it is connected to post_migrate
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite' or not set(FTS_TABLES) <= set(db.introspection.table_names()):
+        return
+    with db.cursor() as cursor:
+        for statement in trigger_statements():
+            cursor.execute(statement)
+
+
+def rebuild_index(using=connection):
+    """
+        This re-reads every bug and comment into the search index and merges its segments
+    """
+    with using.cursor() as cursor:
+        for table in FTS_TABLES:
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
@@ -1,11 +1,79 @@
+from django.conf import settings
 from django.contrib.auth import login, logout
 from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.contrib.auth.password_validation import get_password_validators, validate_password as validate_pass
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Value, When
+from django.db.models.functions import Upper
+from django.urls import reverse
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
+from rest_framework.settings import api_settings
+from rest_framework.utils.serializer_helpers import ReturnDict
 
+from Bugs import counters
+from Bugs.fieldsets import FieldsetSerializerMixin
 from Bugs.models import Bug, Comment
-from bug import settings
+from Utilities import passwords
+from Utilities.metrics import TimedSerializerMixin
+
+
+EMAIL_TAKEN = "A user already exists with this email address"
+
+
+def users_with_email(email):
+    """
+        This matches email addresses case-insensitively, on the index of the unique_user_email
+        constraint, which leaves blank emails out
+    :return: the users with this email address, the one with the exact spelling first
+    """
+    users = User.objects.annotate(email_upper=Upper('email')).filter(email_upper=Upper(Value(email)))
+    return users.exclude(email='').order_by(Case(When(email=email, then=0), default=1), 'id')
+
+
+def unique_markers(model, fields, name):
+    """
+        This lists what identifies a unique constraint in an IntegrityError: PostgreSQL and
+        MySQL name the constraint, SQLite names its columns (or its index, for an expression)
+    """
+    table = model._meta.db_table
+    columns = ', '.join(f'{table}.{model._meta.get_field(field).column}' for field in fields)
+    return (name, f'UNIQUE constraint failed: {columns}') if columns else (name,)
+
+
+def unique_field_markers(model, field):
+    """
+        This lists what identifies the constraint of a unique=True field in an IntegrityError:
+        PostgreSQL names it <table>_<column>_key, MySQL names its key after the column
+        ('<table>.<column>' since 8.0.19)
+    """
+    table, column = model._meta.db_table, model._meta.get_field(field).column
+    return unique_markers(model, (field,), f'{table}_{column}_key') + (
+        f"for key '{column}'", f"for key '{table}.{column}'")
+
+
+class UniqueConstraintSerializerMixin:
+    """
+        Uniqueness is left to the database constraints instead of being checked with a query
+        before writing, which is a round trip and lets concurrent writers through. The write
+        runs in a transaction (a savepoint when one is open already) and a violation of a
+        constraint in unique_errors is raised as the validation error the serializer would
+        have returned.
+    """
+    # (markers from unique_markers, field, message)
+    unique_errors = ()
+
+    def save(self, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError as error:
+            for markers, field, message in self.unique_errors:
+                if any(marker in str(error) for marker in markers):
+                    raise serializers.ValidationError(ReturnDict({field: [message]}, serializer=self))
+            raise
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -17,11 +85,36 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ("id", "first_name", "last_name", "username", "email")
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+        This looks the user up in the users preloaded into the context by bulk requests,
+        and falls back to querying the database for a single request
+    """
+
+    def to_internal_value(self, data):
+        users = self.context.get('users')
+        if users is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = User._meta.pk.to_python(data)
+        except DjangoValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in users:
+            self.fail('does_not_exist', pk_value=data)
+        return users[pk]
+
+
+class CommentSerializer(TimedSerializerMixin, UniqueConstraintSerializerMixin, serializers.ModelSerializer):
     """
         This serializer is used to create comments
     """
     author = serializers.CharField(source="author.username", read_only=True)
+    unique_errors = (
+        (unique_markers(Comment, ('bug', 'author', 'title'), 'unique_comment_title_per_author'),
+         api_settings.NON_FIELD_ERRORS_KEY, "You already made a comment with this title"),
+    )
 
     class Meta:
         model = Comment
@@ -29,12 +122,14 @@ class CommentSerializer(serializers.ModelSerializer):
 
     def validate(self, initial_data):
         initial_data['author'] = self.context.get('user')
-        check = Comment.objects.filter(title=initial_data['title'], bug=initial_data['bug'], author=initial_data['author'])
-        check = check.exclude(id=self.instance.id) if self.instance else check
-        if check.exists():
-            raise serializers.ValidationError(detail="You already made a comment with this title")
         return initial_data
 
+    def create(self, validated_data):
+        # in the transaction of save, so the comment and its count are written together
+        comment = super().create(validated_data)
+        counters.comment_added(comment)
+        return comment
+
 
 class CommentListSerializer(CommentSerializer):
     """
@@ -43,20 +138,26 @@ class CommentListSerializer(CommentSerializer):
     bug = serializers.CharField(source="bug.title")
 
 
-class BugSerializer(serializers.ModelSerializer):
+class BugSerializer(UniqueConstraintSerializerMixin, serializers.ModelSerializer):
     """
         This serializer is used to create a bug
     """
     resolved = serializers.BooleanField(read_only=True)
+    assignee = UserPrimaryKeyRelatedField(queryset=User.objects.all(), allow_null=True, required=False)
+    unique_errors = (
+        (unique_markers(Bug, ('title',), 'unique_bug_title'), 'title', "A bug with this title already exists"),
+    )
 
     class Meta:
         model = Bug
         exclude = ('assigner',)
 
     def validate_title(self, value):
-        check = Bug.objects.filter(title=value)
-        check = check.exclude(id=self.instance.id) if self.instance else check
-        if check.exists():
+        # bulk requests preload the id of the bug owning each title they use, a single bug
+        # is checked by the unique_bug_title constraint when it is saved
+        titles = self.context.get('titles')
+        owner = titles.get(value) if titles is not None else None
+        if owner is not None and not (self.instance and owner == self.instance.id):
             raise serializers.ValidationError(detail="A bug with this title already exists")
         return value
 
@@ -93,53 +194,173 @@ class UpdateBugSerializer(BugSerializer):
     resolved = serializers.BooleanField(required=False)
 
 
-class BugDetailSerializer(serializers.ModelSerializer):
+class BugDetailSerializer(TimedSerializerMixin, FieldsetSerializerMixin, serializers.ModelSerializer):
     """
-        This serializer is used to display bug details
+        This serializer is used to display bug details, the fieldset of a request can
+        prune its fields (see Bugs.fieldsets)
     """
     assigner = UserSerializer(read_only=True)
     assignee = UserSerializer(read_only=True)
-    comments = serializers.ListSerializer(child=CommentListSerializer(), read_only=True)
+    comments = serializers.SerializerMethodField()
+    more_comments = serializers.SerializerMethodField()
+    expandable_fields = {
+        'assigner': lambda: {'assigner': UserSerializer(read_only=True)},
+        'assignee': lambda: {'assignee': UserSerializer(read_only=True)},
+        'comments': lambda: {'comments': serializers.SerializerMethodField(),
+                             'more_comments': serializers.SerializerMethodField()},
+    }
 
     class Meta:
         model = Bug
         fields = '__all__'
 
     def get_comments(self, obj):
-        return CommentListSerializer(obj.comments, many=True).data
+        return CommentListSerializer(obj.comments[:settings.BUG_DETAIL_COMMENTS_LIMIT], many=True).data
+
+    def get_more_comments(self, obj):
+        # this points to the paginated comments of the bug when not all of them are embedded
+        if len(obj.comments) > settings.BUG_DETAIL_COMMENTS_LIMIT:
+            return reverse('bugs-comments', args=[obj.id])
+        return None
 
 
 class BugListSerializer(BugDetailSerializer):
     """
-        This serializer is used to display list of bugs
+        This serializer is used to display list of bugs, ?expand= renders the users and
+        comments like BugDetailSerializer
+    """
+    assignee = serializers.CharField(read_only=True)
+    assigner = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Bug
+        fields = ('id', 'title', 'resolved', 'assigner', 'assignee', 'comment_count', 'last_comment_at')
+
+
+class BulkUpdateBugSerializer(UpdateBugSerializer):
+    """
+        This serializer is used to document an item of a bulk update
+    """
+    id = serializers.IntegerField()
+
+
+class BulkResolveBugSerializer(serializers.Serializer):
+    """
+        This serializer is used to document an item of a bulk resolve
+    """
+    id = serializers.IntegerField()
+
+
+class BulkResultSerializer(serializers.Serializer):
+    """
+        This serializer is used to document the result of an item of a bulk request
+    """
+    index = serializers.IntegerField()
+    status = serializers.IntegerField()
+    data = BugListSerializer(required=False)
+    errors = serializers.DictField(required=False)
+
+
+class CommentExportSerializer(serializers.ModelSerializer):
+    """
+        This serializer is used to export the comments of a bug
+    """
+    author = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'title', 'body', 'author', 'created_at', 'updated_at')
+
+
+class BugExportSerializer(serializers.ModelSerializer):
+    """
+        This serializer is used to export a bug with the comments attached to it as export_comments
     """
     assignee = serializers.CharField(read_only=True)
     assigner = serializers.CharField(read_only=True)
+    comments = CommentExportSerializer(source='export_comments', many=True, read_only=True)
 
     class Meta:
         model = Bug
-        fields = ('id', 'title', 'resolved', 'assigner', 'assignee')
+        fields = ('id', 'title', 'body', 'resolved', 'assigner', 'assignee', 'created_at', 'updated_at', 'comments')
+
+
+class SearchResultSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+        This serializer is used to display a search hit, which is either a bug or a comment
+    """
+    kind = serializers.ChoiceField(choices=('bug', 'comment'))
+    id = serializers.IntegerField()
+    bug_id = serializers.IntegerField()
+    title = serializers.CharField()
+    snippet = serializers.CharField()
+    rank = serializers.FloatField()
 
 
-class SignupSerializer(serializers.ModelSerializer):
+class AssigneeStatsSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+        This serializer is used to display the bug statistics of an assignee, id is null for unassigned bugs
+    """
+    id = serializers.IntegerField(allow_null=True)
+    username = serializers.CharField(allow_null=True)
+    total = serializers.IntegerField()
+    open = serializers.IntegerField()
+    resolved = serializers.IntegerField()
+    mean_time_to_resolve = serializers.DurationField(allow_null=True)
+
+
+class BugStatsSerializer(AssigneeStatsSerializer):
+    """
+        This serializer is used to display the bug statistics
+    """
+    id = None
+    username = None
+    assignees = AssigneeStatsSerializer(many=True)
+
+
+class DeletedSerializer(serializers.Serializer):
+    """
+        This serializer is used to display the ids of the deleted bugs and comments
+    """
+    bug = serializers.ListField(child=serializers.IntegerField())
+    comment = serializers.ListField(child=serializers.IntegerField())
+
+
+class ChangesSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+        This serializer is used to display the bugs and comments changed after a change token,
+        the bugs without their comments
+    """
+    bugs = BugDetailSerializer(many=True)
+    comments = CommentSerializer(many=True)
+    deleted = DeletedSerializer()
+    next = serializers.IntegerField()
+    more = serializers.BooleanField()
+
+
+class StreamTokenSerializer(serializers.Serializer):
+    """
+        This serializer is used to display a token for opening the event stream
+    """
+    token = serializers.CharField()
+    expires_in = serializers.IntegerField()
+
+
+class SignupSerializer(UniqueConstraintSerializerMixin, serializers.ModelSerializer):
     """
         This serializer is used to create a new user account
     """
     password = serializers.CharField(write_only=True)
+    unique_errors = (
+        (unique_field_markers(User, 'username'), 'username', "A user already exists with this username"),
+        (unique_markers(User, (), 'unique_user_email'), 'email', EMAIL_TAKEN),
+    )
 
     class Meta:
         model = User
         fields = ("first_name", "last_name", "username", "email", "password")
-
-    def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError(detail="A user already exists with this email address")
-        return value
-
-    def validate_username(self, value):
-        if User.objects.filter(username=value).exists():
-            raise serializers.ValidationError(detail="A user already exists with this username")
-        return value
+        # the username and email are unique in the database, see unique_errors
+        extra_kwargs = {'username': {'validators': [UnicodeUsernameValidator()]}}
 
     def validate_password(self, value):
         validate_pass(
@@ -156,19 +377,23 @@ class SignupSerializer(serializers.ModelSerializer):
 
 class SigninSerializer(serializers.ModelSerializer):
     """
-        This serializer is used to sign in to an account
+        This serializer is used to sign in to an account. The password is checked within the
+        limits of Utilities.passwords. Token clients can send session=false
+        to skip the session login, which saves writing the session and last_login.
     """
+    session = serializers.BooleanField(write_only=True, required=False)
+
     class Meta:
         model = User
-        fields = ("email", "password")
+        fields = ("email", "password", "session")
 
     def validate(self, initial_data):
-        user = User.objects.filter(email=initial_data.pop('email')).first()
+        user = users_with_email(initial_data.pop('email')).first()
         # this checks if a user with this email exists
         if not user:
             raise serializers.ValidationError(detail="You dont have an account with us")
         # this checks if the password tallies with the user account
-        if user and not user.check_password(initial_data.pop('password')):
+        if not passwords.check_password(user, initial_data.pop('password')):
             raise serializers.ValidationError(detail="Invalid login credentials")
         if not user.is_active:
             raise serializers.ValidationError(detail="You cannot be logged in")
@@ -176,7 +401,8 @@ class SigninSerializer(serializers.ModelSerializer):
         return initial_data
 
     def create(self, validated_data):
-        login(self.context.get('request'), user=validated_data['user'])
+        if validated_data.get('session', settings.SIGNIN_SESSIONS):
+            login(self.context.get('request'), user=validated_data['user'])
         data = UserSerializer(validated_data['user']).data
         # this creates an auth token for the user to login with
         data['token'] = Token.objects.get_or_create(user=validated_data.pop('user'))[0].key
@@ -1,3 +1,1071 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import io
+import json
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from Bugs import bulk, changes, counters, events, list_cache, search
+from Bugs.models import Bug, BugCounter, Change, Comment
+from Utilities.authentication import TOKEN_CACHE, CachedTokenAuthentication
+from bug.asgi import application
 
 # Create your tests here.
+
+
+NO_LIST_CACHE = {**settings.CACHES, 'bug_lists': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+@override_settings(CACHES=NO_LIST_CACHE)
+class BugAPITestCase(TestCase):
+    """
+        Shared fixtures: an authenticated assigner and a couple of assignees.
+        Bug lists are not cached, see BugListCacheTest.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.assigner = User.objects.create_user(username="assigner", email="assigner@test.com", password="pass")
+        cls.assignees = [
+            User.objects.create_user(username=f"assignee{index}", email=f"assignee{index}@test.com", password="pass")
+            for index in range(3)
+        ]
+        cls.token = Token.objects.create(user=cls.assigner)
+
+    def setUp(self):
+        # the token is authenticated once up front, query counts below exclude authentication
+        caches[TOKEN_CACHE].clear()
+        CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def create_bugs(self, count, **kwargs):
+        start = Bug.objects.count()
+        bugs = Bug.objects.bulk_create([
+            Bug(title=f"bug {start + index}", body="body", assigner=self.assigner,
+                assignee=self.assignees[index % len(self.assignees)], **kwargs)
+            for index in range(count)
+        ])
+        counters.rebuild_counters()
+        return bugs
+
+
+class BugListQueryCountTest(BugAPITestCase):
+    """
+        The list endpoint must not load assigner/assignee once per row.
+        validators (max updated_at and count) + page select
+    """
+    LIST_QUERIES = 2
+
+    def test_list_query_count_is_constant(self):
+        self.create_bugs(2)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get('/bugs/')
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.create_bugs(30)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get('/bugs/')
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['results'][0]['assigner'], self.assigner.username)
+
+    def test_filtered_list_query_count_is_constant(self):
+        self.create_bugs(30)
+        self.create_bugs(5, resolved=True)
+        for query in ('?resolved=false', '?resolved=true', f'?assignee={self.assignees[0].id}',
+                      f'?assigner={self.assigner.id}&resolved=false'):
+            with self.subTest(query=query), self.assertNumQueries(self.LIST_QUERIES):
+                response = self.client.get(f'/bugs/{query}')
+            self.assertTrue(response.data['results'])
+
+
+@override_settings(BUG_DETAIL_COMMENTS_LIMIT=5)
+class BugDetailCommentsTest(BugAPITestCase):
+    """
+        Embedded comments are loaded with their authors in one query and capped.
+        validators + bug select + comments select
+    """
+    DETAIL_QUERIES = 3
+
+    def setUp(self):
+        super().setUp()
+        self.bug = self.create_bugs(1)[0]
+
+    def add_comments(self, count):
+        start = Comment.objects.count()
+        Comment.objects.bulk_create([
+            Comment(bug=self.bug, title=f"comment {start + index}", body="body",
+                    author=self.assignees[index % len(self.assignees)])
+            for index in range(count)
+        ])
+
+    def test_retrieve_query_count_is_constant(self):
+        self.add_comments(2)
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            response = self.client.get(f'/bugs/{self.bug.id}/')
+        self.assertEqual(len(response.data['comments']), 2)
+        self.assertIsNone(response.data['more_comments'])
+
+        self.add_comments(50)
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            response = self.client.get(f'/bugs/{self.bug.id}/')
+        self.assertEqual(len(response.data['comments']), 5)
+        self.assertEqual(response.data['comments'][0]['bug'], self.bug.title)
+        self.assertEqual(response.data['more_comments'], f'/bugs/{self.bug.id}/comments/')
+
+    def test_comments_are_paginated(self):
+        self.add_comments(25)
+        response = self.client.get(f'/bugs/{self.bug.id}/comments/')
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 20)
+
+
+@override_settings(BUG_DETAIL_COMMENTS_LIMIT=2)
+class BugFieldsetTest(BugAPITestCase):
+    """
+        ?fields=, ?exclude= and ?expand= decide what is rendered and what is read
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.bugs = self.create_bugs(3)
+        Comment.objects.bulk_create([Comment(bug=bug, title=f"comment {index}", body="body", author=self.assigner)
+                                     for bug in self.bugs for index in range(3)])
+
+    def selects(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+
+    def test_fields(self):
+        response, queries = self.selects(f'/bugs/{self.bugs[0].id}/?fields=id,title,resolved')
+        self.assertEqual(set(response.data), {'id', 'title', 'resolved'})
+        # validators + the bug, neither the users nor the comments are read
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('"body"', queries[-1])
+        self.assertNotIn('auth_user', queries[-1])
+
+        response, queries = self.selects('/bugs/?fields=id,title')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+        self.assertNotIn('auth_user', queries[-1])
+
+    def test_exclude(self):
+        response, queries = self.selects(f'/bugs/{self.bugs[0].id}/?exclude=body,comments')
+        self.assertNotIn('body', response.data)
+        self.assertNotIn('more_comments', response.data)
+        self.assertEqual(response.data['assigner']['username'], self.assigner.username)
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('"body"', queries[-1])
+
+    def test_list_never_reads_the_body(self):
+        response, queries = self.selects('/bugs/')
+        self.assertEqual(response.data['results'][0]['assigner'], self.assigner.username)
+        self.assertNotIn('"body"', queries[-1])
+
+    def test_expand(self):
+        Comment.objects.bulk_create([Comment(bug=self.bugs[-1], title=f"more {index}", body="body",
+                                             author=self.assigner) for index in range(10)])
+        with self.assertNumQueries(3), CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/bugs/?expand=assignee,comments')
+        # the comments query reads the newest BUG_DETAIL_COMMENTS_LIMIT + 1 of each bug, not all 13
+        self.assertIn('FROM "Bugs_comment"', queries[-1]['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(queries[-1]['sql'])
+            rows = cursor.fetchall()
+        self.assertEqual(len(rows), 3 * len(self.bugs))
+        bug = response.data['results'][0]
+        self.assertEqual(bug['assignee']['username'], self.bugs[-1].assignee.username)
+        self.assertEqual(bug['assigner'], self.assigner.username)
+        self.assertEqual(len(bug['comments']), 2)
+        self.assertEqual(bug['more_comments'], f'/bugs/{bug["id"]}/comments/')
+
+        self.create_bugs(10)
+        with self.assertNumQueries(3):
+            self.client.get('/bugs/?expand=comments')
+
+    def test_unknown_fields(self):
+        for query in ('fields=id,password', 'exclude=nope', 'expand=body', 'fields=comments'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/bugs/?{query}').status_code, 400)
+        self.assertEqual(self.client.get(f'/bugs/{self.bugs[0].id}/?fields=secret').status_code, 400)
+
+
+class BugKeysetPaginationTest(BugAPITestCase):
+    """
+        Opting into cursor pagination walks (updated_at, id) without offsets or counts
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.create_bugs(45)
+        self.create_bugs(5, resolved=True)
+        # rows updated at the same instant must still be ordered stably by id
+        Bug.objects.filter(id__in=Bug.objects.order_by('id').values('id')[10:30]).update(
+            updated_at=Bug.objects.order_by('id')[10].updated_at)
+
+    def walk(self, url, link='next'):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids += [bug['id'] for bug in response.data['results']]
+            url = response.data[link]
+        return ids
+
+    def test_cursor_walks_every_bug_once_in_order(self):
+        expected = list(Bug.objects.filter(resolved=False).order_by('-updated_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/bugs/?resolved=false&cursor='), expected)
+
+    def test_previous_link_walks_back(self):
+        first = self.client.get('/bugs/?cursor=').data
+        second = self.client.get(first['next']).data
+        self.assertIsNone(first['previous'])
+        previous = self.client.get(second['previous']).data
+        self.assertEqual(previous['results'], first['results'])
+
+    def test_page_query_count_is_independent_of_depth(self):
+        first = self.client.get('/bugs/?cursor=').data
+        # a single page select
+        with self.assertNumQueries(1):
+            second = self.client.get(first['next']).data
+        with self.assertNumQueries(1):
+            self.client.get(second['next'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/bugs/?cursor=not-a-cursor').status_code, 404)
+
+    def test_page_numbers_remain_the_default(self):
+        response = self.client.get('/bugs/?page=2')
+        self.assertEqual(response.data['count'], 50)
+
+
+class BugSearchTest(BugAPITestCase):
+    """
+        The search index follows bug and comment writes and ranks title matches first
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.login_bug = Bug.objects.create(title="Login page crashes", body="Stack trace attached",
+                                            assigner=self.assigner, assignee=self.assignees[0])
+        self.other_bug = Bug.objects.create(title="Slow dashboard", body="The login widget takes seconds",
+                                            assigner=self.assigner, assignee=self.assignees[1])
+        self.comment = Comment.objects.create(bug=self.other_bug, title="cause", body="crashes on empty cache",
+                                              author=self.assignees[1])
+
+    def search(self, query):
+        response = self.client.get('/bugs/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranked_hits_with_snippets(self):
+        results = self.search('login')['results']
+        self.assertEqual([(hit['kind'], hit['id']) for hit in results],
+                         [('bug', self.login_bug.id), ('bug', self.other_bug.id)])
+        self.assertIn('<mark>Login</mark>', results[0]['snippet'])
+
+    def test_snippets_escape_the_text(self):
+        Bug.objects.create(title="Injected", body="overflow <img src=x onerror=alert(1)>", assigner=self.assigner)
+        snippets = [hit['snippet'] for hit in self.search('overflow')['results']]
+        self.assertEqual(snippets, ['<mark>overflow</mark> &lt;img src=x onerror=alert(1)&gt;'])
+
+    def test_comments_are_searched(self):
+        results = self.search('crash')['results']
+        self.assertIn(('comment', self.comment.id, self.other_bug.id),
+                      [(hit['kind'], hit['id'], hit['bug_id']) for hit in results])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.login_bug.title = "Sign in page crashes"
+        self.login_bug.save()
+        self.assertEqual(self.search('sign in')['count'], 1)
+        self.assertEqual(self.search('login')['count'], 1)
+        self.other_bug.delete()
+        self.assertEqual(self.search('login')['count'], 0)
+        self.assertEqual(self.search('cache')['count'], 0)
+
+    def test_triggers_are_restored_after_migrations(self):
+        # SQLite drops the triggers of a table when a migration copies it into a new one
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER Bugs_bug_fts_insert")
+        search.ensure_triggers()
+        Bug.objects.create(title="Restored trigger", assigner=self.assigner)
+        self.assertEqual(self.search('restored')['count'], 1)
+
+    def test_pagination(self):
+        self.create_bugs(30)
+        data = self.search('body')
+        self.assertEqual(data['count'], 30)
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(len(self.client.get(data['next']).data['results']), 10)
+
+    def test_query_is_required_and_sanitised(self):
+        self.assertEqual(self.client.get('/bugs/search/', {'q': ' " * '}).status_code, 400)
+        self.assertEqual(self.search('"login" AND (')['count'], 0)
+        self.assertEqual(self.search('login" (')['count'], 2)
+
+    def test_only_sqlite_searches(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            self.assertEqual(self.client.get('/bugs/search/', {'q': 'login'}).status_code, 501)
+
+
+class BugExportTest(BugAPITestCase):
+    """
+        The export streams every matching bug with its comments in batches
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.bugs = self.create_bugs(7)
+        self.create_bugs(3, resolved=True)
+        Comment.objects.bulk_create([
+            Comment(bug=self.bugs[0], title=f"comment {index}", body="body", author=self.assignees[0])
+            for index in range(3)
+        ])
+
+    def export(self, query):
+        response = self.client.get(f'/bugs/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response, content = self.export('?resolved=false')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        bugs = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([bug['id'] for bug in bugs], [bug.id for bug in self.bugs])
+        self.assertEqual([comment['title'] for comment in bugs[0]['comments']], ["comment 0", "comment 1", "comment 2"])
+        self.assertEqual(bugs[0]['assigner'], self.assigner.username)
+
+    def test_csv(self):
+        response, content = self.export('?as=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        # three rows for the bug with comments, one for each of the other nine bugs
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows[0]['comment_title'], "comment 0")
+        self.assertEqual(rows[3]['comment_id'], "")
+
+    def test_bugs_are_read_in_batches(self):
+        with mock.patch('Bugs.export.EXPORT_BATCH_SIZE', 4):
+            response = self.client.get('/bugs/export/')
+            # every batch of four bugs costs a bug query and a comment query, plus the final empty batch
+            with self.assertNumQueries(3 * 2 + 1):
+                lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 10)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/bugs/export/?as=xml').status_code, 400)
+
+    async def test_export_over_asgi(self):
+        for query, lines in ((b'', 10), (b'as=csv', 13)):
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/bugs/export/', 'query_string': query,
+                     'headers': [(b'host', b'testserver'), (b'authorization', f"Token {self.token.key}".encode())]}
+            await application(scope, receive, send)
+            self.assertEqual(messages[0]['status'], 200)
+            body = b''.join(message.get('body', b'') for message in messages[1:])
+            self.assertEqual(len(body.splitlines()), lines)
+            self.assertFalse(messages[-1].get('more_body', False))
+
+
+class UniqueConstraintTest(BugAPITestCase):
+    """
+        Duplicates are refused by the database constraints, with the same errors as before
+        and without a lookup query ahead of the write
+    """
+
+    def post(self, path, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(path, data, format='json')
+        lookups = [query['sql'] for query in queries if query['sql'].startswith('SELECT') and '"title" =' in query['sql']]
+        self.assertEqual(lookups, [])
+        return response
+
+    def test_bug_title(self):
+        bug = self.create_bugs(2)[0]
+        response = self.post('/bugs/', {"title": bug.title})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"title": ["A bug with this title already exists"]})
+        self.assertEqual(Bug.objects.count(), 2)
+        self.assertEqual(self.post('/bugs/', {"body": "untitled"}).status_code, 201)
+        self.assertEqual(self.post('/bugs/', {"body": "untitled"}).status_code, 201)
+
+        response = self.client.patch(f'/bugs/{bug.id}/', {"title": "bug 1"}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"title": ["A bug with this title already exists"]})
+        self.assertEqual(self.client.patch(f'/bugs/{bug.id}/', {"title": bug.title}).status_code, 200)
+
+    def test_comment_title(self):
+        bug = self.create_bugs(1)[0]
+        self.assertEqual(self.post('/comments/', {"bug": bug.id, "title": "same", "body": "body"}).status_code, 201)
+        response = self.post('/comments/', {"bug": bug.id, "title": "same", "body": "body"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], "You already made a comment with this title")
+        bug.refresh_from_db()
+        self.assertEqual(bug.comment_count, 1)
+
+
+class BugBulkTest(BugAPITestCase):
+    """
+        Bulk requests validate in a fixed number of queries and report on every item
+    """
+
+    def test_bulk_create(self):
+        self.create_bugs(1)
+        items = [{"title": f"new bug {index}", "body": "body", "assignee": self.assignees[index % 3].id}
+                 for index in range(20)]
+        items += [
+            {"title": "bug 0"},
+            {"title": "new bug 0"},
+            {"title": "self assigned", "assignee": self.assigner.id},
+            {"title": "unknown assignee", "assignee": 9999},
+            {"body": "untitled"},
+            {"body": "untitled"},
+        ]
+        BugCounter.objects.bulk_create([BugCounter(assignee=assignee, resolved=False)
+                                        for assignee in self.assignees + [None]], ignore_conflicts=True)
+        # users, titles, savepoint, insert, one update per assignee's counter (3 + unassigned), changes, release
+        with self.assertNumQueries(10):
+            response = self.client.post('/bugs/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 207)
+        statuses = [result['status'] for result in response.data]
+        self.assertEqual(statuses, [201] * 20 + [400] * 4 + [201] * 2)
+        self.assertEqual(response.data[20]['errors'], {"title": ["A bug with this title already exists"]})
+        self.assertEqual(response.data[21]['errors'], {"title": ["A bug with this title already exists"]})
+        self.assertIn('assignee', response.data[23]['errors'])
+        self.assertEqual(response.data[0]['data']['assignee'], self.assignees[0].username)
+        self.assertEqual(Bug.objects.filter(assigner=self.assigner).count(), 23)
+
+    def test_blank_titles_are_not_duplicates(self):
+        Bug.objects.create(title="", assigner=self.assigner)
+        response = self.client.post('/bugs/bulk/', [{"title": ""}, {"body": "w"}, {"title": ""}], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Bug.objects.filter(title="").count(), 4)
+
+    def test_titles_taken_while_validating(self):
+        preload_context = bulk.preload_context
+
+        def preload_then_take(items, **context):
+            # another request takes the title of the first item once it was preloaded
+            context = preload_context(items, **context)
+            Bug.objects.create(title=items[0]['title'], assigner=self.assignees[0])
+            return context
+
+        with mock.patch('Bugs.bulk.preload_context', preload_then_take):
+            response = self.client.post('/bugs/bulk/', [{"title": "taken"}, {"title": "free"}], format='json')
+            self.assertEqual(response.status_code, 207)
+            self.assertEqual(response.data[0]['errors'], {"title": ["A bug with this title already exists"]})
+            self.assertEqual(response.data[1]['data']['title'], "free")
+
+            bug = Bug.objects.get(title="free")
+            response = self.client.patch('/bugs/bulk/', [{"id": bug.id, "title": "taken again"}], format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data[0]['errors'], {"title": ["A bug with this title already exists"]})
+        self.assertEqual(list(Bug.objects.filter(assigner=self.assigner).values_list('title', flat=True)), ["free"])
+
+    def test_bulk_update(self):
+        bugs = self.create_bugs(3)
+        other = Bug.objects.create(title="not mine", assigner=self.assignees[0], assignee=self.assignees[1])
+        response = self.client.patch('/bugs/bulk/', [
+            {"id": bugs[0].id, "title": "renamed", "assignee": self.assignees[2].id},
+            {"id": bugs[1].id, "body": "new body"},
+            {"id": bugs[2].id, "title": "bug 0"},
+            {"id": other.id, "body": "hijacked"},
+            {"id": 9999, "body": "missing"},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data], [200, 200, 400, 400, 404])
+        bugs[0].refresh_from_db()
+        self.assertEqual((bugs[0].title, bugs[0].assignee), ("renamed", self.assignees[2]))
+        self.assertGreater(Bug.objects.get(id=bugs[1].id).updated_at, bugs[1].updated_at)
+        self.assertEqual(Bug.objects.get(id=other.id).body, "")
+
+    def test_bulk_resolve_as_assignee(self):
+        bugs = self.create_bugs(3)
+        token = Token.objects.create(user=self.assignees[0])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        response = self.client.post('/bugs/bulk/resolve/', [{"id": bug.id} for bug in bugs], format='json')
+        # only the first bug is assigned to assignee0
+        self.assertEqual([result['status'] for result in response.data], [200, 400, 400])
+        self.assertEqual(list(Bug.objects.filter(resolved=True).values_list('id', flat=True)), [bugs[0].id])
+
+    def test_payload_must_be_a_list(self):
+        response = self.client.post('/bugs/bulk/', {"title": "not a list"}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class BugConditionalGetTest(BugAPITestCase):
+    """
+        Unchanged bugs are answered with 304 from a single query
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.bugs = self.create_bugs(25)
+
+    def assertNotModified(self, url, **headers):
+        # the validators query only
+        with self.assertNumQueries(1):
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_list(self):
+        url = f'/bugs/?assignee={self.assignees[0].id}'
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(self.client.get('/bugs/?page=2')['ETag'], self.client.get('/bugs/')['ETag'])
+
+        self.bugs[1].save()
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+        self.bugs[0].save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_changes_when_a_bug_is_deleted(self):
+        etag = self.client.get('/bugs/')['ETag']
+        self.bugs[3].delete()
+        self.assertEqual(self.client.get('/bugs/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_changes_when_a_comment_is_added_or_removed(self):
+        response = self.client.get('/bugs/')
+        self.assertNotIn('Last-Modified', response)
+        comment = self.client.post('/comments/', {"bug": self.bugs[-1].id, "title": "c", "body": "b"}).data
+        response = self.client.get('/bugs/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['comment_count'], 1)
+
+        self.assertEqual(self.client.delete(f'/comments/{comment["id"]}/').status_code, 204)
+        response = self.client.get('/bugs/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['comment_count'], 0)
+
+    def test_list_changes_when_a_user_is_renamed_or_deleted(self):
+        etag = self.client.get('/bugs/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assignees[0].username = "renamed"
+            self.assignees[0].save()
+        response = self.client.get('/bugs/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("renamed", [bug['assignee'] for bug in response.data['results']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assignees[1].delete()
+        self.assertEqual(self.client.get('/bugs/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_detail(self):
+        url = f'/bugs/{self.bugs[0].id}/'
+        response = self.client.get(url)
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertNotIn('Last-Modified', response)
+
+        older = Comment.objects.create(bug=self.bugs[0], title="older", body="body", author=self.assigner)
+        Comment.objects.create(bug=self.bugs[0], title="comment", body="body", author=self.assigner)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+        # deleting an older comment moves no timestamp
+        older.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_detail_changes_when_a_user_is_renamed(self):
+        url = f'/bugs/{self.bugs[0].id}/'
+        etag = self.client.get(url)['ETag']
+        self.bugs[0].assignee.username = "renamed"
+        self.bugs[0].assignee.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['assignee']['username'], "renamed")
+
+    def test_missing_bug(self):
+        self.assertEqual(self.client.get('/bugs/9999/').status_code, 404)
+        self.assertEqual(self.client.get('/bugs/nope/').status_code, 404)
+
+
+@override_settings(CACHES={**NO_LIST_CACHE, 'bug_lists': settings.CACHES['bug_lists']})
+class BugListCacheTest(BugAPITestCase):
+    """
+        Rendered list pages are served from the cache until a write bumps the generation
+    """
+
+    def setUp(self):
+        super().setUp()
+        caches[list_cache.LIST_CACHE].clear()
+        self.bugs = self.create_bugs(25)
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertIn(response.status_code, (200, 304))
+        return response
+
+    def test_hit_skips_the_database(self):
+        miss = self.get('/bugs/?resolved=false&page=2')
+        self.assertEqual(miss['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            hit = self.get('/bugs/?page=2&resolved=false')
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(hit['ETag'], miss['ETag'])
+        self.assertEqual(self.get('/bugs/?resolved=false', HTTP_IF_NONE_MATCH=miss['ETag'])['X-Cache'], 'MISS')
+        self.assertEqual(self.get('/bugs/?resolved=false&page=2', HTTP_IF_NONE_MATCH=miss['ETag']).status_code, 304)
+        self.assertEqual(list_cache.stats()['hits'], 2)
+
+    def test_writes_invalidate(self):
+        self.get('/bugs/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bugs[0].title = "renamed"
+            self.bugs[0].save()
+        response = self.get('/bugs/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['title'], "renamed")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assignees[0].username = "renamed"
+            self.assignees[0].save()
+        self.assertEqual(self.get('/bugs/')['X-Cache'], 'MISS')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/bugs/bulk/', [{"id": self.bugs[1].id, "title": "bulk renamed"}], format='json')
+        self.assertEqual(self.get('/bugs/')['X-Cache'], 'MISS')
+
+    def test_evicted_generation_is_not_reused(self):
+        cache = caches[list_cache.LIST_CACHE]
+        self.get('/bugs/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bugs[0].save()
+        cache.delete(list_cache.GENERATION_KEY)
+        # the page cached before the write is never served again
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bugs[0].save()
+        self.assertEqual(self.get('/bugs/')['X-Cache'], 'MISS')
+        cache.delete(list_cache.GENERATION_KEY)
+        self.assertEqual(self.get('/bugs/')['X-Cache'], 'MISS')
+
+    def test_other_parameters_are_not_cached(self):
+        self.assertNotIn('X-Cache', self.get('/bugs/?unknown=1'))
+
+
+class BugChangesTest(BugAPITestCase):
+    """
+        /bugs/changes/ returns what changed after a token, whatever the size of the tables
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.bugs = self.create_bugs(3)
+        self.token = self.client.get('/bugs/changes/').data['next']
+
+    def changes(self, since, status_code=200):
+        response = self.client.get(f'/bugs/changes/?since={since}')
+        self.assertEqual(response.status_code, status_code)
+        return response.data
+
+    def test_changes_since_a_token(self):
+        self.assertEqual(self.changes(self.token)['bugs'], [])
+        created = self.client.post('/bugs/', {"title": "new"}, format='json').data
+        self.client.patch(f'/bugs/{created["id"]}/', {"body": "edited"}, format='json')
+        self.client.patch(f'/bugs/{created["id"]}/', {"body": "edited twice"}, format='json')
+        comment = self.client.post('/comments/', {"bug": self.bugs[0].id, "title": "c", "body": "b"}).data
+        self.client.delete(f'/bugs/{self.bugs[1].id}/')
+
+        with self.assertNumQueries(4):
+            data = self.changes(self.token)
+        self.assertEqual([bug['id'] for bug in data['bugs']], [self.bugs[0].id, created['id']])
+        self.assertEqual(data['bugs'][1]['body'], "edited twice")
+        self.assertEqual(data['bugs'][0]['comment_count'], 1)
+        self.assertNotIn('comments', data['bugs'][0])
+        self.assertEqual([item['id'] for item in data['comments']], [comment['id']])
+        self.assertEqual(data['deleted'], {'bug': [self.bugs[1].id], 'comment': []})
+        self.assertFalse(data['more'])
+        self.assertEqual(self.changes(data['next'])['bugs'], [])
+
+    def test_bulk_writes_and_pages(self):
+        self.client.post('/bugs/bulk/', [{"title": f"bulk {index}"} for index in range(3)], format='json')
+        self.client.post('/bugs/bulk/resolve/', [{"id": bug.id} for bug in self.bugs], format='json')
+        with override_settings(CHANGES_PAGE_SIZE=4):
+            first = self.changes(self.token)
+            second = self.changes(first['next'])
+        self.assertTrue(first['more'])
+        self.assertFalse(second['more'])
+        ids = {bug['id'] for bug in first['bugs'] + second['bugs']}
+        self.assertEqual(len(ids), 6)
+        self.assertTrue(all(bug['resolved'] for bug in second['bugs']))
+
+    def test_pruned_tokens_expire(self):
+        for title in ("a", "b", "c"):
+            self.client.post('/bugs/', {"title": title}, format='json')
+        Change.objects.update(at=timezone.now() - datetime.timedelta(days=60))
+        call_command('prune_changes', stdout=io.StringIO())
+        # the newest change is kept, so the latest tokens stay valid
+        newest = Change.objects.get().id
+        self.assertEqual(self.changes(newest)['bugs'], [])
+        self.assertEqual(self.changes(newest - 1)['bugs'][0]['title'], "c")
+        self.changes(newest - 2, status_code=410)
+        self.changes('soon', status_code=400)
+
+    def test_deleting_a_user_records_their_bugs_and_comments(self):
+        comment = Comment.objects.create(bug=self.bugs[1], title="c", body="b", author=self.assignees[0])
+        token = self.client.get('/bugs/changes/').data['next']
+        self.assignees[0].delete()
+        data = self.changes(token)
+        # the bug of the comment comes along, its comment changed
+        self.assertEqual([(bug['id'], bug['assignee']) for bug in data['bugs']][:1], [(self.bugs[0].id, None)])
+        self.assertEqual([bug['id'] for bug in data['bugs']][1:], [self.bugs[1].id])
+        self.assertEqual([item['id'] for item in data['comments']], [comment.id])
+        self.assertIsNone(Change.objects.get(kind=Change.BUG, id__gt=token).assignee_id)
+
+    def test_only_sqlite_hands_out_tokens(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            self.changes(self.token, status_code=501)
+
+
+class BugStatsTest(BugAPITestCase):
+    """
+        The statistics are read from the counters, which follow every write to the bugs
+    """
+
+    def counter_totals(self):
+        return {(counter.assignee_id, counter.resolved): (counter.count, counter.resolve_microseconds)
+                for counter in BugCounter.objects.exclude(count=0)}
+
+    def assertCountersMatchBugs(self):
+        totals = self.counter_totals()
+        counters.rebuild_counters()
+        self.assertEqual(totals, self.counter_totals())
+
+    def test_stats(self):
+        bugs = self.create_bugs(6)
+        Bug.objects.create(title="unassigned", assigner=self.assigner)
+        resolved = [bugs[0].id, bugs[3].id, bugs[1].id]
+        for index, pk in enumerate(resolved):
+            Bug.objects.filter(id=pk).update(
+                resolved=True, resolved_at=F('created_at') + datetime.timedelta(hours=index + 1))
+        counters.rebuild_counters()
+        with self.assertNumQueries(1):
+            response = self.client.get('/bugs/stats/')
+        self.assertEqual((response.data['total'], response.data['open'], response.data['resolved']), (7, 4, 3))
+        self.assertEqual(response.data['mean_time_to_resolve'], '02:00:00')
+        assignees = {stats['username']: stats for stats in response.data['assignees']}
+        self.assertEqual(assignees['assignee0']['resolved'], 2)
+        self.assertEqual(assignees['assignee0']['mean_time_to_resolve'], '01:30:00')
+        self.assertEqual(assignees['assignee2']['mean_time_to_resolve'], None)
+        self.assertEqual((assignees[None]['id'], assignees[None]['open']), (None, 1))
+
+    def test_filters(self):
+        self.create_bugs(4)
+        Bug.objects.create(title="assigned by someone else", assigner=self.assignees[0], assignee=self.assignees[1])
+        response = self.client.get('/bugs/stats/', {'assignee': self.assignees[1].id})
+        self.assertEqual(response.data['total'], 2)
+        response = self.client.get('/bugs/stats/', {'assigner': self.assigner.id, 'resolved': 'false'})
+        self.assertEqual(response.data['total'], 4)
+        self.assertEqual([stats['open'] for stats in response.data['assignees']], [2, 1, 1])
+
+    def test_counters_follow_writes(self):
+        response = self.client.post('/bugs/', {"title": "new", "body": "body", "assignee": self.assignees[0].id})
+        pk = response.data['id']
+        self.assertCountersMatchBugs()
+        self.client.patch(f'/bugs/{pk}/', {"assignee": self.assignees[1].id})
+        self.assertCountersMatchBugs()
+        self.client.patch(f'/bugs/{pk}/', {"resolved": True})
+        self.assertIsNotNone(Bug.objects.get(id=pk).resolved_at)
+        self.assertCountersMatchBugs()
+        self.client.patch(f'/bugs/{pk}/', {"resolved": False})
+        self.assertIsNone(Bug.objects.get(id=pk).resolved_at)
+        self.client.post('/bugs/bulk/resolve/', [{"id": pk}], format='json')
+        self.assertCountersMatchBugs()
+        self.client.delete(f'/bugs/{pk}/')
+        self.assertEqual(self.counter_totals(), {})
+
+    def test_concurrent_writes_do_not_drift(self):
+        bug = self.create_bugs(1)[0]
+        # two requests load the bug before either saves it
+        first, second = Bug.objects.get(id=bug.id), Bug.objects.get(id=bug.id)
+        first.resolved = second.resolved = True
+        first.save()
+        second.save()
+        self.assertCountersMatchBugs()
+        first.delete()
+        second.delete()
+        self.assertEqual(self.counter_totals(), {})
+
+    def test_deleting_an_assignee_moves_their_bugs(self):
+        self.create_bugs(3)
+        self.assignees[0].delete()
+        self.assertCountersMatchBugs()
+        self.assertEqual(self.counter_totals()[(None, False)], (1, 0))
+
+    def test_repair_command(self):
+        self.create_bugs(3)
+        BugCounter.objects.update(count=100)
+        call_command('rebuild_bug_counters', stdout=io.StringIO())
+        self.assertEqual(sum(count for count, _ in self.counter_totals().values()), 3)
+
+
+class BugCommentCountTest(BugAPITestCase):
+    """
+        Bugs carry their comment count and last comment time, maintained by CommentAPI
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.bugs = self.create_bugs(3)
+
+    def comment(self, bug, title):
+        response = self.client.post('/comments/', {"bug": bug.id, "title": title, "body": "body"})
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def test_comments_are_counted(self):
+        first = self.comment(self.bugs[0], "first")
+        second = self.comment(self.bugs[0], "second")
+        bug = Bug.objects.get(id=self.bugs[0].id)
+        self.assertEqual(bug.comment_count, 2)
+        self.assertEqual(bug.last_comment_at, Comment.objects.get(id=second).updated_at)
+        self.assertEqual(self.client.delete(f'/comments/{second}/').status_code, 204)
+        bug.refresh_from_db()
+        self.assertEqual((bug.comment_count, bug.last_comment_at), (1, Comment.objects.get(id=first).updated_at))
+        self.client.delete(f'/comments/{first}/')
+        bug.refresh_from_db()
+        self.assertEqual((bug.comment_count, bug.last_comment_at), (0, None))
+
+    def test_saving_a_bug_keeps_its_comment_count(self):
+        bug = Bug.objects.get(id=self.bugs[0].id)
+        self.comment(bug, "while the bug is loaded")
+        bug.body = "edited"
+        bug.save()
+        bug.refresh_from_db()
+        self.assertEqual((bug.body, bug.comment_count), ("edited", 1))
+
+    def test_ordering(self):
+        for index in range(3):
+            self.comment(self.bugs[1], f"comment {index}")
+        self.comment(self.bugs[2], "comment")
+        with self.assertNumQueries(BugListQueryCountTest.LIST_QUERIES):
+            response = self.client.get('/bugs/', {'ordering': '-comment_count'})
+        self.assertEqual([(bug['id'], bug['comment_count']) for bug in response.data['results']],
+                         [(self.bugs[1].id, 3), (self.bugs[2].id, 1), (self.bugs[0].id, 0)])
+        response = self.client.get('/bugs/', {'ordering': '-last_comment_at'})
+        self.assertEqual(response.data['results'][0]['id'], self.bugs[2].id)
+        self.assertEqual(self.client.get('/bugs/', {'ordering': 'body'}).status_code, 400)
+        self.assertEqual(self.client.get('/bugs/', {'ordering': 'comment_count', 'cursor': ''}).status_code, 400)
+
+    def test_repair_command(self):
+        self.comment(self.bugs[0], "comment")
+        Bug.objects.update(comment_count=10, last_comment_at=None)
+        call_command('rebuild_bug_counters', stdout=io.StringIO())
+        self.assertEqual(list(Bug.objects.order_by('id').values_list('comment_count', flat=True)), [1, 0, 0])
+        self.assertIsNotNone(Bug.objects.get(id=self.bugs[0].id).last_comment_at)
+
+
+@override_settings(ROOT_URLCONF='bug.asgi_urls', CACHES={**NO_LIST_CACHE, 'bug_lists': settings.CACHES['bug_lists']})
+class BugAsyncViewsTest(BugAPITestCase):
+    """
+        Over ASGI the bug reads go through Bugs.async_views and answer exactly like BugAPI
+    """
+
+    def setUp(self):
+        super().setUp()
+        caches[list_cache.LIST_CACHE].clear()
+        self.bugs = self.create_bugs(3)
+        self.async_client = AsyncClient()
+        # the async client sends its extra arguments as headers
+        self.auth = {'AUTHORIZATION': f"Token {self.token.key}"}
+
+    async def test_reads_match_the_sync_views(self):
+        for url in ('/bugs/?resolved=false', f'/bugs/{self.bugs[0].id}/', f'/bugs/{self.bugs[0].id}/comments/',
+                    '/bugs/stats/'):
+            with self.subTest(url=url):
+                with self.settings(ROOT_URLCONF='bug.urls'):
+                    expected = await sync_to_async(self.client.get)(url)
+                response = await self.async_client.get(url, **self.auth)
+                self.assertEqual((response.status_code, response.content), (200, expected.content))
+
+    async def test_cached_page_skips_the_view(self):
+        miss = await self.async_client.get('/bugs/', **self.auth)
+        self.assertEqual(miss['X-Cache'], 'MISS')
+        with mock.patch('Bugs.async_views.bug_list_view', side_effect=AssertionError):
+            hit = await self.async_client.get('/bugs/', **self.auth)
+        self.assertEqual((hit['X-Cache'], hit.content), ('HIT', miss.content))
+        self.assertEqual(await sync_to_async(list_cache.stats)(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    async def test_writes_and_anonymous_requests_reach_the_view(self):
+        self.assertEqual((await self.async_client.get('/bugs/')).status_code, 401)
+        response = await self.async_client.post('/bugs/', {"title": "async", "body": "body"},
+                                                content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 201)
+        response = await self.async_client.patch(f'/bugs/{self.bugs[0].id}/', {"body": "edited"},
+                                                 content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(SSE_POLL_INTERVAL=0.01)
+class BugEventsTest(BugAPITestCase):
+    """
+        /bugs/events/ streams the change log to ASGI clients, see Bugs.events
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.messages = []
+        self.received = asyncio.Queue()
+        self.gate = None
+
+    async def send(self, message):
+        if self.gate is not None:
+            await self.gate.wait()
+        self.messages.append(message)
+
+    async def receive(self):
+        return await self.received.get()
+
+    def connect(self, query='', last_event_id=None, headers=None):
+        if headers is None:
+            headers = [(b'authorization', f"Token {self.token.key}".encode())]
+        if last_event_id is not None:
+            headers.append((b'last-event-id', str(last_event_id).encode()))
+        scope = {'type': 'http', 'method': 'GET', 'path': events.EVENTS_PATH, 'query_string': query.encode(),
+                 'headers': headers}
+        return asyncio.ensure_future(application(scope, self.receive, self.send))
+
+    async def disconnect(self, stream):
+        await self.received.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(stream, 5)
+        # the broker stops once it has no client left, before the event loop of the test closes
+        if events.broker.task is not None:
+            await asyncio.wait_for(events.broker.task, 5)
+
+    async def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("timed out")
+
+    def streamed(self):
+        body = b''.join(message.get('body', b'') for message in self.messages).decode()
+        return [dict(line.split(': ', 1) for line in block.splitlines())
+                for block in body.split('\n\n') if block.startswith('id: ')]
+
+    async def post_bug(self, title, assignee):
+        response = await sync_to_async(self.client.post)('/bugs/', {"title": title, "assignee": assignee.id},
+                                                         format='json')
+        return response.data['id']
+
+    async def test_token_is_required(self):
+        scope = {'type': 'http', 'method': 'GET', 'path': events.EVENTS_PATH, 'query_string': b'', 'headers': []}
+        await application(scope, self.receive, self.send)
+        self.assertEqual(self.messages[0]['status'], 401)
+        self.assertFalse(json.loads(self.messages[1]['body'])['status'])
+
+    async def opened(self, query='', headers=()):
+        """
+        :return: the status and headers the stream opened with
+        """
+        self.messages = []
+        stream = self.connect(query, headers=list(headers))
+        await self.wait_for(lambda: self.messages)
+        if self.messages[0]['status'] == 200:
+            await self.disconnect(stream)
+        return self.messages[0]['status'], dict(self.messages[0]['headers'])
+
+    async def test_stream_token_in_the_query(self):
+        response = await sync_to_async(self.client.post)('/bugs/events/token/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['expires_in'], settings.SSE_TOKEN_SECONDS)
+        token = response.data['token']
+        # the API token cannot be read back from the stream token
+        self.assertNotIn(self.token.key, token)
+
+        self.assertEqual((await self.opened(f'token={token}'))[0], 200)
+        self.assertEqual((await self.opened(f'token={token}x'))[0], 401)
+        # expired
+        with override_settings(SSE_TOKEN_SECONDS=-1):
+            self.assertEqual((await self.opened(f'token={token}'))[0], 401)
+        await sync_to_async(self.client.post)('/auth/signout/')
+        self.assertEqual((await self.opened(f'token={token}'))[0], 401)
+
+    @override_settings(CORS_ALLOWED_ORIGINS=['http://localhost:4000'])
+    async def test_cors_headers(self):
+        authorization = (b'authorization', f"Token {self.token.key}".encode())
+        status, headers = await self.opened(headers=[authorization, (b'origin', b'http://localhost:4000')])
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'access-control-allow-origin'], b'http://localhost:4000')
+        status, headers = await self.opened(headers=[(b'origin', b'http://localhost:4000')])
+        self.assertEqual(status, 401)
+        self.assertEqual(headers[b'access-control-allow-origin'], b'http://localhost:4000')
+        status, headers = await self.opened(headers=[authorization, (b'origin', b'http://elsewhere.test')])
+        self.assertNotIn(b'access-control-allow-origin', headers)
+
+    async def test_changes_are_streamed_to_matching_clients(self):
+        stream = self.connect(f'assignee={self.assignees[0].id}')
+        await self.wait_for(lambda: len(self.messages) == 2)
+        self.assertEqual(self.messages[0]['status'], 200)
+        self.assertEqual(self.messages[1]['body'], b'retry: 3000\n\n')
+
+        bug = await self.post_bug("streamed", self.assignees[0])
+        await self.post_bug("someone else's", self.assignees[1])
+        await sync_to_async(self.client.patch)(f'/bugs/{bug}/', {"resolved": True}, format='json')
+        await sync_to_async(self.client.post)('/comments/', {"bug": bug, "title": "c", "body": "b"})
+        await self.wait_for(lambda: len(self.streamed()) == 3)
+        await self.disconnect(stream)
+
+        streamed = self.streamed()
+        self.assertEqual([event['event'] for event in streamed], ['bug.created', 'bug.resolved', 'comment.created'])
+        self.assertEqual({json.loads(event['data'])['bug'] for event in streamed}, {bug})
+        self.assertEqual(json.loads(streamed[0]['data'])['assignee'], self.assignees[0].id)
+
+    async def test_resumes_after_the_last_event_id(self):
+        first = await self.post_bug("seen", self.assignees[0])
+        second = await self.post_bug("missed", self.assignees[0])
+        seen = await sync_to_async(Change.objects.get)(object_id=first, kind=Change.BUG)
+        stream = self.connect(last_event_id=seen.id)
+        await self.wait_for(lambda: len(self.streamed()) == 1)
+        await self.disconnect(stream)
+        self.assertEqual(json.loads(self.streamed()[0]['data'])['bug'], second)
+
+    async def test_pruned_last_event_id_resets_the_client(self):
+        for title in ("a", "b", "c"):
+            await self.post_bug(title, self.assignees[0])
+        newest = await sync_to_async(changes.current_token)()
+        await sync_to_async(Change.objects.filter(id__lt=newest).delete)()
+        stream = self.connect(last_event_id=newest - 2)
+        await self.wait_for(lambda: any(b'event: reset' in message.get('body', b'') for message in self.messages))
+        await self.disconnect(stream)
+        self.assertEqual(self.streamed(), [])
+
+    @override_settings(SSE_CLIENT_BUFFER=2)
+    async def test_slow_clients_are_dropped(self):
+        self.gate = asyncio.Event()
+        stream = self.connect()
+        await self.wait_for(lambda: len(events.broker.clients) == 1)
+        for index in range(5):
+            await self.post_bug(f"burst {index}", self.assignees[0])
+        await self.wait_for(lambda: not events.broker.clients)
+        self.gate.set()
+        # the buffered events are sent before the stream ends, without waiting for a disconnect
+        await asyncio.wait_for(stream, 5)
+        self.assertEqual(len(self.streamed()), 2)
+        self.assertFalse(self.messages[-1].get('more_body', False))
+        await self.disconnect(stream)
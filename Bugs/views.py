@@ -1,26 +1,55 @@
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from drf_yasg import openapi
-from drf_yasg.utils import swagger_auto_schema
+from drf_yasg.utils import no_body, swagger_auto_schema
 from rest_framework import status
-from rest_framework.exceptions import APIException
+from rest_framework.authtoken.models import Token
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
-from Bugs import serializers
-from Bugs.models import Bug, Comment
+from Bugs import bulk, changes, conditional, counters, events, export, fieldsets, list_cache, search, serializers
+from Bugs.models import Bug, BugCounter, Comment
+from Utilities import replicas
+from Utilities.pagination import PageNumberOrKeysetPagination
 
 # Create your views here.
+BUG_LIST_ORDERINGS = ('-updated_at', 'updated_at', '-comment_count', 'comment_count', '-last_comment_at',
+                      'last_comment_at')
 resolved_query = openapi.Parameter(name="resolved", in_=openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN)
 assigner_query = openapi.Parameter(name="assigner", in_=openapi.IN_QUERY, type=openapi.TYPE_NUMBER)
 assignee_query = openapi.Parameter(name="assignee", in_=openapi.IN_QUERY, type=openapi.TYPE_NUMBER)
+export_format_query = openapi.Parameter(name="as", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                                        enum=list(export.EXPORT_FORMATS), default='ndjson')
+ordering_query = openapi.Parameter(name="ordering", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                                   enum=list(BUG_LIST_ORDERINGS), default='-updated_at')
+search_query = openapi.Parameter(name="q", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True)
+since_query = openapi.Parameter(name="since", in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                                description="the `next` token of the previous response")
+fields_query = openapi.Parameter(name="fields", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                                 description="comma separated fields to return, all of them by default")
+exclude_query = openapi.Parameter(name="exclude", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                                  description="comma separated fields not to return")
+expand_query = openapi.Parameter(name="expand", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                                 description="comma separated relations to return in full: assigner, assignee, "
+                                             "comments")
 
 
 class BugAPI(ModelViewSet):
     permission_classes = (IsAuthenticated,)
     serializer_class = serializers.BugDetailSerializer
-    queryset = Bug.objects.all().order_by('-updated_at')
+    # assigner and assignee are rendered on every list/detail response, so they are joined
+    # in the same query instead of being loaded lazily per row
+    queryset = Bug.objects.select_related('assigner', 'assignee').order_by('-updated_at')
+    pagination_class = PageNumberOrKeysetPagination
     http_method_names = ('get', 'patch', 'post', 'delete')
+    # the reads of GET requests may go to a replica, see Utilities.replicas
+    replica_reads = True
 
     def filter_queryset(self, queryset):
         """
@@ -43,19 +72,71 @@ class BugAPI(ModelViewSet):
             queryset = queryset.filter(assigner_id=assigner)
         return queryset
 
+    def get_queryset(self):
+        queryset = super(BugAPI, self).get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # only the columns and relations of the fields the client asked for are loaded
+            queryset = fieldsets.optimize(queryset, self.get_serializer().fields, many=self.action == 'list')
+        return self.order_queryset(queryset) if self.action == 'list' else queryset
+
+    def get_serializer_context(self):
+        context = super(BugAPI, self).get_serializer_context()
+        # the schema (bug.schema) is generated without a request and documents every field
+        if self.action in ('list', 'retrieve') and not getattr(self, 'swagger_fake_view', False):
+            context['fieldset'] = fieldsets.Fieldset.from_request(self.request)
+        return context
+
+    def order_queryset(self, queryset):
+        """
+        This orders the list by the `ordering` query (newest updated first by default), with
+        the id breaking ties. Every ordering reads a column of the bug table and has an index
+        :param queryset:
+        :return: the ordered bugs queryset
+        """
+        ordering = self.request.query_params.get('ordering')
+        if not ordering:
+            return queryset
+        if ordering not in BUG_LIST_ORDERINGS:
+            raise ValidationError(detail={"ordering": f"Choose one of {', '.join(BUG_LIST_ORDERINGS)}"})
+        if self.paginator.is_keyset_request(self.request):
+            raise ValidationError(detail={"ordering": "The cursor can only be used with the default ordering"})
+        return queryset.order_by(ordering, '-id' if ordering.startswith('-') else 'id')
+
     @swagger_auto_schema(
+        manual_parameters=[fields_query, exclude_query, expand_query],
         operation_summary="retrieves a bug",
+        operation_description="Send the ETag of a previous response as If-None-Match to get 304 when nothing changed",
         operation_id='bug_get')
     def retrieve(self, request, *args, **kwargs):
-        return super(BugAPI, self).retrieve(request, *args, **kwargs)
+        return conditional.conditional_response(
+            request, conditional.bug_detail_validators(request, self.kwargs['pk']),
+            lambda: super(BugAPI, self).retrieve(request, *args, **kwargs))
 
     @swagger_auto_schema(
-        manual_parameters=[resolved_query, assigner_query, assignee_query],
+        manual_parameters=[resolved_query, assigner_query, assignee_query, ordering_query, fields_query,
+                           exclude_query, expand_query],
         operation_summary="retrieves a list of bugs",
+        operation_description="Send the ETag of a previous response as If-None-Match to get 304 when nothing "
+                              "changed, this is not available with the cursor. The cursor only follows the "
+                              "default ordering",
         operation_id='bug_list', responses={200: serializers.BugListSerializer(many=True)})
     def list(self, request, *args, **kwargs):
         self.serializer_class = serializers.BugListSerializer
-        return super(BugAPI, self).list(request, *args, **kwargs)
+        key, cached = list_cache.lookup(request)
+        if cached is not None:
+            return cached
+        if key is not None:
+            # the page is kept for everyone, it must not be the copy of a lagging replica
+            replicas.read_from_primary()
+        # keyset pages are meant to never count the bugs, so they are not validated
+        if self.paginator.is_keyset_request(request):
+            return list_cache.store(key, super(BugAPI, self).list(request, *args, **kwargs))
+        state = conditional.bug_list_state(self.filter_queryset(self.get_queryset()))
+        # the paginator reuses the number of bugs counted for the validators
+        self.known_count = state[0]
+        return list_cache.store(key, conditional.conditional_response(
+            request, conditional.bug_list_validators(request, state),
+            lambda: super(BugAPI, self).list(request, *args, **kwargs)))
 
     @swagger_auto_schema(
         request_body=serializers.BugSerializer,
@@ -92,6 +173,150 @@ class BugAPI(ModelViewSet):
         bug = serializer.save()
         return Response(data=serializers.BugDetailSerializer(bug).data, status=status.HTTP_200_OK)
 
+    @swagger_auto_schema(
+        request_body=serializers.BugSerializer(many=True),
+        operation_summary="creates several bugs",
+        operation_description="""
+            Every bug is validated like a single bug creation, the valid ones are created
+            in one transaction and each bug gets its own result with its index in the request.
+            The response is 201 when every bug was created, 207 when only some were and
+            400 when none were.
+        """,
+        operation_id='bug_bulk_create', responses={201: serializers.BulkResultSerializer(many=True)})
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        results, status_code = bulk.create_bugs(request.data, user=request.user)
+        return Response(data=results, status=status_code)
+
+    @swagger_auto_schema(
+        request_body=serializers.BulkUpdateBugSerializer(many=True),
+        operation_summary="updates several bugs",
+        operation_description="""
+            Every item holds the id of a bug and the changes to make to it, with the same
+            rules as a single bug update. The valid changes are saved in one transaction and
+            each item gets its own result with its index in the request.
+            The response is 200 when every bug was updated, 207 when only some were and
+            400 when none were.
+        """,
+        operation_id='bug_bulk_update', responses={200: serializers.BulkResultSerializer(many=True)})
+    @bulk_create.mapping.patch
+    def bulk_update(self, request, *args, **kwargs):
+        results, status_code = bulk.update_bugs(request.data, user=request.user)
+        return Response(data=results, status=status_code)
+
+    @swagger_auto_schema(
+        request_body=serializers.BulkResolveBugSerializer(many=True),
+        operation_summary="resolves several bugs",
+        operation_description="This action can be done by both the assigner and the assignee of each bug",
+        operation_id='bug_bulk_resolve', responses={200: serializers.BulkResultSerializer(many=True)})
+    @action(detail=False, methods=['post'], url_path='bulk/resolve')
+    def bulk_resolve(self, request, *args, **kwargs):
+        results, status_code = bulk.update_bugs(request.data, user=request.user, changes={'resolved': True})
+        return Response(data=results, status=status_code)
+
+    @swagger_auto_schema(
+        operation_summary="retrieves the comments on a bug",
+        operation_description="Comments are returned newest first, a page at a time",
+        operation_id='bug_comments', responses={200: serializers.CommentListSerializer(many=True)})
+    @action(detail=True, methods=['get'])
+    def comments(self, request, *args, **kwargs):
+        bug = self.get_object()
+        page = self.paginate_queryset(bug.comment_set.select_related('author').order_by('-updated_at'))
+        serializer = serializers.CommentListSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @swagger_auto_schema(
+        manual_parameters=[search_query],
+        operation_summary="searches bugs and comments",
+        operation_description="Matches every word of q against the titles and bodies of bugs and comments, "
+                              "best matches first. Only available when the database is SQLite (501 otherwise)",
+        operation_id='bug_search', responses={200: serializers.SearchResultSerializer(many=True)})
+    @action(detail=False, methods=['get'])
+    def search(self, request, *args, **kwargs):
+        search.check_database()
+        expression = search.match_expression(request.query_params.get('q', ''))
+        if not expression:
+            raise ValidationError(detail={"q": "Enter the text to search for"})
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(search.SearchResults(expression), request, view=self)
+        return paginator.get_paginated_response(serializers.SearchResultSerializer(page, many=True).data)
+
+    @swagger_auto_schema(
+        manual_parameters=[resolved_query, assigner_query, assignee_query, export_format_query],
+        operation_summary="exports bugs with their comments",
+        operation_description="""
+            Streams every bug matching the filters, oldest first, with its comments:
+                - ndjson: one bug per line with a list of its comments
+                - csv: one row per comment with the bug columns repeated, a bug
+                    without comments has a single row with empty comment columns
+        """,
+        operation_id='bug_export', responses={200: "the exported bugs"})
+    @action(detail=False, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        export_format = request.query_params.get('as', 'ndjson')
+        if export_format not in export.EXPORT_FORMATS:
+            raise ValidationError(detail={"as": f"Choose one of {', '.join(export.EXPORT_FORMATS)}"})
+        response = StreamingHttpResponse(export.export_stream(self.filter_queryset(self.get_queryset()), export_format),
+                                         content_type=export.EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="bugs.{export_format}"'
+        return response
+
+    @swagger_auto_schema(
+        manual_parameters=[since_query],
+        operation_summary="retrieves the bugs and comments changed since a change token",
+        operation_description="""
+            Returns the bugs and comments created or updated after the `since` token as they
+            are now, and the ids of the deleted ones, at most CHANGES_PAGE_SIZE changes at a
+            time: follow `next` while `more` is true. Without `since`, only the current token
+            is returned: ask for it before listing the bugs, then sync from it.
+            A token older than the change log is answered 410, list the bugs again then.
+            The changes are only available when the database is SQLite (501 otherwise).
+        """,
+        operation_id='bug_changes', responses={200: serializers.ChangesSerializer})
+    @action(detail=False, methods=['get'])
+    def changes(self, request, *args, **kwargs):
+        changes.check_database()
+        since = request.query_params.get('since')
+        if since is None:
+            data = {'bugs': [], 'comments': [], 'deleted': {'bug': [], 'comment': []},
+                    'next': changes.current_token(), 'more': False}
+        else:
+            data = changes.changes_since(changes.parse_token(since))
+        context = {'fieldset': fieldsets.Fieldset(exclude=['comments'])}
+        return Response(data=serializers.ChangesSerializer(data, context=context).data)
+
+    @swagger_auto_schema(
+        request_body=no_body,
+        operation_summary="creates a token for opening the event stream",
+        operation_description="""
+            EventSource cannot send the Authorization header: open /bugs/events/?token=
+            with this token instead, within `expires_in` seconds. It stops working when the
+            user signs out.
+        """,
+        operation_id='bug_events_token', responses={201: serializers.StreamTokenSerializer})
+    @action(detail=False, methods=['post'], url_path='events/token')
+    def events_token(self, request, *args, **kwargs):
+        # signed in with a session, the user gets the token signing in would have handed out
+        token = request.auth if isinstance(request.auth, Token) else Token.objects.get_or_create(user=request.user)[0]
+        data = {'token': events.stream_token(token), 'expires_in': settings.SSE_TOKEN_SECONDS}
+        return Response(data=serializers.StreamTokenSerializer(data).data, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(
+        manual_parameters=[resolved_query, assigner_query, assignee_query],
+        operation_summary="retrieves bug statistics",
+        operation_description="Counts the open and resolved bugs matching the filters, overall and per assignee, "
+                              "with the mean time it took to resolve them",
+        operation_id='bug_stats', responses={200: serializers.BugStatsSerializer})
+    @action(detail=False, methods=['get'])
+    def stats(self, request, *args, **kwargs):
+        if request.query_params.get('assigner'):
+            # the counters are not kept per assigner, so these bugs are grouped on the fly
+            rows = counters.grouped_totals(self.filter_queryset(Bug.objects.all()))
+        else:
+            # the counters have the resolved and assignee columns the filters apply to
+            rows = counters.counter_totals(self.filter_queryset(BugCounter.objects.select_related('assignee')))
+        return Response(data=serializers.BugStatsSerializer(counters.summarize(rows)).data)
+
     @swagger_auto_schema(
         operation_summary="deletes a bug",
         operation_description="This action can only be done by the assigner of this bug",
@@ -125,10 +350,15 @@ class CommentAPI(ModelViewSet):
         operation_id='comment_delete', responses={204: None},
         operation_description="only the author of a comment can delete that comment")
     def destroy(self, request, *args, **kwargs):
-        if self.request.user != self.get_object().user:
+        if self.request.user != self.get_object().author:
             raise APIException(detail="you are not the author of this comment", code=status.HTTP_401_UNAUTHORIZED)
         return super(CommentAPI, self).destroy(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            counters.comment_removed(instance)
+
 
 class SigninAPI(APIView):
     permission_classes = (AllowAny,)
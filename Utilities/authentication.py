@@ -0,0 +1,71 @@
+import hashlib
+
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+TOKEN_CACHE = 'auth_tokens'
+
+
+def token_cache_key(key):
+    # the token itself is never used as a cache key, a shared cache could be read by others
+    return 'token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    Token authentication that keeps valid tokens, with their user, in the `auth_tokens` cache
+    so that authenticated requests skip the Token + User query.
+
+    The cache is bounded and entries expire after its TIMEOUT. It must be shared by the workers
+    for a signed out token to be invalidated on all of them: the default file cache is shared
+    by the workers of a host, several hosts need memcached or redis (AUTH_TOKEN_CACHE_BACKEND).
+    Entries are invalidated when the token is deleted (sign out) and when its user is saved
+    (e.g. deactivated) or deleted, see invalidate_token and invalidate_user_tokens.
+    '''
+
+    def authenticate_credentials(self, key):
+        cache = caches[TOKEN_CACHE]
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token)
+        return token.user, token
+
+    def get_key(self, request):
+        """
+            This reads the token from the Authorization header the way authenticate does
+        :return: the token, None when the header does not carry one
+        """
+        auth = get_authorization_header(request).split()
+        if len(auth) != 2 or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            return None
+
+    async def authenticate_cached(self, request):
+        """
+            This authenticates the request from the token cache alone, without a database
+            query, for the async handlers (see Bugs.async_views)
+        :return: the user and token, None when the token is missing or not cached
+        """
+        key = self.get_key(request)
+        if key is None:
+            return None
+        token = await caches[TOKEN_CACHE].aget(token_cache_key(key))
+        return (token.user, token) if token is not None else None
+
+
+def invalidate_token(sender, instance, **kwargs):
+    caches[TOKEN_CACHE].delete(token_cache_key(instance.key))
+
+
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    # signing in only updates last_login, which does not affect authentication
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    keys = Token.objects.filter(user_id=instance.pk).values_list('key', flat=True)
+    caches[TOKEN_CACHE].delete_many([token_cache_key(key) for key in keys])
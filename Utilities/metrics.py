@@ -0,0 +1,207 @@
+"""
+    Request instrumentation.
+
+    MetricsMiddleware times every request and, while it runs, counts the SQL queries and
+    their time on every database connection, the time the serializers using
+    TimedSerializerMixin spend building their data and the time CustomJSONRenderer
+    spends rendering. The numbers are sent back in a Server-Timing header and, when
+    prometheus_client is installed, recorded in histograms labelled with the route (the
+    URL name) and method, served by the /metrics view in the Prometheus text format.
+    /metrics only answers the addresses of METRICS_ALLOWED_IPS and staff users.
+
+    gunicorn runs several worker processes, each with its own metrics. Start it with
+    PROMETHEUS_MULTIPROC_DIR pointing at an empty directory: every worker then writes its
+    metrics there and /metrics adds up the files of all the workers, whichever worker
+    answers the scrape. Only histograms are used, so nothing has to be cleaned up when a
+    worker exits.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+PHASES = ('db', 'serialize', 'render')
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 7, 10, 15, 20, 30, 50, 100, float('inf'))
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    """
+        The measurements of the request being handled
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.active = set()
+
+
+@contextmanager
+def measure(phase):
+    """
+        This adds the time spent in the block to the phase of the current request, time
+        spent in a block nested in another block of the same phase is only counted once
+    """
+    timings = current_timings.get()
+    if timings is None or phase in timings.active:
+        yield
+        return
+    timings.active.add(phase)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.seconds[phase] += time.perf_counter() - started
+        timings.active.discard(phase)
+
+
+def record_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    timings.queries += 1
+    with measure('db'):
+        return execute(sql, params, many, context)
+
+
+class TimedSerializerMixin:
+    """
+        This adds the time the serializer spends turning instances into data to the
+        serialize phase of the request. A list of them calls to_representation for every
+        item, and nested serializers run inside their parent's, which counts them once.
+    """
+
+    def to_representation(self, instance):
+        with measure('serialize'):
+            return super().to_representation(instance)
+
+
+if prometheus_client:
+    LABELS = ('route', 'method')
+    REQUEST_SECONDS = prometheus_client.Histogram(
+        'http_request_duration_seconds', 'Time spent handling a request', LABELS + ('status',))
+    REQUEST_QUERIES = prometheus_client.Histogram(
+        'http_request_db_queries', 'SQL queries run by a request', LABELS, buckets=QUERY_BUCKETS)
+    PHASE_SECONDS = {
+        'db': prometheus_client.Histogram(
+            'http_request_db_duration_seconds', 'Time a request spent running SQL queries', LABELS),
+        'serialize': prometheus_client.Histogram(
+            'http_request_serializer_duration_seconds', 'Time a request spent building serializer data', LABELS),
+        'render': prometheus_client.Histogram(
+            'http_request_render_duration_seconds', 'Time a request spent rendering its response', LABELS),
+    }
+
+
+def route(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+def server_timing(timings, total):
+    metrics = [f'db;dur={timings.seconds["db"] * 1000:.1f};desc="{timings.queries} queries"']
+    metrics += [f'{phase};dur={timings.seconds[phase] * 1000:.1f}' for phase in PHASES[1:]]
+    return ', '.join(metrics + [f'total;dur={total * 1000:.1f}'])
+
+
+def observe(request, response, timings, total):
+    labels = {'route': route(request), 'method': request.method}
+    REQUEST_SECONDS.labels(status=str(response.status_code), **labels).observe(total)
+    REQUEST_QUERIES.labels(**labels).observe(timings.queries)
+    for phase, histogram in PHASE_SECONDS.items():
+        histogram.labels(**labels).observe(timings.seconds[phase])
+
+
+class MetricsMiddleware:
+    """
+        This measures each request, see the module docstring. It goes first in MIDDLEWARE
+        so that the total covers the other middleware. It runs in the mode of the handler,
+        so that it does not make an ASGI server run the whole request in a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        connection_created.connect(install, dispatch_uid='metrics-install')
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings, started = RequestTimings(), time.perf_counter()
+        with measuring(timings):
+            response = self.get_response(request)
+        return report(request, response, timings, started)
+
+    async def __acall__(self, request):
+        timings, started = RequestTimings(), time.perf_counter()
+        with measuring(timings):
+            response = await self.get_response(request)
+        return report(request, response, timings, started)
+
+
+def install(connection, **kwargs):
+    """
+        This adds record_query to the wrappers of the connection for good, it records
+        nothing outside of a measured request. Connections belong to a thread, so under
+        ASGI the ones of the threads sync_to_async runs the views in get it when they
+        connect (connection_created). It goes first, so that it is never the wrapper
+        popped by the execute_wrapper() block it may be added in.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def measuring(timings):
+    """
+        This records the queries run in the block into the timings
+    """
+    token = current_timings.set(timings)
+    try:
+        for connection in connections.all():
+            install(connection)
+        yield
+    finally:
+        current_timings.reset(token)
+
+
+def report(request, response, timings, started):
+    total = time.perf_counter() - started
+    response['Server-Timing'] = server_timing(timings, total)
+    if prometheus_client:
+        observe(request, response, timings, total)
+    return response
+
+
+def metrics_view(request):
+    """
+        This serves the metrics of every worker process in the Prometheus text format, to
+        the addresses of METRICS_ALLOWED_IPS (the scraper's) and to staff users
+    """
+    user = getattr(request, 'user', None)
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS and not (user and user.is_staff):
+        return HttpResponse("Forbidden", status=403, content_type='text/plain')
+    if prometheus_client is None:
+        return HttpResponse("Install prometheus_client to collect metrics", status=501, content_type='text/plain')
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return HttpResponse(prometheus_client.generate_latest(registry), content_type=prometheus_client.CONTENT_TYPE_LATEST)
@@ -0,0 +1,164 @@
+import base64
+import json
+from collections import OrderedDict
+from functools import partial
+
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Paginates on the (updated_at, id) position of the last row seen instead of an offset,
+    so the cost of a page does not depend on how deep it is and no COUNT(*) is run.
+    Rows are ordered newest first; id breaks ties between rows updated at the same time.
+    The cursor is an opaque token built from the first/last row of the current page.
+    '''
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    page_size = api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        reverse, position = self.decode_cursor(request)
+
+        if position is None:
+            rows = queryset.order_by('-updated_at', '-id')
+        elif reverse:
+            updated_at, pk = position
+            rows = queryset.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+            rows = rows.order_by('updated_at', 'id')
+        else:
+            updated_at, pk = position
+            rows = queryset.filter(Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=pk))
+            rows = rows.order_by('-updated_at', '-id')
+
+        # one extra row tells us whether there is another page in the direction we are going
+        results = list(rows[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        '''
+        :return: a (reverse, position) tuple, position is None on the first page
+        '''
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            reverse, updated_at, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            updated_at = parse_datetime(updated_at)
+            if updated_at is None:
+                raise ValueError
+            return bool(reverse), (updated_at, int(pk))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        position = json.dumps([int(reverse), row.updated_at.isoformat(), row.id])
+        encoded = base64.urlsafe_b64encode(position.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class KnownCountPaginator(DjangoPaginator):
+    '''
+    A Django paginator that can be handed the number of objects instead of counting them
+    '''
+
+    def __init__(self, object_list, per_page, known_count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if known_count is not None:
+            self.count = known_count
+
+
+class PageNumberOrKeysetPagination(PageNumberPagination):
+    '''
+    Page numbers by default, keyset pagination when the client opts in by sending the
+    cursor query parameter (empty for the first page).
+    A view that already knows how many objects it is paginating can set it as its
+    `known_count` to save the COUNT(*) query.
+    '''
+    keyset_pagination_class = KeysetPagination
+
+    def is_keyset_request(self, request):
+        return self.keyset_pagination_class.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.is_keyset_request(request):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.django_paginator_class = partial(KnownCountPaginator, known_count=getattr(view, 'known_count', None))
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_next_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_next_link()
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_previous_link()
+        return super().get_previous_link()
+
+    def get_schema_fields(self, view):
+        cursor_query_param = self.keyset_pagination_class.cursor_query_param
+        return super().get_schema_fields(view) + [
+            coreapi.Field(
+                name=cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(
+                    title='Cursor',
+                    description='Switches to keyset pagination; leave empty for the first page '
+                                'and follow the next/previous links from there.'
+                )
+            )
+        ]
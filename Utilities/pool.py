@@ -0,0 +1,230 @@
+"""
+    Per-process database connection pool.
+
+    Django keeps one connection per thread and per database. Under gunicorn's gthread
+    workers every thread keeps its own, and over ASGI every request runs its database work
+    in a fresh thread, so with CONN_MAX_AGE alone the connections are either opened and
+    torn down per request or left behind by threads that are gone. A database backend
+    using PooledConnectionMixin (Utilities.sqlite) instead takes its connection from a
+    pool of at most DATABASE_POOL_SIZE connections per process and database when it
+    connects, and hands it back when Django closes it at the end of the request. The pool
+    is thread-safe, so it serves the WSGI threads and the threads sync_to_async runs the
+    ASGI requests in alike; a thread that finds every connection taken waits for one
+    up to DATABASE_POOL_TIMEOUT seconds, the event loop itself never waits.
+
+    Connections are reused for CONN_MAX_AGE seconds (for ever when None, never when 0).
+    With DATABASE_HEALTH_CHECKS a connection is checked with `SELECT 1` before it is
+    reused, and replaced when the check fails. Connections opened, reused, replaced and
+    expired, and the time spent waiting for a connection, are recorded for /metrics when
+    prometheus_client is installed, and kept in ConnectionPool.counts.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+OUTCOMES = ('created', 'reused', 'unhealthy', 'expired')
+
+if prometheus_client:
+    CONNECTIONS = prometheus_client.Counter(
+        'db_pool_connections', 'Connections handed out by the pool, by outcome', ('database', 'outcome'))
+    WAIT_SECONDS = prometheus_client.Histogram(
+        'db_pool_wait_seconds', 'Time spent waiting for a connection of the pool', ('database',),
+        buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, float('inf')))
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The server is busy, try again shortly"
+    default_code = 'database_pool_timeout'
+    wait = 1
+
+
+class PooledConnection:
+    """
+        A connection waiting in the pool
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+
+
+class ConnectionPool:
+    """
+        The connections of one database in this process
+    """
+
+    def __init__(self, alias, size, max_age, timeout, health_checks):
+        self.alias = alias
+        self.size = size
+        self.max_age = max_age
+        self.timeout = timeout
+        self.health_checks = health_checks
+        self.idle = []
+        # the connections handed out, by the id of the connection
+        self.in_use = {}
+        self.opening = 0
+        self.available = threading.Condition()
+        self.counts = dict.fromkeys(OUTCOMES, 0)
+        self.waited = 0.0
+
+    def record(self, outcome):
+        with self.available:
+            self.counts[outcome] += 1
+        if prometheus_client:
+            CONNECTIONS.labels(database=self.alias, outcome=outcome).inc()
+
+    def record_wait(self, seconds):
+        with self.available:
+            self.waited += seconds
+        if prometheus_client:
+            WAIT_SECONDS.labels(database=self.alias).observe(seconds)
+
+    def expired(self, pooled):
+        return self.max_age is not None and time.monotonic() - pooled.created_at >= self.max_age
+
+    def healthy(self, pooled):
+        if not self.health_checks:
+            return True
+        try:
+            pooled.connection.cursor().execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, connect):
+        """
+            This hands out an idle connection, or one opened with connect() while the pool
+            is not full, waiting for one to be released otherwise
+        :raises PoolTimeout: when no connection is released within the timeout
+        """
+        started = time.monotonic()
+        try:
+            with self.available:
+                while not self.idle and len(self.in_use) + self.opening >= self.size:
+                    remaining = started + self.timeout - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout()
+                    self.available.wait(remaining)
+                pooled = self.idle.pop() if self.idle else None
+                # the connection is counted against the size while it is checked or opened
+                self.opening += 1
+        finally:
+            self.record_wait(time.monotonic() - started)
+
+        try:
+            if pooled is not None:
+                if self.expired(pooled):
+                    self.record('expired')
+                elif not self.healthy(pooled):
+                    self.record('unhealthy')
+                else:
+                    self.record('reused')
+                    return self.checked_out(pooled)
+                close_quietly(pooled.connection)
+            pooled = PooledConnection(connect())
+            self.record('created')
+            return self.checked_out(pooled)
+        finally:
+            with self.available:
+                self.opening -= 1
+                self.available.notify()
+
+    def checked_out(self, pooled):
+        with self.available:
+            self.in_use[id(pooled.connection)] = pooled
+        return pooled.connection
+
+    def release(self, connection, discard=False):
+        """
+            This takes back a connection handed out by acquire(), closing it when it is
+            discarded or too old
+        """
+        with self.available:
+            pooled = self.in_use.pop(id(connection), None)
+            keep = pooled is not None and not discard and not self.expired(pooled)
+            if keep:
+                self.idle.append(pooled)
+            self.available.notify()
+        if not keep:
+            close_quietly(connection)
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+def get_pool(wrapper):
+    """
+    :param wrapper: the DatabaseWrapper of the database
+    :return: the pool of the database in this process, a process forked from another
+        starts with empty pools rather than sharing the connections of its parent
+    """
+    key = (os.getpid(), wrapper.alias, str(wrapper.settings_dict['NAME']))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(
+                    wrapper.alias, settings.DATABASE_POOL_SIZE, wrapper.settings_dict['CONN_MAX_AGE'],
+                    settings.DATABASE_POOL_TIMEOUT, settings.DATABASE_HEALTH_CHECKS)
+    return pool
+
+
+class PooledConnectionMixin:
+    """
+        This makes a DatabaseWrapper take its connection from the pool of its database
+        and hand it back when it is closed
+    """
+
+    def pool_enabled(self):
+        return settings.DATABASE_POOL_SIZE > 0
+
+    def connect(self):
+        super().connect()
+        if self.pool_enabled():
+            # the connection goes back to the pool when the request ends, its age is the pool's business
+            self.close_at = time.monotonic()
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_enabled():
+            return self.open_connection(conn_params)
+        return get_pool(self).acquire(lambda: self.open_connection(conn_params))
+
+    def open_connection(self, conn_params):
+        """
+            This opens a connection, a backend sets up its new connections here rather than
+            in get_new_connection(), which also hands out the pooled ones
+        """
+        return super().get_new_connection(conn_params)
+
+    def _close(self):
+        if not self.pool_enabled():
+            return super()._close()
+        with self.wrap_database_errors:
+            # a connection closed inside transaction.atomic() is still held by this wrapper
+            broken = self.in_atomic_block or (self.errors_occurred and not self.is_usable())
+            try:
+                if not broken:
+                    self.connection.rollback()
+            except Exception:
+                broken = True
+                raise
+            finally:
+                get_pool(self).release(self.connection, discard=broken)
@@ -0,0 +1,150 @@
+"""
+    Read replicas.
+
+    DATABASE_REPLICAS lists databases holding copies of the primary (`default`). The reads
+    of a GET, HEAD or OPTIONS request to a view marked with `replica_reads = True` (BugAPI
+    and the handlers of Bugs.async_views) go to one of them, picked per request so that
+    the count and the page of a list come from the same copy. Everything else goes to the primary: writes, the reads
+    of other requests and of code running outside a request, and the users, tokens and
+    sessions read to authenticate, so that a new token or password works at once.
+
+    Replicas lag behind the primary. For REPLICA_PIN_SECONDS after a user writes, their
+    reads stay on the primary too, so that they see their own writes. The pins are kept in
+    the `replica_pins` cache, which must be shared by the worker processes (the default
+    file cache on one host, memcached or redis) for the pin to follow the user to another
+    worker. A response
+    kept for other users, a bug list page stored in Bugs.list_cache, is read from the
+    primary as well (read_from_primary): a lagging replica would store the page as it was
+    before the write that bumped the generation, under the new generation.
+
+    Locally, two SQLite files do: set DATABASE_REPLICAS=replica.sqlite3 and run
+    `python manage.py copy_to_replicas` to refresh the copy.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_CACHE = 'replica_pins'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# the apps read to authenticate a request
+PRIMARY_APPS = ('auth', 'authtoken', 'sessions')
+
+current_reads = ContextVar('current_reads', default=None)
+
+
+def pin_key(user_id):
+    return f'replicas:pinned:{user_id}'
+
+
+def replica_reads(view):
+    """
+    :return: whether the view (a function or a class based view) asks for its reads to go to a replica
+    """
+    return getattr(view, 'replica_reads', False) or getattr(getattr(view, 'cls', None), 'replica_reads', False)
+
+
+def read_from_primary():
+    """
+        This sends the reads of the request being handled to the primary, it is called
+        before the view reads anything
+    """
+    reads = current_reads.get()
+    if reads is not None:
+        reads.allowed = False
+
+
+class RequestReads:
+    """
+        Where the reads of the request being handled go
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.allowed = False
+        self.alias = None
+
+    def database(self):
+        """
+            The user is only known once the view has authenticated the request, which it
+            does before reading anything else, so the pin is looked up on the first read
+        :return: the alias of the replica for this request, None for the primary
+        """
+        if not self.allowed:
+            return None
+        if self.alias is None:
+            user = getattr(self.request, 'user', None)
+            pinned = user is not None and user.is_authenticated and caches[PIN_CACHE].get(pin_key(user.pk))
+            self.alias = DEFAULT_DB_ALIAS if pinned else random.choice(settings.REPLICA_DATABASES)
+        return None if self.alias == DEFAULT_DB_ALIAS else self.alias
+
+
+class ReplicaRouter:
+    """
+        The database router sending the reads of the marked views to the replicas, see the module docstring
+    """
+
+    def db_for_read(self, model, **hints):
+        reads = current_reads.get()
+        if reads is None or model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return reads.database() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaMiddleware:
+    """
+        This lets the router know which request it routes the reads of, and pins the users
+        who write to the primary. Like MetricsMiddleware, it runs in the mode of the handler.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = current_reads.set(RequestReads(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            current_reads.reset(token)
+        self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = current_reads.set(RequestReads(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_reads.reset(token)
+        if settings.REPLICA_DATABASES and request.method not in SAFE_METHODS:
+            # request.user may still have to be read from the database
+            await sync_to_async(self.pin)(request, response)
+        return response
+
+    def pin(self, request, response):
+        if settings.REPLICA_DATABASES and request.method not in SAFE_METHODS and response.status_code < 400:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                caches[PIN_CACHE].set(pin_key(user.pk), True, settings.REPLICA_PIN_SECONDS)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        reads = current_reads.get()
+        if reads is not None:
+            reads.allowed = (bool(settings.REPLICA_DATABASES) and request.method in SAFE_METHODS and
+                             replica_reads(view_func))
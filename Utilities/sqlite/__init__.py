@@ -0,0 +1,3 @@
+"""
+    SQLite database backend for production, see Utilities.sqlite.base
+"""
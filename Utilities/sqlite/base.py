@@ -0,0 +1,59 @@
+"""
+    The SQLite backend of the project, DATABASES ENGINE 'Utilities.sqlite'. Connections
+    come from the per-process pool of Utilities.pool, except for in-memory databases
+    (the tests), which live as long as their connection.
+
+    With the `production` OPTION (SQLITE_PRODUCTION) the backend is tuned for several
+    worker processes sharing one database file. Every new connection sets PRAGMAS, which
+    can be overridden with the `pragmas` dict of the database OPTIONS:
+    - busy_timeout: a connection finding the database locked retries for that many
+      milliseconds before failing with `database is locked`
+    - journal_mode WAL: readers no longer block the writer nor the writer the readers,
+      and a commit appends to the log instead of rewriting pages of the database
+    - synchronous NORMAL: in WAL mode a commit is durable once the log is checkpointed,
+      a power cut can lose the last commits but never corrupts the database
+    - cache_size, mmap_size, temp_store: larger page cache (negative sizes are in KiB),
+      reads through a memory map, temporary tables and sorts in memory
+
+    Transactions then start with BEGIN IMMEDIATE rather than BEGIN. A plain BEGIN takes
+    the write lock on the first write of the transaction: two transactions that both read
+    then write deadlock, and the one that has to give up fails at once with `database is
+    locked` whatever the busy timeout. BEGIN IMMEDIATE takes the write lock up front, so
+    writers queue on busy_timeout instead. Reads outside transaction.atomic() take no
+    write lock.
+"""
+from django.db.backends.sqlite3 import base
+
+from Utilities.pool import PooledConnectionMixin
+
+PRAGMAS = {
+    # first, so that the other pragmas wait for a lock too
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(PooledConnectionMixin, base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.production = params.pop('production', False)
+        pragmas = params.pop('pragmas', {})
+        self.pragmas = {**PRAGMAS, **pragmas} if self.production else {}
+        return params
+
+    def open_connection(self, conn_params):
+        conn = super().open_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def pool_enabled(self):
+        return super().pool_enabled() and not self.is_in_memory_db()
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.production else 'BEGIN')
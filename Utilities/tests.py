@@ -0,0 +1,579 @@
+import asyncio
+import datetime
+import decimal
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework.utils.serializer_helpers import ReturnDict
+
+from Bugs.admin import UniqueEmailUserChangeForm
+from Bugs.list_cache import LIST_CACHE
+from Bugs.models import Bug
+from Bugs.serializers import unique_field_markers, users_with_email
+from bug import schema
+from bug.asgi import BugASGIHandler
+from Utilities import metrics, passwords, pool, replicas
+from Utilities.api_response import CustomJSONRenderer
+from Utilities.authentication import TOKEN_CACHE, CachedTokenAuthentication
+
+
+class CustomJSONRendererTest(SimpleTestCase):
+    """
+        The envelope format is part of the API contract, the expected bytes below are
+        what the renderer has always produced.
+    """
+
+    def render(self, data, status_code=200):
+        return CustomJSONRenderer().render(data, 'application/json',
+                                           {'response': Response(status=status_code)})
+
+    @override_settings(JSON_RENDERER_BACKEND='json')
+    def test_envelope(self):
+        cases = [
+            ([1, 2], 200, b'{"status":true,"message":"successful","data":[1,2]}'),
+            (None, 204, b'{"status":true,"message":"successful"}'),
+            (OrderedDict([('count', 1), ('results', [])]), 200,
+             b'{"status":true,"message":"successful","data":{"count":1,"results":[]}}'),
+            ({'message': 'Login is successful', 'data': {'id': 1}}, 200,
+             b'{"message":"Login is successful","data":{"id":1},"status":true}'),
+            ({'detail': 'Not found.'}, 404, b'{"detail":"Not found.","status":false,"message":"failed"}'),
+            (ReturnDict([('title', ['A bug with this title already exists'])], serializer=None), 400,
+             b'{"status":false,"message":"failed","data":{"title":["A bug with this title already exists"]}}'),
+            ({'non_field_errors': ['You cannot assign a bug to yourself']}, 400,
+             b'{"message":"You cannot assign a bug to yourself","status":false}'),
+            ({'status': 'ok', 'message': 'done'}, 200, b'{"status":"ok","message":"done"}'),
+        ]
+        for data, status_code, expected in cases:
+            with self.subTest(data=data):
+                self.assertEqual(self.render(data, status_code), expected)
+
+    def test_input_is_not_modified(self):
+        data = {'non_field_errors': ['invalid']}
+        self.render(data, 400)
+        self.assertEqual(data, {'non_field_errors': ['invalid']})
+
+    def test_orjson_matches_stdlib(self):
+        data = OrderedDict([
+            ('count', 2),
+            ('results', [
+                OrderedDict([('id', 1), ('title', 'Crash on ünïcode   input'), ('resolved', False),
+                             ('assignee', None), ('created_at', datetime.datetime(2022, 11, 22, 10, 1, 2, 345678,
+                                                                                  tzinfo=datetime.timezone.utc))]),
+                OrderedDict([('id', 2), ('title', '</script>'), ('estimate', decimal.Decimal('1.50')),
+                             ('score', 0.1), ('tags', ('a', 'b'))]),
+            ]),
+        ])
+        with override_settings(JSON_RENDERER_BACKEND='json'):
+            expected = self.render(data)
+        with override_settings(JSON_RENDERER_BACKEND='orjson'):
+            self.assertEqual(self.render(data), expected)
+            self.assertEqual(self.render({'big': 2 ** 70}), b'{"big":1180591620717411303424,"status":true,'
+                                                            b'"message":"successful"}')
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    """
+        Cached tokens skip the database until they are signed out or their user changes
+    """
+
+    def setUp(self):
+        caches[TOKEN_CACHE].clear()
+        self.user = User.objects.create_user(username="user", email="user@test.com", password="pass")
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def authenticate(self):
+        return CachedTokenAuthentication().authenticate_credentials(self.token.key)
+
+    def test_token_is_cached(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual((user, token), (self.user, self.token))
+
+    def test_sign_out_invalidates(self):
+        self.authenticate()
+        self.assertEqual(self.client.post('/auth/signout/').status_code, 200)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deactivation_invalidates(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleting_the_user_invalidates(self):
+        self.authenticate()
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_cache_is_shared_with_other_processes(self):
+        self.authenticate()
+        read = ("from django.core.cache import caches; from Utilities import authentication as a; "
+                f"print(caches[a.TOKEN_CACHE].get(a.token_cache_key({self.token.key!r})) is not None)")
+
+        def cached_in_another_worker():
+            command = [sys.executable, settings.BASE_DIR / 'manage.py', 'shell', '-c', read]
+            return subprocess.run(command, capture_output=True, text=True, check=True).stdout.strip() == 'True'
+
+        self.assertTrue(cached_in_another_worker())
+        self.client.post('/auth/signout/')
+        self.assertFalse(cached_in_another_worker())
+
+    def test_sign_in_keeps_the_cache(self):
+        self.authenticate()
+        self.client.post('/auth/signin/', {"email": "user@test.com", "password": "pass"})
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+
+class SigninTest(TestCase):
+    """
+        Signing in looks the email up on its index and checks the password within the limits
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="User@Test.com", password="pass")
+        self.client = APIClient()
+
+    def sign_in(self, **data):
+        return self.client.post('/auth/signin/', {"email": "user@test.com", "password": "pass", **data}, format='json')
+
+    def test_email_is_case_insensitive(self):
+        response = self.sign_in()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['token'], Token.objects.get(user=self.user).key)
+        self.assertEqual(self.sign_in(email="nobody@test.com").status_code, 400)
+        self.assertEqual(self.sign_in(password="wrong").status_code, 400)
+
+    def test_email_lookup_uses_the_index(self):
+        sql, params = users_with_email('user@test.com').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('unique_user_email', plan)
+
+    def test_token_only_sign_in_skips_the_session(self):
+        self.sign_in(session=False)
+        self.assertFalse(Session.objects.exists())
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.last_login)
+        self.sign_in()
+        self.assertTrue(Session.objects.exists())
+
+    def sign_up(self, **data):
+        return self.client.post('/auth/signup/', {"first_name": "A", "last_name": "B", "username": "other",
+                                                  "email": "other@test.com", "password": "a-long-Pass-phrase-1",
+                                                  **data})
+
+    def test_signing_up_twice_is_refused(self):
+        with self.assertNumQueries(4):
+            # the insert alone, in a savepoint since the test runs in a transaction
+            response = self.sign_up(email="USER@test.com")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"email": ["A user already exists with this email address"]})
+        response = self.sign_up(username="user")
+        self.assertEqual(response.data, {"username": ["A user already exists with this username"]})
+        self.assertEqual(self.sign_up(email="").status_code, 201)
+        self.assertEqual(self.sign_up(username="third", email="").status_code, 201)
+        self.assertEqual(self.sign_up(username="user!").status_code, 400)
+
+    def test_username_markers_match_every_backend(self):
+        markers = unique_field_markers(User, 'username')
+        for error in ('duplicate key value violates unique constraint "auth_user_username_key"',
+                      "Duplicate entry 'user' for key 'username'", "Duplicate entry 'user' for key 'auth_user.username'",
+                      "UNIQUE constraint failed: auth_user.username"):
+            self.assertTrue(any(marker in error for marker in markers), error)
+
+    def test_admin_and_createsuperuser_refuse_a_taken_email(self):
+        other = User.objects.create_user(username="other", email="other@test.com")
+        form = UniqueEmailUserChangeForm(instance=other, data={
+            "username": "other", "email": "USER@test.com", "date_joined": "2024-01-01 00:00:00"})
+        self.assertEqual(form.errors['email'], ["A user already exists with this email address"])
+        form = UniqueEmailUserChangeForm(instance=self.user, data={
+            "username": "user", "email": "User@Test.com", "date_joined": "2024-01-01 00:00:00"})
+        self.assertTrue(form.is_valid(), form.errors)
+
+        with self.assertRaisesMessage(CommandError, "A user already exists with this email address"):
+            call_command('createsuperuser', interactive=False, username="admin", email="user@TEST.com")
+        call_command('createsuperuser', interactive=False, username="admin", email="admin@test.com",
+                     stdout=io.StringIO())
+        self.assertTrue(User.objects.get(username="admin").is_superuser)
+
+    def test_duplicate_emails_are_listed(self):
+        with connection.cursor() as cursor:
+            # as before migration 0008, the drop is rolled back with the test
+            cursor.execute('DROP INDEX unique_user_email')
+        User.objects.create_user(username="twin", email="user@test.com")
+        out = io.StringIO()
+        call_command('find_duplicate_emails', stdout=out)
+        self.assertIn("User@test.com (id", out.getvalue())
+        self.assertIn("user@test.com (id", out.getvalue())
+        self.assertIn("1 email addresses are used by more than one account", out.getvalue())
+
+    @override_settings(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0)
+    def test_full_limits_answer_busy(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_check(*args):
+            started.set()
+            release.wait(5)
+            return True
+
+        with mock.patch.object(passwords, '_limits', None), \
+                mock.patch('django.contrib.auth.hashers.check_password', slow_check):
+            waiting = threading.Thread(target=passwords.check_password, args=(self.user, "pass"))
+            waiting.start()
+            started.wait(5)
+            try:
+                response = self.sign_in()
+            finally:
+                release.set()
+                waiting.join()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class MetricsMiddlewareTest(TestCase):
+    """
+        Every request reports its query count and phase timings, and is recorded for /metrics
+    """
+
+    def setUp(self):
+        for cache in (TOKEN_CACHE, LIST_CACHE):
+            caches[cache].clear()
+        self.user = User.objects.create_user(username="user", email="user@test.com", password="pass")
+        Bug.objects.create(title="bug", assigner=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.user).key}")
+
+    def test_server_timing(self):
+        response = self.client.get('/bugs/')
+        timing = dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+        self.assertEqual(list(timing), ['db', 'serialize', 'render', 'total'])
+        # token, count of the bugs and their page
+        self.assertIn('desc="3 queries"', timing['db'])
+        self.assertNotEqual(timing['serialize'], 'dur=0.0')
+
+    def test_measure_counts_nested_blocks_once(self):
+        timings = metrics.RequestTimings()
+        token = metrics.current_timings.set(timings)
+        try:
+            with metrics.measure('serialize'):
+                with metrics.measure('serialize'):
+                    time.sleep(0.01)
+        finally:
+            metrics.current_timings.reset(token)
+        self.assertGreaterEqual(timings.seconds['serialize'], 0.01)
+        self.assertLess(timings.seconds['serialize'], 0.02)
+
+    def test_async_requests_are_measured(self):
+        def query():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            finally:
+                connection.close()
+
+        async def get_response(request):
+            # under ASGI, the view runs in a thread of the request with connections of its own
+            await sync_to_async(query, thread_sensitive=False)()
+            return HttpResponse()
+
+        middleware = metrics.MetricsMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    @skipUnless(metrics.prometheus_client, "prometheus_client is not installed")
+    def test_metrics_endpoint(self):
+        self.client.get('/bugs/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_request_db_queries_bucket{le="3.0",method="GET",route="bugs-list"}', response.content)
+        self.assertIn(b'http_request_render_duration_seconds_count{method="GET",route="bugs-list"}', response.content)
+
+    def test_metrics_are_restricted(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertNotEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRouterTest(TestCase):
+    """
+        The reads of the bug views go to a replica, unless the user just wrote
+    """
+
+    def setUp(self):
+        for cache in (TOKEN_CACHE, LIST_CACHE, replicas.PIN_CACHE):
+            caches[cache].clear()
+        self.user = User.objects.create_user(username="user", email="user@test.com", password="pass")
+        self.bug = Bug.objects.create(title="bug", assigner=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.user).key}")
+
+    def request(self, method, url, data=None):
+        """
+            The test database has no replica, the reads are recorded and sent to the primary
+        :return: the response and the apps read from each database
+        """
+        reads = {}
+        route = replicas.ReplicaRouter.db_for_read
+        caches[LIST_CACHE].clear()
+
+        def record(router, model, **hints):
+            reads.setdefault(route(router, model, **hints), set()).add(model._meta.app_label)
+            return 'default'
+
+        with mock.patch.object(replicas.ReplicaRouter, 'db_for_read', record):
+            response = getattr(self.client, method)(url, data, format='json')
+        return response, reads
+
+    def test_reads_go_to_the_replica(self):
+        response, reads = self.request('get', f'/bugs/{self.bug.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(reads, {'default': {'authtoken'}, 'replica1': {'Bugs'}})
+        # a query parameter the list cache does not know, the page is not cached
+        self.assertEqual(self.request('get', '/bugs/?q=')[1]['replica1'], {'Bugs'})
+
+    def test_cached_pages_are_read_from_the_primary(self):
+        response, reads = self.request('get', '/bugs/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(list(reads), ['default'])
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        response, reads = self.request('post', '/bugs/', {"title": "new"})
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('replica1', reads)
+        self.assertNotIn('replica1', self.request('get', f'/bugs/{self.bug.id}/')[1])
+
+        other = User.objects.create_user(username="other", email="other@test.com", password="pass")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=other).key}")
+        self.assertIn('replica1', self.request('get', f'/bugs/{self.bug.id}/')[1])
+
+    @override_settings(REPLICA_PIN_SECONDS=0)
+    def test_pins_expire(self):
+        self.request('post', '/bugs/', {"title": "new"})
+        self.assertIn('replica1', self.request('get', f'/bugs/{self.bug.id}/')[1])
+
+    def test_failed_writes_and_other_views_use_the_primary(self):
+        self.request('post', '/bugs/', {"title": "bug"})
+        self.assertIn('replica1', self.request('get', f'/bugs/{self.bug.id}/')[1])
+        response, reads = self.request('post', '/auth/signin/', {"email": "user@test.com", "password": "pass"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(reads), ['default'])
+
+    def test_async_writes_pin_the_user_to_the_primary(self):
+        async def get_response(request):
+            self.assertIsNotNone(replicas.current_reads.get())
+            return HttpResponse(status=201)
+
+        middleware = replicas.ReplicaMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        request = RequestFactory().post('/bugs/')
+        request.user = self.user
+        async_to_sync(middleware)(request)
+        self.assertTrue(caches[replicas.PIN_CACHE].get(replicas.pin_key(self.user.pk)))
+
+
+class ASGIMiddlewareTest(SimpleTestCase):
+    """
+        Under ASGI, no middleware is adapted: the request only goes to a thread for the view
+    """
+
+    @override_settings(DEBUG=True)
+    def test_middleware_is_not_adapted(self):
+        # django logs every adapted middleware when DEBUG is on
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            BugASGIHandler().load_middleware(is_async=True)
+
+
+@override_settings(DATABASE_POOL_SIZE=0)
+class SQLiteProductionBackendTest(SimpleTestCase):
+    """
+        The production SQLite backend sets its pragmas on every connection and takes the write lock up front
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = {'ENGINE': 'Utilities.sqlite', 'NAME': f'{directory.name}/db.sqlite3'}
+        self.connections = ConnectionHandler({
+            'default': {**database, 'OPTIONS': {'production': True, 'pragmas': {'cache_size': -1000}}},
+            'second': {**database, 'OPTIONS': {'production': True, 'pragmas': {'busy_timeout': 0}}},
+        })
+        self.addCleanup(self.connections.close_all)
+
+    def pragma(self, alias, name):
+        with self.connections[alias].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        self.assertEqual(self.pragma('default', 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma('default', 'synchronous'), 1)
+        self.assertEqual(self.pragma('default', 'cache_size'), -1000)
+        self.assertEqual(self.pragma('default', 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma('second', 'busy_timeout'), 0)
+
+    def test_transactions_begin_immediate(self):
+        first, second = self.connections['default'], self.connections['second']
+        # what transaction.atomic() does to start a transaction
+        begin = {'autocommit': False, 'force_begin_transaction_with_broken_autocommit': True}
+        with CaptureQueriesContext(first) as queries:
+            first.set_autocommit(**begin)
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+        # the write lock is held before anything is written, so a second writer waits for it
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            second.set_autocommit(**begin)
+        first.rollback()
+        second.set_autocommit(**begin)
+        second.rollback()
+
+
+@override_settings(DATABASE_POOL_SIZE=1, DATABASE_POOL_TIMEOUT=0.05)
+class ConnectionPoolTest(SimpleTestCase):
+    """
+        Database connections are handed back to the pool of their process when Django closes them
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = {'ENGINE': 'Utilities.sqlite', 'NAME': f'{directory.name}/db.sqlite3', 'CONN_MAX_AGE': 60}
+
+    def wrapper(self, **database):
+        """
+        :return: a new DatabaseWrapper, as each thread gets its own
+        """
+        return ConnectionHandler({'default': {**self.database, **database}})['default']
+
+    def test_connections_are_reused(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        connection = first.connection
+        first.close_if_unusable_or_obsolete()
+        self.assertIsNone(first.connection)
+
+        second = self.wrapper()
+        second.ensure_connection()
+        self.assertIs(second.connection, connection)
+        self.assertEqual(pool.get_pool(second).counts, {'created': 1, 'reused': 1, 'unhealthy': 0, 'expired': 0})
+        second.close()
+
+    def test_broken_connections_are_replaced(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        connection = first.connection
+        first.close()
+        connection.close()
+        second = self.wrapper()
+        second.ensure_connection()
+        self.assertIsNot(second.connection, connection)
+        self.assertEqual(pool.get_pool(second).counts, {'created': 2, 'reused': 0, 'unhealthy': 1, 'expired': 0})
+        second.close()
+
+    def test_connections_expire(self):
+        for _ in range(2):
+            wrapper = self.wrapper(CONN_MAX_AGE=0)
+            wrapper.ensure_connection()
+            wrapper.close()
+        self.assertEqual(pool.get_pool(wrapper).counts, {'created': 2, 'reused': 0, 'unhealthy': 0, 'expired': 0})
+
+    def test_waits_for_a_connection(self):
+        first, second = self.wrapper(), self.wrapper()
+        first.ensure_connection()
+        with self.assertRaises(pool.PoolTimeout):
+            second.ensure_connection()
+
+        # released by another thread while the second one waits
+        pool.get_pool(second).timeout = 5
+        first.inc_thread_sharing()
+        timer = threading.Timer(0.02, first.close)
+        timer.start()
+        second.ensure_connection()
+        timer.join()
+        self.assertEqual(pool.get_pool(second).counts['reused'], 1)
+        self.assertGreater(pool.get_pool(second).waited, 0.05)
+        second.close()
+
+
+class OpenAPISchemaTest(SimpleTestCase):
+    """
+        The schema is generated once per code version and revalidated by clients with its ETag
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/openapi.json'
+        settings = self.settings(OPENAPI_SCHEMA_PATH=self.path, CODE_VERSION='1')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_schema_is_generated_once(self):
+        with mock.patch('bug.schema.generate', wraps=schema.generate) as generate:
+            response = self.client.get('/docs/openapi.json')
+            self.assertEqual(self.client.get('/docs/openapi.json').content, response.content)
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        document = json.loads(response.content)
+        self.assertEqual(document['info']['x-code-version'], '1')
+        self.assertIn('/bugs/', document['paths'])
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(), response.content)
+
+        response = self.client.get('/docs/openapi.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, response.content), (304, b''))
+
+    def test_schema_is_regenerated_for_a_new_version(self):
+        call_command('generate_schema', stdout=io.StringIO())
+        with mock.patch('bug.schema.generate', side_effect=AssertionError):
+            etag = self.client.get('/docs/openapi.json')['ETag']
+        with self.settings(CODE_VERSION='2'):
+            response = self.client.get('/docs/openapi.json')
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['info']['x-code-version'], '2')
+
+    def test_ui_loads_the_generated_schema(self):
+        with mock.patch('bug.schema.generate', side_effect=AssertionError):
+            response = self.client.get('/docs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'/docs/openapi.json', response.content)
+
+    def test_openapi_format_of_the_ui_is_the_generated_schema(self):
+        call_command('generate_schema', stdout=io.StringIO())
+        with mock.patch('bug.schema.generate', side_effect=AssertionError):
+            response = self.client.get('/docs/', {'format': 'openapi'})
+            self.assertEqual(response.content, self.client.get('/docs/openapi.json').content)
+            self.assertEqual(self.client.get('/docs/', {'format': '.yaml'}).status_code, 404)
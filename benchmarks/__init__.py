@@ -0,0 +1,10 @@
+"""
+    Benchmarks are plain scripts run from the project root, e.g. python -m benchmarks.render
+"""
+import os
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bug.settings')
+    import django
+    django.setup()
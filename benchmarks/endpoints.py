@@ -0,0 +1,276 @@
+"""
+    Benchmark of every route of Bugs/urls.py against a seeded database, checked against
+    the budgets in benchmarks/budgets.json.
+
+    The data is seeded into a throwaway test database: many users, thousands of bugs and
+    comments spread over them with a long tail (a few bugs have hundreds of comments, most
+    have none or a handful). Each scenario is requested --runs times after a warm-up and
+    its SQL query count, response size and latency are measured. The bug list cache is
+    disabled so that list scenarios measure the database path, the token cache is on.
+
+    A scenario fails when it runs more queries, returns more bytes or has a slower p95
+    latency than its budget. --write-budgets stores the measured queries, the bytes with
+    10% headroom and three times the p95 latency, so latency budgets only catch large
+    regressions on a slower machine.
+
+    Usage: python -m benchmarks.endpoints [--runs 30] [--users 500] [--bugs 5000] [--comments 25000]
+                                          [--only bug_list bug_retrieve ...] [--write-budgets]
+"""
+import argparse
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+from benchmarks import setup_django
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.hashers import make_password  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from Bugs import changes, counters  # noqa: E402
+from Bugs.models import Bug, Change, Comment  # noqa: E402
+
+BUDGETS = Path(__file__).with_name('budgets.json')
+PASSWORD = 'benchmark-password'
+NO_LIST_CACHE = {**settings.CACHES, 'bug_lists': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def seed(users, bugs, comments, rng):
+    """
+        This creates the users, their bugs and the comments, with one password hash for everyone
+    :return: the seeded objects the scenarios need
+    """
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([User(username=f'user{index}', email=f'user{index}@example.com', password=password)
+                              for index in range(users)])
+    people = list(User.objects.order_by('id'))
+    now = timezone.now()
+    new_bugs = []
+    for index in range(bugs):
+        assigner, assignee = rng.sample(people, 2)
+        # the first user is a triager who files a good share of the bugs
+        if rng.random() < 0.05 and assignee != people[0]:
+            assigner = people[0]
+        resolved = rng.random() < 0.3
+        created_at = now - timedelta(days=rng.uniform(0, 365))
+        new_bugs.append(Bug(title=f'Bug {index}: {rng.choice(WORDS)} fails on {rng.choice(WORDS)}',
+                            body=' '.join(rng.choice(WORDS) for _ in range(40)), assigner=assigner,
+                            assignee=assignee if rng.random() < 0.9 else None, resolved=resolved,
+                            resolved_at=created_at + timedelta(hours=rng.expovariate(1 / 48)) if resolved else None))
+    Bug.objects.bulk_create(new_bugs, batch_size=500)
+    all_bugs = list(Bug.objects.order_by('id'))
+
+    # a long tail: the weight of the n-th busiest bug falls off as 1 / n
+    weights = [1 / (rank + 1) for rank in range(len(all_bugs))]
+    shuffled = rng.sample(all_bugs, len(all_bugs))
+    new_comments = []
+    for index, bug in enumerate(rng.choices(shuffled, weights=weights, k=comments)):
+        new_comments.append(Comment(bug=bug, title=f'comment {index}', author=rng.choice(people),
+                                    body=' '.join(rng.choice(WORDS) for _ in range(25))))
+    Comment.objects.bulk_create(new_comments, batch_size=500)
+    counters.rebuild_counters()
+    counters.rebuild_comment_counts()
+    # bulk creation records no changes, the sync scenario reads a few hundred of them
+    changes.record_bugs(rng.sample(all_bugs, min(len(all_bugs), 300)), Change.UPDATED)
+
+    user = people[0]
+    return SimpleNamespace(
+        user=user, token=Token.objects.create(user=user).key, people=people,
+        busiest=Bug.objects.order_by('-comment_count').first(),
+        quiet=Bug.objects.filter(comment_count=0, assigner=user).first() or Bug.objects.filter(assigner=user).last(),
+        mine=list(Bug.objects.filter(assigner=user).order_by('id')[:50]),
+    )
+
+
+WORDS = ('login', 'dashboard', 'export', 'timeout', 'crash', 'unicode', 'upload', 'avatar', 'search', 'report',
+         'invoice', 'email', 'session', 'cache', 'mobile', 'safari', 'chrome', 'render', 'payment', 'webhook')
+
+
+def get(path):
+    return lambda data, run: ('get', path(data) if callable(path) else path, None, None)
+
+
+def bug_create(data, run):
+    return 'post', '/bugs/', {'title': f'benchmark create {run}', 'body': 'body', 'assignee': data.people[-1].id}, None
+
+
+def bug_update(data, run):
+    return 'patch', f'/bugs/{data.quiet.id}/', {'body': f'edited {run}'}, None
+
+
+def bug_destroy(data, run):
+    bug = Bug.objects.create(title=f'benchmark destroy {run}', assigner=data.user)
+    return 'delete', f'/bugs/{bug.id}/', None, None
+
+
+def bulk_create(data, run):
+    return 'post', '/bugs/bulk/', [{'title': f'benchmark bulk {run} {index}', 'body': 'body',
+                                    'assignee': data.people[index].id} for index in range(1, 21)], None
+
+
+def bulk_update(data, run):
+    return 'patch', '/bugs/bulk/', [{'id': bug.id, 'body': f'bulk edited {run}'} for bug in data.mine[:20]], None
+
+
+def bulk_resolve(data, run):
+    return 'post', '/bugs/bulk/resolve/', [{'id': bug.id} for bug in data.mine[20:40]], None
+
+
+def comment_create(data, run):
+    return 'post', '/comments/', {'bug': data.busiest.id, 'title': f'benchmark comment {run}', 'body': 'body'}, None
+
+
+def comment_destroy(data, run):
+    comment = Comment.objects.create(bug=data.busiest, title=f'benchmark destroy {run}', body='body',
+                                     author=data.user)
+    return 'delete', f'/comments/{comment.id}/', None, None
+
+
+def signup(data, run):
+    return 'post', '/auth/signup/', {'first_name': 'Ada', 'last_name': 'Lovelace', 'username': f'signup{run}',
+                                     'email': f'signup{run}@example.com', 'password': 'a-long-Pass-phrase-1'}, ''
+
+
+def other_user(data, run):
+    # signing the seeded user out would invalidate the token of the other scenarios
+    others = [person for person in data.people if person != data.user]
+    return others[run % len(others)]
+
+
+def signin(data, run):
+    return 'post', '/auth/signin/', {'email': other_user(data, run).email, 'password': PASSWORD}, ''
+
+
+def signin_token_only(data, run):
+    return 'post', '/auth/signin/', {'email': other_user(data, run).email.upper(), 'password': PASSWORD,
+                                     'session': False}, ''
+
+
+def signout(data, run):
+    token = Token.objects.get_or_create(user=other_user(data, run))[0]
+    return 'post', '/auth/signout/', None, token.key
+
+
+SCENARIOS = {
+    'bug_list': get('/bugs/'),
+    'bug_list_resolved': get('/bugs/?resolved=true'),
+    'bug_list_assignee': get(lambda data: f'/bugs/?assignee={data.user.id}'),
+    'bug_list_assigner': get(lambda data: f'/bugs/?assigner={data.user.id}'),
+    'bug_list_deep_page': get('/bugs/?page=200'),
+    'bug_list_cursor': get('/bugs/?cursor='),
+    'bug_list_by_comments': get('/bugs/?ordering=-comment_count'),
+    'bug_retrieve_busy': get(lambda data: f'/bugs/{data.busiest.id}/'),
+    'bug_retrieve_quiet': get(lambda data: f'/bugs/{data.quiet.id}/'),
+    'bug_comments': get(lambda data: f'/bugs/{data.busiest.id}/comments/'),
+    'bug_stats': get('/bugs/stats/'),
+    'bug_stats_assigner': get(lambda data: f'/bugs/stats/?assigner={data.user.id}'),
+    'bug_changes': get('/bugs/changes/?since=0'),
+    'bug_search': get('/bugs/search/?q=dashboard crash'),
+    'bug_export': get(lambda data: f'/bugs/export/?assigner={data.user.id}'),
+    'bug_create': bug_create,
+    'bug_partial_update': bug_update,
+    'bug_destroy': bug_destroy,
+    'bug_bulk_create': bulk_create,
+    'bug_bulk_update': bulk_update,
+    'bug_bulk_resolve': bulk_resolve,
+    'comment_create': comment_create,
+    'comment_destroy': comment_destroy,
+    'signup': signup,
+    'signin': signin,
+    'signin_token_only': signin_token_only,
+    'signout': signout,
+}
+
+
+def request(client, data, scenario, run):
+    """
+    :return: the latency in seconds, the number of queries and the response size in bytes
+    """
+    method, path, body, token = scenario(data, run)
+    # the seeded user makes every request except the sign up/in/out ones
+    token = data.token if token is None else token
+    client.credentials(**({'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}))
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = getattr(client, method)(path, body, format='json')
+        # streamed responses run their queries while they are consumed
+        size = len(b''.join(response.streaming_content) if response.streaming else response.content)
+        elapsed = time.perf_counter() - started
+    if response.status_code >= 400:
+        raise RuntimeError(f"{method.upper()} {path} answered {response.status_code}: {response.content[:200]}")
+    return elapsed, len(queries), size
+
+
+def measure(data, name, runs):
+    client, scenario = APIClient(), SCENARIOS[name]
+    request(client, data, scenario, runs)  # warm-up, e.g. the token cache
+    results = [request(client, data, scenario, index) for index in range(runs)]
+    latencies = sorted(elapsed for elapsed, _, _ in results)
+    return {
+        'queries': max(queries for _, queries, _ in results),
+        'bytes': max(size for _, _, size in results),
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)] * 1000,
+    }
+
+
+def over_budget(measured, budget):
+    """
+    :return: the measurements that exceed the budget
+    """
+    return [key for key in ('queries', 'bytes', 'p95_ms') if key in budget and measured[key] > budget[key]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=30, help="measured requests per scenario")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--bugs', type=int, default=5000)
+    parser.add_argument('--comments', type=int, default=25000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--write-budgets', action='store_true', help="store the measurements as the new budgets")
+    args = parser.parse_args()
+
+    budgets = json.loads(BUDGETS.read_text()) if BUDGETS.exists() else {}
+    setup_test_environment()
+    database = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    failures = []
+    try:
+        with override_settings(CACHES=NO_LIST_CACHE):
+            data = seed(args.users, args.bugs, args.comments, random.Random(args.seed))
+            print(f"{'scenario':<24}{'queries':>8}{'bytes':>10}{'p50 ms':>10}{'p95 ms':>10}  budget")
+            for name in args.only:
+                measured = measure(data, name, args.runs)
+                exceeded = over_budget(measured, budgets.get(name, {}))
+                failures += [(name, key) for key in exceeded]
+                status = 'over: ' + ', '.join(exceeded) if exceeded else 'ok' if name in budgets else 'none'
+                print(f"{name:<24}{measured['queries']:>8}{measured['bytes']:>10}{measured['p50_ms']:>10.1f}"
+                      f"{measured['p95_ms']:>10.1f}  {status}")
+                if args.write_budgets:
+                    budgets[name] = {'queries': measured['queries'], 'bytes': math.ceil(measured['bytes'] * 1.1),
+                                     'p95_ms': math.ceil(measured['p95_ms'] * 3)}
+    finally:
+        connection.creation.destroy_test_db(database, verbosity=0)
+
+    if args.write_budgets:
+        BUDGETS.write_text(json.dumps(budgets, indent=2, sort_keys=True) + '\n')
+    elif failures:
+        sys.exit(f"{len(failures)} budget(s) exceeded: " + ', '.join(f'{name} {key}' for name, key in failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+    Micro-benchmark of CustomJSONRenderer.render with each JSON backend on bug list
+    pages and bug details of 20, 100 and 1000 items.
+
+    Usage: python -m benchmarks.render [--seconds 1.0]
+"""
+import argparse
+import timeit
+from collections import OrderedDict
+
+from benchmarks import setup_django
+
+setup_django()
+
+from django.test import override_settings  # noqa: E402
+from rest_framework.response import Response  # noqa: E402
+
+from Utilities.api_response import CustomJSONRenderer, orjson  # noqa: E402
+
+SIZES = (20, 100, 1000)
+
+
+def user(index):
+    return OrderedDict([('id', index), ('first_name', 'Ada'), ('last_name', 'Lovelace'),
+                        ('username', f'user{index}'), ('email', f'user{index}@example.com')])
+
+
+def bug_list_page(size):
+    return OrderedDict([
+        ('count', 1000000), ('next', 'http://localhost:8000/bugs/?page=3'),
+        ('previous', 'http://localhost:8000/bugs/?page=1'),
+        ('results', [
+            OrderedDict([('id', index), ('title', f'Bug number {index} crashes the dashboard'),
+                         ('resolved', index % 3 == 0), ('assigner', f'user{index}'), ('assignee', f'user{index + 1}')])
+            for index in range(size)
+        ]),
+    ])
+
+
+def bug_detail(size):
+    return OrderedDict([
+        ('id', 1), ('assigner', user(1)), ('assignee', user(2)),
+        ('comments', [
+            OrderedDict([('id', index), ('author', f'user{index}'), ('bug', 'Bug number 1'),
+                         ('title', f'Comment {index}'), ('body', 'Reproduced on staging with the attached steps. ' * 4),
+                         ('created_at', '2022-11-22T10:01:02.345Z'), ('updated_at', '2022-11-22T10:01:02.345Z')])
+            for index in range(size)
+        ]),
+        ('more_comments', None), ('title', 'Bug number 1'), ('body', 'Steps to reproduce ' * 20),
+        ('resolved', False), ('created_at', '2022-11-22T10:01:02.345Z'), ('updated_at', '2022-11-22T10:01:02.345Z'),
+    ])
+
+
+def measure(data, seconds):
+    renderer = CustomJSONRenderer()
+    context = {'response': Response(status=200)}
+    timer = timeit.Timer(lambda: renderer.render(data, 'application/json', context))
+    number, elapsed = timer.autorange()
+    runs = max(1, int(number * seconds / elapsed))
+    best = min(timer.repeat(repeat=3, number=runs)) / runs
+    return best, len(renderer.render(data, 'application/json', context))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=1.0, help="approximate time spent per measurement")
+    args = parser.parse_args()
+
+    backends = ['json'] + (['orjson'] if orjson else [])
+    print(f"{'payload':<16}{'bytes':>10}" + ''.join(f"{backend + ' renders/s':>20}" for backend in backends)
+          + f"{'speedup':>10}")
+    for name, factory in (('list', bug_list_page), ('detail', bug_detail)):
+        for size in SIZES:
+            data = factory(size)
+            timings = []
+            for backend in backends:
+                with override_settings(JSON_RENDERER_BACKEND=backend):
+                    elapsed, length = measure(data, args.seconds)
+                timings.append(elapsed)
+            speedup = f"{timings[0] / timings[-1]:.1f}x" if len(timings) > 1 else '-'
+            print(f"{f'{name} x{size}':<16}{length:>10}" + ''.join(f"{1 / elapsed:>20,.0f}" for elapsed in timings)
+                  + f"{speedup:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+    Load test of the bug read endpoints served by gunicorn sync workers (bug.wsgi) and by
+    uvicorn (bug.asgi) at 50, 200 and 1000 concurrent connections.
+
+    Every connection sends GET requests one after the other for the given time, reading
+    each response slowly when --slow-read is set (a client on a poor network), and the
+    throughput, latency percentiles and failed requests are reported per server and
+    concurrency. Both servers get the same number of worker processes, gunicorn's sync
+    workers handle one connection at a time each.
+
+    The benchmark uses the configured database, which must be migrated; it signs in as a
+    `benchmark` user and creates bugs until there are --bugs of them. gunicorn and uvicorn
+    must be installed (see requirements.txt).
+
+    Usage: python -m benchmarks.servers [--seconds 10] [--workers 2] [--connections 50 200 1000]
+                                        [--path /bugs/] [--slow-read 0.05]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks import setup_django
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+from Bugs.models import Bug  # noqa: E402
+
+SERVERS = {
+    'gunicorn-sync': lambda port, workers: ['gunicorn', 'bug.wsgi', '--workers', str(workers), '--worker-class', 'sync',
+                                            '--bind', f'127.0.0.1:{port}', '--backlog', '2048', '--log-level', 'warning'],
+    'uvicorn': lambda port, workers: ['uvicorn', 'bug.asgi:application', '--workers', str(workers), '--host',
+                                      '127.0.0.1', '--port', str(port), '--backlog', '2048', '--log-level', 'warning'],
+}
+REQUEST_TIMEOUT = 30
+
+
+def seed(bugs):
+    """
+    :return: the token of the benchmark user
+    """
+    user, created = User.objects.get_or_create(username='benchmark', defaults={'email': 'benchmark@example.com'})
+    existing = Bug.objects.count()
+    Bug.objects.bulk_create([Bug(title=f'benchmark bug {existing + index}', body='Steps to reproduce ' * 10,
+                                 assigner=user) for index in range(max(0, bugs - existing))])
+    return Token.objects.get_or_create(user=user)[0].key
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"the server exited with {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("the server did not start")
+
+
+async def read_response(reader, slow_read):
+    """
+    :return: the status code and whether the server keeps the connection open
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin1').split('\r\n')
+    headers = dict(line.lower().split(': ', 1) for line in lines[1:] if ': ' in line)
+    length = int(headers.get('content-length', 0))
+    if slow_read:
+        # a slow client takes the body a few kilobytes at a time
+        while length:
+            chunk = await reader.read(min(length, 4096))
+            if not chunk:
+                raise ConnectionError("the connection was closed mid-response")
+            length -= len(chunk)
+            await asyncio.sleep(slow_read)
+    else:
+        await reader.readexactly(length)
+    return int(lines[0].split()[1]), headers.get('connection', '').lower() != 'close'
+
+
+async def connection(port, request, deadline, latencies, errors, slow_read):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            status, keep_alive = await asyncio.wait_for(read_response(reader, slow_read), REQUEST_TIMEOUT)
+            if status != 200:
+                errors.append(status)
+            else:
+                latencies.append(time.monotonic() - started)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as error:
+            errors.append(type(error).__name__)
+            keep_alive = False
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, path, token, connections, seconds, slow_read):
+    request = (f'GET {path} HTTP/1.1\r\nHost: localhost\r\nAuthorization: Token {token}\r\n'
+               f'Connection: keep-alive\r\n\r\n').encode('latin1')
+    latencies, errors = [], []
+    started = time.monotonic()
+    await asyncio.gather(*(connection(port, request, started + seconds, latencies, errors, slow_read)
+                           for _ in range(connections)))
+    return latencies, errors, time.monotonic() - started
+
+
+def percentile(values, fraction):
+    return statistics.quantiles(values, n=100)[int(fraction * 100) - 1] if len(values) > 1 else sum(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10.0, help="time spent per server and concurrency")
+    parser.add_argument('--workers', type=int, default=2, help="worker processes of each server")
+    parser.add_argument('--connections', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--path', default='/bugs/', help="the endpoint requested")
+    parser.add_argument('--slow-read', type=float, default=0.0, help="seconds a client waits between 4kB reads")
+    parser.add_argument('--bugs', type=int, default=1000, help="bugs in the database")
+    parser.add_argument('--servers', nargs='+', choices=list(SERVERS), default=list(SERVERS))
+    args = parser.parse_args()
+
+    missing = [name for name in args.servers if shutil.which(SERVERS[name](0, 1)[0]) is None]
+    if missing:
+        sys.exit(f"install {', '.join(SERVERS[name](0, 1)[0] for name in missing)} to run this benchmark")
+    token = seed(args.bugs)
+
+    print(f"{'server':<16}{'connections':>12}{'requests/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name in args.servers:
+        port = free_port()
+        process = subprocess.Popen(SERVERS[name](port, args.workers), env=os.environ.copy())
+        try:
+            wait_for(port, process)
+            for connections in args.connections:
+                latencies, errors, elapsed = asyncio.run(
+                    load(port, args.path, token, connections, args.seconds, args.slow_read))
+                print(f"{name:<16}{connections:>12}{len(latencies) / elapsed:>12,.0f}"
+                      f"{percentile(latencies, 0.5) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}"
+                      f"{len(errors):>8}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+    Sign-in storm: many users signing in at once while others keep reading bugs.
+
+    --connections clients sign in one after the other as different users for the given
+    time, with or without a session (--session), while --readers clients keep listing
+    bugs. The sign-ins per second, their latency, the sign-ins answered 503 by the
+    password check limits (see Utilities.passwords) and the latency of the bug list during
+    the storm are reported per server. The bug list latency shows whether the sign-ins
+    starve the other routes.
+
+    The benchmark uses the configured database, which must be migrated; it creates
+    --users `storm` users sharing one password. gunicorn (sync and gthread workers, the
+    limits only apply to the latter) and uvicorn must be installed.
+
+    Usage: python -m benchmarks.signin [--seconds 10] [--workers 2] [--threads 8] [--connections 100]
+                                       [--readers 10] [--users 500] [--session]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from benchmarks import setup_django
+
+setup_django()
+
+from django.contrib.auth.hashers import make_password  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+
+from benchmarks.servers import REQUEST_TIMEOUT, free_port, percentile, read_response, seed, wait_for  # noqa: E402
+
+PASSWORD = 'storm-password'
+SERVERS = {
+    'gunicorn-sync': lambda port, args: ['gunicorn', 'bug.wsgi', '--workers', str(args.workers), '--worker-class',
+                                         'sync', '--bind', f'127.0.0.1:{port}', '--backlog', '2048',
+                                         '--log-level', 'warning'],
+    'gunicorn-gthread': lambda port, args: ['gunicorn', 'bug.wsgi', '--workers', str(args.workers), '--worker-class',
+                                            'gthread', '--threads', str(args.threads), '--bind', f'127.0.0.1:{port}',
+                                            '--backlog', '2048', '--log-level', 'warning'],
+    'uvicorn': lambda port, args: ['uvicorn', 'bug.asgi:application', '--workers', str(args.workers), '--host',
+                                   '127.0.0.1', '--port', str(port), '--backlog', '2048', '--log-level', 'warning'],
+}
+
+
+def seed_users(count):
+    """
+    :return: the emails of the storm users
+    """
+    existing = set(User.objects.filter(username__startswith='storm').values_list('username', flat=True))
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([User(username=f'storm{index}', email=f'Storm{index}@example.com', password=password)
+                              for index in range(count) if f'storm{index}' not in existing])
+    return [f'storm{index}@example.com' for index in range(count)]
+
+
+def sign_in_request(email, session):
+    body = json.dumps({'email': email, 'password': PASSWORD, 'session': session}).encode()
+    return (f'POST /auth/signin/ HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n').encode('latin1') + body
+
+
+async def client(port, requests, deadline, results):
+    """
+        This sends the requests in turn until the deadline, results collects the status and latency of each
+    """
+    reader = writer = None
+    index = 0
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(requests[index % len(requests)])
+            status, keep_alive = await asyncio.wait_for(read_response(reader, 0), REQUEST_TIMEOUT)
+            results.append((status, time.monotonic() - started))
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as error:
+            results.append((type(error).__name__, time.monotonic() - started))
+            keep_alive = False
+        index += 1
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def storm(port, args, emails, token):
+    deadline = time.monotonic() + args.seconds
+    sign_ins, reads = [], []
+    # every client signs in as its own slice of the users
+    clients = [client(port, [sign_in_request(email, args.session) for email in emails[index::args.connections]],
+                      deadline, sign_ins) for index in range(args.connections)]
+    read = (f'GET /bugs/ HTTP/1.1\r\nHost: localhost\r\nAuthorization: Token {token}\r\n'
+            f'Connection: keep-alive\r\n\r\n').encode('latin1')
+    clients += [client(port, [read], deadline, reads) for _ in range(args.readers)]
+    started = time.monotonic()
+    await asyncio.gather(*clients)
+    return sign_ins, reads, time.monotonic() - started
+
+
+def latencies(results):
+    return [elapsed for status, elapsed in results if status == 200]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=2, help="worker processes of each server")
+    parser.add_argument('--threads', type=int, default=8, help="threads of each gunicorn worker")
+    parser.add_argument('--connections', type=int, default=100, help="clients signing in")
+    parser.add_argument('--readers', type=int, default=10, help="clients listing bugs during the storm")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--session', action='store_true', help="sign in with a session instead of token only")
+    parser.add_argument('--servers', nargs='+', choices=list(SERVERS), default=list(SERVERS))
+    args = parser.parse_args()
+
+    missing = [name for name in args.servers if shutil.which(SERVERS[name](0, args)[0]) is None]
+    if missing:
+        sys.exit(f"install {', '.join(SERVERS[name](0, args)[0] for name in missing)} to run this benchmark")
+    emails, token = seed_users(args.users), seed(100)
+
+    print(f"{'server':<18}{'sign-ins/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'busy':>8}{'errors':>8}"
+          f"{'list p99 ms':>13}")
+    for name in args.servers:
+        port = free_port()
+        process = subprocess.Popen(SERVERS[name](port, args), env=os.environ.copy())
+        try:
+            wait_for(port, process)
+            sign_ins, reads, elapsed = asyncio.run(storm(port, args, emails, token))
+        finally:
+            process.terminate()
+            process.wait()
+        signed_in, read = latencies(sign_ins), latencies(reads)
+        busy = sum(status == 503 for status, _ in sign_ins)
+        errors = len(sign_ins) - len(signed_in) - busy + len(reads) - len(read)
+        print(f"{name:<18}{len(signed_in) / elapsed:>12,.1f}{percentile(signed_in, 0.5) * 1000:>10.1f}"
+              f"{percentile(signed_in, 0.99) * 1000:>10.1f}{busy:>8}{errors:>8}{percentile(read, 0.99) * 1000:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
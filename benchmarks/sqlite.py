@@ -0,0 +1,132 @@
+"""
+    Concurrent writers and readers on one SQLite file, the way gunicorn workers share the
+    database, with the shipped sqlite3 backend and with the production backend of
+    SQLITE_PRODUCTION (Utilities.sqlite.base).
+
+    --writers processes each run transactions that read a bug, update it and append to a
+    change log, like saving a bug does; --readers processes each count the open bugs and
+    read a page of them, like the bug list. Every process has its own connection. The
+    writes and reads per second, their p99 latency and the operations that failed with
+    `database is locked` are reported per backend.
+
+    The data is seeded into throwaway files in a temporary directory, one per backend.
+
+    Usage: python -m benchmarks.sqlite [--seconds 10] [--writers 4] [--readers 4] [--bugs 5000]
+"""
+import argparse
+import multiprocessing
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import setup_django
+
+setup_django()
+
+from django.db import OperationalError, connections, transaction  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from benchmarks.servers import percentile  # noqa: E402
+
+ALIAS = 'benchmark'
+BACKENDS = {
+    'sqlite3': {'ENGINE': 'django.db.backends.sqlite3'},
+    'production': {'ENGINE': 'Utilities.sqlite', 'OPTIONS': {'production': True}},
+}
+
+
+def seed(path, bugs):
+    database = sqlite3.connect(path)
+    database.executescript('''
+        CREATE TABLE bug (id INTEGER PRIMARY KEY, title TEXT, body TEXT, resolved INTEGER, updated_at TEXT);
+        CREATE INDEX bug_updated_at ON bug (updated_at);
+        CREATE TABLE change (id INTEGER PRIMARY KEY, bug_id INTEGER, at TEXT);
+    ''')
+    now = timezone.now().isoformat()
+    database.executemany('INSERT INTO bug VALUES (?, ?, ?, ?, ?)',
+                         [(index, f'bug {index}', 'body' * 50, index % 3 == 0, now) for index in range(1, bugs + 1)])
+    database.commit()
+    database.close()
+
+
+def write(cursor, bug_id):
+    with transaction.atomic(using=ALIAS):
+        cursor.execute('SELECT id, title, body, resolved FROM bug WHERE id = %s', [bug_id])
+        cursor.fetchone()
+        now = timezone.now().isoformat()
+        cursor.execute('UPDATE bug SET body = %s, updated_at = %s WHERE id = %s', [f'edited {now}', now, bug_id])
+        cursor.execute('INSERT INTO change (bug_id, at) VALUES (%s, %s)', [bug_id, now])
+
+
+def read(cursor, bug_id):
+    cursor.execute('SELECT COUNT(*) FROM bug WHERE resolved = 0')
+    cursor.fetchone()
+    cursor.execute('SELECT id, title, body, updated_at FROM bug ORDER BY updated_at DESC LIMIT 20')
+    cursor.fetchall()
+
+
+def run(role, backend, path, bugs, seconds, results):
+    """
+        This runs in its own process, results receives the role, latencies and errors of the process
+    """
+    connections.settings[ALIAS] = {**backend, 'NAME': path}
+    operation = write if role == 'writer' else read
+    generator = random.Random()
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+    with connections[ALIAS].cursor() as cursor:
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                operation(cursor, generator.randint(1, bugs))
+                latencies.append(time.monotonic() - started)
+            except OperationalError:
+                errors += 1
+    connections[ALIAS].close()
+    results.put((role, latencies, errors))
+
+
+def measure(backend, path, args):
+    """
+    :return: the latencies of the writes and the reads, and the number of failed operations
+    """
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    roles = ['writer'] * args.writers + ['reader'] * args.readers
+    processes = [context.Process(target=run, args=(role, backend, path, args.bugs, args.seconds, results))
+                 for role in roles]
+    for process in processes:
+        process.start()
+    latencies, errors = {'writer': [], 'reader': []}, 0
+    for _ in processes:
+        role, measured, failed = results.get()
+        latencies[role] += measured
+        errors += failed
+    for process in processes:
+        process.join()
+    return latencies['writer'], latencies['reader'], errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10.0, help="time spent per backend")
+    parser.add_argument('--writers', type=int, default=4, help="writing processes")
+    parser.add_argument('--readers', type=int, default=4, help="reading processes")
+    parser.add_argument('--bugs', type=int, default=5000)
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+    args = parser.parse_args()
+
+    print(f"{'backend':<12}{'writes/s':>10}{'write p99 ms':>14}{'reads/s':>10}{'read p99 ms':>13}{'locked':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.backends:
+            path = str(Path(directory) / f'{name}.sqlite3')
+            seed(path, args.bugs)
+            writes, reads, errors = measure(BACKENDS[name], path, args)
+            print(f"{name:<12}{len(writes) / args.seconds:>10,.1f}{percentile(writes, 0.99) * 1000:>14.1f}"
+                  f"{len(reads) / args.seconds:>10,.1f}{percentile(reads, 0.99) * 1000:>13.1f}{errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,10 @@
 ASGI config for Bug project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests are routed with bug.asgi_urls, which serves the bug read endpoints with
+async handlers. The /bugs/events/ stream is answered by Bugs.events directly, Django
+4.0 responses cannot be streamed from a coroutine. Other streamed responses (the
+export) read their content in the thread of the request, see send_response.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
@@ -9,8 +13,53 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bug.settings')
 
-application = get_asgi_application()
+
+class BugASGIHandler(ASGIHandler):
+    urlconf = 'bug.asgi_urls'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == events.EVENTS_PATH and scope['method'] == 'GET':
+            await events.stream(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+    async def send_response(self, response, send):
+        """
+            Django 4.0 iterates a streamed response in the event loop, where the queries
+            of a generator like the export's raise SynchronousOnlyOperation. Its content is
+            read here in the thread the view ran in, and sent before the closing message.
+        """
+        if not response.streaming:
+            return await super().send_response(response, send)
+        parts = iter(response)
+        read_part = sync_to_async(next, thread_sensitive=True)
+        response.streaming_content = ()
+
+        async def send_parts(message):
+            if message['type'] == 'http.response.body' and not message.get('more_body'):
+                while (part := await read_part(parts, None)) is not None:
+                    for chunk, _ in self.chunk_bytes(part):
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send(message)
+
+        await super().send_response(response, send_parts)
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = self.urlconf
+        return request, error_response
+
+
+# this is what django.core.asgi.get_asgi_application does, with the handler above
+django.setup(set_prefix=False)
+
+from Bugs import events  # noqa: E402
+
+application = BugASGIHandler()
@@ -0,0 +1,15 @@
+"""
+    The URLs served over ASGI: the bug read endpoints go through the async handlers of
+    Bugs.async_views, everything else is routed as in bug.urls
+"""
+from django.urls import path
+
+from Bugs import async_views
+from bug import urls
+
+urlpatterns = [
+    path('bugs/', async_views.bug_list),
+    # only integer ids, so that bugs/stats/, bugs/bulk/... keep their routes
+    path('bugs/<int:pk>/', async_views.bug_detail),
+    path('bugs/<int:pk>/comments/', async_views.bug_comments),
+] + urls.urlpatterns
@@ -0,0 +1,146 @@
+"""
+    The OpenAPI schema of the API, generated once per code version.
+
+    drf_yasg introspects every view and serializer to build the schema, which takes tens
+    to hundreds of milliseconds. The schema only changes with the code, so it is built
+    once and kept in OPENAPI_SCHEMA_PATH, tagged with the code version in
+    `info.x-code-version`: CODE_VERSION when it is set (e.g. the commit deployed),
+    otherwise a hash of the project sources and of the versions of the libraries that
+    shape the schema. `python manage.py generate_schema` writes the file ahead of time,
+    e.g. when deploying; a worker that finds it missing or made for another version
+    generates it once and writes it for the others.
+
+    /docs/openapi.json serves the schema from memory with an ETag and Cache-Control, so
+    that browsers revalidate it with a 304. The swagger UI at /docs/ loads it from there
+    (SWAGGER_SETTINGS SPEC_URL), its own page is rendered without the endpoints, and
+    drf_yasg's /docs/?format=openapi is answered with the same schema.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import django
+import drf_yasg
+import rest_framework
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.views import UI_RENDERERS, get_schema_view
+from rest_framework import permissions
+
+# the packages whose code makes the schema
+SOURCES = ('Bugs', 'Utilities', 'bug')
+
+
+def info():
+    return openapi.Info(
+        title="Bugs API",
+        default_version='v1',
+        description="Bugs APIs and services",
+    )
+
+
+schema_view = get_schema_view(
+    info(),
+    public=True,
+    permission_classes=[permissions.AllowAny, ],
+)
+# the UI page alone: drf_yasg's spec renderers would generate the schema on every request
+swagger_ui_view = schema_view.as_cached_view(renderer_classes=UI_RENDERERS['swagger'])
+
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def source_version():
+    digest = hashlib.sha1(f'{django.__version__} {rest_framework.__version__} {drf_yasg.__version__}'.encode())
+    for package in SOURCES:
+        for path in sorted(Path(settings.BASE_DIR, package).rglob('*.py')):
+            digest.update(str(path.relative_to(settings.BASE_DIR)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def code_version():
+    return settings.CODE_VERSION or source_version()
+
+
+def generate(version):
+    """
+    :return: the schema of the public endpoints, as JSON
+    """
+    schema = OpenAPISchemaGenerator(info()).get_schema(request=None, public=True)
+    schema.info['x-code-version'] = version
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def read(path, version):
+    """
+    :return: the schema kept in the file, None when there is none for this version
+    """
+    try:
+        content = Path(path).read_bytes()
+        if json.loads(content)['info'].get('x-code-version') == version:
+            return content
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def write(path, content):
+    """
+        This replaces the file at once, so that other workers never read half of it
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, prefix='.openapi-', delete=False) as file:
+        file.write(content)
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+
+
+def get_schema():
+    """
+    :return: the schema for the current code version, as JSON, and its ETag
+    """
+    key = (settings.OPENAPI_SCHEMA_PATH, code_version())
+    schema = _schemas.get(key)
+    if schema is None:
+        with _schemas_lock:
+            schema = _schemas.get(key)
+            if schema is None:
+                path, version = key
+                content = read(path, version)
+                if content is None:
+                    content = generate(version)
+                    try:
+                        write(path, content)
+                    except OSError:
+                        # a read-only deployment keeps the schema in memory only
+                        pass
+                schema = _schemas[key] = (content, quote_etag(hashlib.sha1(content).hexdigest()))
+    return schema
+
+
+def swagger_ui(request):
+    if request.GET.get('format') == 'openapi':
+        return schema_json(request)
+    return swagger_ui_view(request)
+
+
+def schema_json(request):
+    content, etag = get_schema()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.OPENAPI_CACHE_SECONDS)
+    return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 
 from corsheaders.defaults import default_headers
@@ -35,6 +36,8 @@ ALLOWED_HOSTS = config('ALLOWED_HOSTS', cast=Csv())
 
 INSTALLED_APPS = [
     'django.contrib.admin',
+    # before django.contrib.auth, whose createsuperuser command it replaces
+    'Bugs',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -44,16 +47,17 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'drf_yasg',
-    'Bugs'
-
 ]
 
 MIDDLEWARE = [
+    # first, so that it also times the other middleware
+    'Utilities.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Utilities.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,13 +87,90 @@ WSGI_APPLICATION = 'bug.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# the database, from the environment. SQLite databases are served by the Utilities.sqlite
+# backend, which takes its connections from the pool of Utilities.pool
+DATABASE_ENGINE = config('DATABASE_ENGINE', default='Utilities.sqlite')
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': DATABASE_ENGINE,
+        'NAME': config('DATABASE_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        'USER': config('DATABASE_USER', default=''),
+        'PASSWORD': config('DATABASE_PASSWORD', default=''),
+        'HOST': config('DATABASE_HOST', default=''),
+        'PORT': config('DATABASE_PORT', default=''),
+        # seconds a connection is reused for, `none` for ever and 0 for a single request
+        'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', default='600',
+                               cast=lambda value: None if value.lower() == 'none' else int(value)),
     }
 }
 
+# connections per process and database in the pool (Utilities.pool), 0 to open one per
+# thread instead, and seconds a request waits for a connection when they are all taken
+DATABASE_POOL_SIZE = config('DATABASE_POOL_SIZE', default=8, cast=int)
+DATABASE_POOL_TIMEOUT = config('DATABASE_POOL_TIMEOUT', default=10.0, cast=float)
+# check that a pooled connection still works before it is reused
+DATABASE_HEALTH_CHECKS = config('DATABASE_HEALTH_CHECKS', default=True, cast=bool)
+
+# SQLite tuned for several worker processes: WAL, pragmas and BEGIN IMMEDIATE, see
+# Utilities.sqlite.base. The pragmas below can be tuned from the environment.
+SQLITE_PRODUCTION = config('SQLITE_PRODUCTION', default=False, cast=bool)
+if SQLITE_PRODUCTION and DATABASE_ENGINE == 'Utilities.sqlite':
+    DATABASES['default']['OPTIONS'] = {'production': True, 'pragmas': {
+        'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int),
+        'cache_size': config('SQLITE_CACHE_SIZE', default=-64000, cast=int),
+        'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+    }}
+
+# read replicas of the default database, comma separated SQLite files, see Utilities.replicas
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', default='', cast=Csv())
+for index, name in enumerate(DATABASE_REPLICAS, 1):
+    # no test database is created for a replica, run the tests without DATABASE_REPLICAS
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'NAME': name, 'TEST': {'MIRROR': 'default'}}
+REPLICA_DATABASES = [f'replica{index}' for index in range(1, len(DATABASE_REPLICAS) + 1)]
+
+DATABASE_ROUTERS = ['Utilities.replicas.ReplicaRouter']
+
+# seconds during which the reads of a user who wrote stay on the primary
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+# the caches are invalidated by whichever worker writes, so they are files shared by the
+# workers of a host by default; point the *_CACHE_BACKEND/LOCATION settings at memcached or
+# redis to share them between hosts
+CACHE_BACKEND = 'django.core.cache.backends.filebased.FileBasedCache'
+CACHE_DIR = Path(config('CACHE_DIR', default=str(Path(tempfile.gettempdir()) / 'bug-cache')))
+
+CACHES = {
+    # DRF throttles and the users version of Bugs.list_cache
+    'default': {
+        'BACKEND': config('DEFAULT_CACHE_BACKEND', default=CACHE_BACKEND),
+        'LOCATION': config('DEFAULT_CACHE_LOCATION', default=str(CACHE_DIR / 'default')),
+    },
+    # rendered bug list pages, see Bugs.list_cache
+    'bug_lists': {
+        'BACKEND': config('BUG_LIST_CACHE_BACKEND', default=CACHE_BACKEND),
+        'LOCATION': config('BUG_LIST_CACHE_LOCATION', default=str(CACHE_DIR / 'bug-lists')),
+        'TIMEOUT': config('BUG_LIST_CACHE_TTL', default=300, cast=int),
+    },
+    # users who just wrote and read from the primary, see Utilities.replicas
+    'replica_pins': {
+        'BACKEND': config('REPLICA_PIN_CACHE_BACKEND', default=CACHE_BACKEND),
+        'LOCATION': config('REPLICA_PIN_CACHE_LOCATION', default=str(CACHE_DIR / 'replica-pins')),
+    },
+    # authenticated tokens, see Utilities.authentication.CachedTokenAuthentication
+    'auth_tokens': {
+        'BACKEND': config('AUTH_TOKEN_CACHE_BACKEND', default=CACHE_BACKEND),
+        'LOCATION': config('AUTH_TOKEN_CACHE_LOCATION', default=str(CACHE_DIR / 'auth-tokens')),
+        'TIMEOUT': config('AUTH_TOKEN_CACHE_TTL', default=60, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('AUTH_TOKEN_CACHE_SIZE', default=10000, cast=int),
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -111,7 +192,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'Utilities.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'DEFAULT_RENDERER_CLASSES': [
@@ -123,6 +204,39 @@ REST_FRAMEWORK = {
     ],
 
 }
+# JSON encoder used by Utilities.api_response.CustomJSONRenderer: auto, orjson or json
+JSON_RENDERER_BACKEND = config('JSON_RENDERER_BACKEND', default='auto')
+
+# number of newest comments embedded in a bug's detail response
+BUG_DETAIL_COMMENTS_LIMIT = config('BUG_DETAIL_COMMENTS_LIMIT', default=20, cast=int)
+
+# largest number of bugs accepted by one bulk request
+BULK_MAX_ITEMS = config('BULK_MAX_ITEMS', default=500, cast=int)
+
+# passwords a process hashes at once on sign in, and sign-ins allowed to wait for their
+# turn before answering 503, see Utilities.passwords
+PASSWORD_HASH_WORKERS = config('PASSWORD_HASH_WORKERS', default=4, cast=int)
+PASSWORD_HASH_QUEUE = config('PASSWORD_HASH_QUEUE', default=32, cast=int)
+
+# whether signing in also logs into a session when the client does not say
+SIGNIN_SESSIONS = config('SIGNIN_SESSIONS', default=True, cast=bool)
+
+# changes returned by one /bugs/changes/ request, and days the change log is kept for
+CHANGES_PAGE_SIZE = config('CHANGES_PAGE_SIZE', default=500, cast=int)
+CHANGE_RETENTION_DAYS = config('CHANGE_RETENTION_DAYS', default=30, cast=int)
+
+# the event stream (Bugs.events): seconds between two reads of the change log, events
+# buffered per client before it is dropped, and seconds between two keep-alive lines
+SSE_POLL_INTERVAL = config('SSE_POLL_INTERVAL', default=1.0, cast=float)
+SSE_CLIENT_BUFFER = config('SSE_CLIENT_BUFFER', default=100, cast=int)
+SSE_HEARTBEAT = config('SSE_HEARTBEAT', default=15.0, cast=float)
+# seconds a stream token (?token=, for EventSource) can be used to open the stream for
+SSE_TOKEN_SECONDS = config('SSE_TOKEN_SECONDS', default=60, cast=int)
+
+# addresses allowed to read /metrics besides staff users, the Prometheus scraper's, see
+# Utilities.metrics. Behind a proxy, REMOTE_ADDR is the proxy's address
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1', cast=Csv())
+
 CORS_ALLOWED_ORIGINS = config('ALLOWED_ORIGINS', cast=Csv())
 CORS_ALLOW_HEADERS = list(default_headers)
 
@@ -135,9 +249,18 @@ SWAGGER_SETTINGS = {
             'in': 'header'
         }
     },
-    'USE_SESSION_AUTH': False
+    'USE_SESSION_AUTH': False,
+    # the schema generated once per code version, see bug.schema
+    'SPEC_URL': 'schema-json',
 }
 
+# the file the OpenAPI schema is kept in (git ignores the default), the code version it is
+# generated for (a hash of the sources by default) and the seconds clients may use it before
+# revalidating
+OPENAPI_SCHEMA_PATH = config('OPENAPI_SCHEMA_PATH', default=str(BASE_DIR / 'openapi.json'))
+CODE_VERSION = config('CODE_VERSION', default='')
+OPENAPI_CACHE_SECONDS = config('OPENAPI_CACHE_SECONDS', default=3600, cast=int)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
@@ -15,23 +15,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Bugs API",
-        default_version='v1',
-        description="Bugs APIs and services",
-    ),
-    public=True,
-    permission_classes=[permissions.AllowAny, ],
-)
+from bug import schema
+from Utilities import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics.metrics_view, name='metrics'),
     path('', include('Bugs.urls')),
-    path('docs/', schema_view.with_ui(
-        'swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('docs/openapi.json', schema.schema_json, name='schema-json'),
+    path('docs/', schema.swagger_ui, name='schema-swagger-ui'),
 ]